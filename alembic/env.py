@@ -1,10 +1,12 @@
+import logging
 from logging.config import fileConfig
 
-from sqlalchemy import engine_from_config
-from sqlalchemy import pool
-
 from alembic import context
 
+from db import load_config, make_engine
+from db.migrations import CHECKPOINT_TABLE, REBUILD_PREFIX
+from db.shards import load_shards, shard_url
+
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
 config = context.config
@@ -22,11 +24,33 @@ from models import Base
 target_metadata = Base.metadata
 
 
+# The FTS5 search index (properties_fts and its shadow tables) is managed by hand in
+# its own revision, and the online migration helpers (db/migrations.py) keep their own
+# checkpoint table and table copies; keep autogenerate from proposing to drop them.
+def include_object(object, name, type_, reflected, compare_to):
+    if type_ == "table" and name.startswith(("properties_fts", CHECKPOINT_TABLE, REBUILD_PREFIX)):
+        return False
+    return True
+
+
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
 # my_important_option = config.get_main_option("my_important_option")
 # ... etc.
 
+logger = logging.getLogger("alembic.env")
+
+
+# The databases to migrate as {region: url}: every regional shard (db/shards.py), or
+# the one chosen with `alembic -x region=NAME ...`. Without shards, the single
+# database of the configuration ({None: url}).
+def target_databases(db_config):
+    shards = load_shards()
+    region = context.get_x_argument(as_dictionary=True).get("region")
+    if region is not None:
+        return {region: shard_url(shards, region)}
+    return shards or {None: db_config.url}
+
 
 def run_migrations_offline() -> None:
     """Run migrations in 'offline' mode.
@@ -40,16 +64,28 @@ def run_migrations_offline() -> None:
     script output.
 
     """
-    url = config.get_main_option("sqlalchemy.url")
-    context.configure(
-        url=url,
-        target_metadata=target_metadata,
-        literal_binds=True,
-        dialect_opts={"paramstyle": "named"},
-    )
-
-    with context.begin_transaction():
-        context.run_migrations()
+    db_config = load_config(default_url=config.get_main_option("sqlalchemy.url"))
+    for region, url in target_databases(db_config).items():
+        options = {}
+        if region is not None:
+            # One script per shard, as in Alembic's multidb template
+            options["output_buffer"] = open(f"{region}.sql", "w")
+            logger.info("Writing the SQL for shard %s (%s) to %s.sql", region, url, region)
+        try:
+            context.configure(
+                url=url,
+                target_metadata=target_metadata,
+                literal_binds=True,
+                dialect_opts={"paramstyle": "named"},
+                include_object=include_object,
+                **options,
+            )
+
+            with context.begin_transaction():
+                context.run_migrations()
+        finally:
+            if options:
+                options["output_buffer"].close()
 
 
 def run_migrations_online() -> None:
@@ -59,19 +95,27 @@ def run_migrations_online() -> None:
     and associate a connection with the context.
 
     """
-    connectable = engine_from_config(
-        config.get_section(config.config_ini_section, {}),
-        prefix="sqlalchemy.",
-        poolclass=pool.NullPool,
-    )
-
-    with connectable.connect() as connection:
-        context.configure(
-            connection=connection, target_metadata=target_metadata
-        )
-
-        with context.begin_transaction():
-            context.run_migrations()
+    # Same engine factory as the CLI, so REALESTATE_DB_URL / realestate.ini point
+    # migrations at the same database; alembic.ini's url is only the fallback.
+    # With shards configured, every shard is migrated in turn.
+    db_config = load_config(default_url=config.get_main_option("sqlalchemy.url"))
+    for region, url in target_databases(db_config).items():
+        if region is not None:
+            logger.info("Migrating shard %s (%s)", region, url)
+        connectable = make_engine(url, config=db_config, profile="bulk-load")
+
+        try:
+            with connectable.connect() as connection:
+                context.configure(
+                    connection=connection,
+                    target_metadata=target_metadata,
+                    include_object=include_object,
+                )
+
+                with context.begin_transaction():
+                    context.run_migrations()
+        finally:
+            connectable.dispose()
 
 
 if context.is_offline_mode():
@@ -0,0 +1,50 @@
+"""Add property name full-text search
+
+Revision ID: 27fe78924786
+Revises: c610afb5aab3
+Create Date: 2026-10-18 10:03:17.551920
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '27fe78924786'
+down_revision: Union[str, None] = 'c610afb5aab3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # FTS5 index over properties.name, stored as an external-content table
+    op.execute(
+        "CREATE VIRTUAL TABLE properties_fts USING fts5("
+        "name, content='properties', content_rowid='id', "
+        "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+    )
+    # Triggers keep the index in sync with the properties table
+    op.execute(
+        "CREATE TRIGGER properties_fts_ai AFTER INSERT ON properties BEGIN "
+        "INSERT INTO properties_fts(rowid, name) VALUES (new.id, new.name); END"
+    )
+    op.execute(
+        "CREATE TRIGGER properties_fts_ad AFTER DELETE ON properties BEGIN "
+        "INSERT INTO properties_fts(properties_fts, rowid, name) VALUES ('delete', old.id, old.name); END"
+    )
+    op.execute(
+        "CREATE TRIGGER properties_fts_au AFTER UPDATE OF name ON properties BEGIN "
+        "INSERT INTO properties_fts(properties_fts, rowid, name) VALUES ('delete', old.id, old.name); "
+        "INSERT INTO properties_fts(rowid, name) VALUES (new.id, new.name); END"
+    )
+    # Index the properties that already exist
+    op.execute("INSERT INTO properties_fts(properties_fts) VALUES ('rebuild')")
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER IF EXISTS properties_fts_au")
+    op.execute("DROP TRIGGER IF EXISTS properties_fts_ad")
+    op.execute("DROP TRIGGER IF EXISTS properties_fts_ai")
+    op.execute("DROP TABLE IF EXISTS properties_fts")
@@ -0,0 +1,48 @@
+"""Add the interest change counter
+
+Revision ID: 3b7f9d1c6e28
+Revises: 8c4d2e6f1a57
+Create Date: 2026-10-18 16:41:07.318245
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3b7f9d1c6e28'
+down_revision: Union[str, None] = '8c4d2e6f1a57'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Listing snapshots (services/snapshot.py) compare it with the value they were written at
+    op.execute("INSERT INTO table_versions (table_name, version) VALUES ('buyer_property_association', 0)")
+    # Triggers bump it (frozen here: later changes need a new revision)
+    op.execute(
+        "CREATE TRIGGER table_versions_interests_ai AFTER INSERT ON buyer_property_association "
+        "BEGIN INSERT INTO table_versions (table_name, version) VALUES "
+        "('buyer_property_association', 1) ON CONFLICT(table_name) DO UPDATE SET version = version "
+        "+ 1; END"
+    )
+    op.execute(
+        "CREATE TRIGGER table_versions_interests_ad AFTER DELETE ON buyer_property_association "
+        "BEGIN INSERT INTO table_versions (table_name, version) VALUES "
+        "('buyer_property_association', 1) ON CONFLICT(table_name) DO UPDATE SET version = version "
+        "+ 1; END"
+    )
+    op.execute(
+        "CREATE TRIGGER table_versions_interests_au AFTER UPDATE ON buyer_property_association "
+        "BEGIN INSERT INTO table_versions (table_name, version) VALUES "
+        "('buyer_property_association', 1) ON CONFLICT(table_name) DO UPDATE SET version = version "
+        "+ 1; END"
+    )
+
+
+def downgrade() -> None:
+    for trigger in ('table_versions_interests_au', 'table_versions_interests_ad', 'table_versions_interests_ai'):
+        op.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    op.execute("DELETE FROM table_versions WHERE table_name = 'buyer_property_association'")
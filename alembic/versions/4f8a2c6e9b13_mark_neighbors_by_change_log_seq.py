@@ -0,0 +1,54 @@
+"""Keep the neighbour table's interest mark as a change log sequence number
+
+Revision ID: 4f8a2c6e9b13
+Revises: 9a3e5c7d1b42
+Create Date: 2026-10-18 19:42:37.915204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4f8a2c6e9b13'
+down_revision: Union[str, None] = '9a3e5c7d1b42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # The mark was a buyer_property_association rowid, which VACUUM may renumber (the
+    # table has no INTEGER PRIMARY KEY) and deleting the last row lets be reused. It
+    # becomes the sequence number before the change log entry of the first interest
+    # past it. Interests recorded before the log existed have no entry: the state is
+    # then dropped, and recommendations are counted live until `recommendations rebuild`.
+    connection = op.get_bind()
+    mark = connection.scalar(sa.text("SELECT interest_mark FROM property_neighbors_state WHERE id = 1"))
+    if mark is None:
+        return
+    pending = {
+        f"{buyer_id}:{property_id}" for buyer_id, property_id in connection.execute(
+            sa.text("SELECT buyer_id, property_id FROM buyer_property_association WHERE rowid > :mark"), {'mark': mark},
+        )
+    }
+    if pending:
+        logged = connection.execute(sa.text(
+            "SELECT row_key, min(seq) FROM change_log "
+            "WHERE table_name = 'buyer_property_association' AND operation = 'insert' GROUP BY row_key"
+        ))
+        first = [seq for row_key, seq in logged if row_key in pending]
+        if len(first) < len(pending):
+            connection.execute(sa.text("DELETE FROM property_neighbors_state"))
+            return
+        mark = min(first) - 1
+    else:
+        mark = connection.scalar(sa.text("SELECT seq FROM sqlite_sequence WHERE name = 'change_log'")) or 0
+    connection.execute(sa.text("UPDATE property_neighbors_state SET interest_mark = :mark"), {'mark': mark})
+
+
+def downgrade() -> None:
+    # A sequence number does not map back to a rowid: the neighbour table is counted
+    # live again until `recommendations rebuild`
+    op.execute("DELETE FROM property_neighbors_state")
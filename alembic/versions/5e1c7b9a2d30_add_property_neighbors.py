@@ -0,0 +1,42 @@
+"""Add property neighbours for recommendations
+
+Revision ID: 5e1c7b9a2d30
+Revises: a40f6e4ddff4
+Create Date: 2026-10-18 13:12:44.208517
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e1c7b9a2d30'
+down_revision: Union[str, None] = 'a40f6e4ddff4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Filled by `cli/main.py recommendations rebuild`; until then recommendations are counted live
+    op.create_table('property_neighbors',
+    sa.Column('property_id', sa.Integer(), nullable=False),
+    sa.Column('neighbor_id', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['neighbor_id'], ['properties.id'], ),
+    sa.ForeignKeyConstraint(['property_id'], ['properties.id'], ),
+    sa.PrimaryKeyConstraint('property_id', 'neighbor_id'),
+    sqlite_with_rowid=False
+    )
+    op.create_table('property_neighbors_state',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('k', sa.Integer(), nullable=False),
+    sa.Column('interest_mark', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('property_neighbors_state')
+    op.drop_table('property_neighbors')
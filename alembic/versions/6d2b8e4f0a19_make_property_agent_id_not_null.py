@@ -0,0 +1,34 @@
+"""Make properties.agent_id NOT NULL
+
+Revision ID: 6d2b8e4f0a19
+Revises: 3b7f9d1c6e28
+Create Date: 2026-10-18 17:20:54.102736
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from db.migrations import MigrationError, rebuild_table
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6d2b8e4f0a19'
+down_revision: Union[str, None] = '3b7f9d1c6e28'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # SQLite can only add NOT NULL by rebuilding the table (the alter_column left out of
+    # 992d9307ca14). The rows are copied in short chunks, so the database stays usable,
+    # and an interrupted upgrade resumes where it stopped.
+    orphans = op.get_bind().scalar(sa.text("SELECT count(*) FROM properties WHERE agent_id IS NULL"))
+    if orphans:
+        raise MigrationError(f"{orphans} properties have no agent; assign them one before upgrading")
+    rebuild_table(op, 'properties', alter_columns={'agent_id': {'nullable': False}})
+
+
+def downgrade() -> None:
+    rebuild_table(op, 'properties', alter_columns={'agent_id': {'nullable': True}})
@@ -0,0 +1,58 @@
+"""Add table change counters and the price statistics cache
+
+Revision ID: 8c4d2e6f1a57
+Revises: 5e1c7b9a2d30
+Create Date: 2026-10-18 15:02:31.640129
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8c4d2e6f1a57'
+down_revision: Union[str, None] = '5e1c7b9a2d30'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('table_versions',
+    sa.Column('table_name', sa.String(), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('table_name')
+    )
+    op.execute("INSERT INTO table_versions (table_name, version) VALUES ('properties', 0)")
+    op.create_table('price_stats_cache',
+    sa.Column('cache_key', sa.String(), nullable=False),
+    sa.Column('data_version', sa.Integer(), nullable=False),
+    sa.Column('computed_at', sa.DateTime(), nullable=False),
+    sa.Column('result', sa.Text(), nullable=False),
+    sa.PrimaryKeyConstraint('cache_key')
+    )
+
+    # Triggers bump the properties counter (frozen here: later changes need a new revision)
+    op.execute(
+        "CREATE TRIGGER table_versions_properties_ai AFTER INSERT ON properties "
+        "BEGIN INSERT INTO table_versions (table_name, version) VALUES ('properties', 1) ON "
+        "CONFLICT(table_name) DO UPDATE SET version = version + 1; END"
+    )
+    op.execute(
+        "CREATE TRIGGER table_versions_properties_ad AFTER DELETE ON properties "
+        "BEGIN INSERT INTO table_versions (table_name, version) VALUES ('properties', 1) ON "
+        "CONFLICT(table_name) DO UPDATE SET version = version + 1; END"
+    )
+    op.execute(
+        "CREATE TRIGGER table_versions_properties_au AFTER UPDATE OF price, agent_id ON properties "
+        "BEGIN INSERT INTO table_versions (table_name, version) VALUES ('properties', 1) ON "
+        "CONFLICT(table_name) DO UPDATE SET version = version + 1; END"
+    )
+
+
+def downgrade() -> None:
+    for trigger in ('table_versions_properties_au', 'table_versions_properties_ad', 'table_versions_properties_ai'):
+        op.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    op.drop_table('price_stats_cache')
+    op.drop_table('table_versions')
@@ -27,6 +27,8 @@ def upgrade() -> None:
     sa.ForeignKeyConstraint(['property_id'], ['properties.id'], ),
     sa.PrimaryKeyConstraint('buyer_id', 'property_id')
     )
+    # SQLite cannot alter a column in place: agent_id is made NOT NULL by the chunked
+    # table rebuild of revision 6d2b8e4f0a19 instead
     # op.alter_column('properties', 'agent_id',
     #            existing_type=sa.INTEGER(),
     #            nullable=False)
@@ -35,8 +37,5 @@ def upgrade() -> None:
 
 def downgrade() -> None:
     # ### commands auto generated by Alembic - please adjust! ###
-    op.alter_column('properties', 'agent_id',
-               existing_type=sa.INTEGER(),
-               nullable=True)
     op.drop_table('buyer_property_association')
     # ### end Alembic commands ###
@@ -0,0 +1,145 @@
+"""Add the change log for read replicas
+
+Revision ID: 9a3e5c7d1b42
+Revises: 6d2b8e4f0a19
+Create Date: 2026-10-18 18:05:12.447390
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9a3e5c7d1b42'
+down_revision: Union[str, None] = '6d2b8e4f0a19'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('change_log',
+    sa.Column('seq', sa.Integer(), nullable=False),
+    sa.Column('table_name', sa.String(), nullable=False),
+    sa.Column('operation', sa.String(), nullable=False),
+    sa.Column('row_key', sa.String(), nullable=False),
+    sa.Column('changed_at', sa.String(), nullable=False),
+    sa.PrimaryKeyConstraint('seq'),
+    sqlite_autoincrement=True
+    )
+    op.create_table('change_log_state',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('compacted_through', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('replica_state',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('source', sa.String(), nullable=False),
+    sa.Column('position', sa.Integer(), nullable=False),
+    sa.Column('synced_at', sa.String(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+    # Changes are logged from here on; replicas are seeded with a copy made afterwards
+    # (frozen here: later changes need a new revision)
+    op.execute(
+        "CREATE TRIGGER change_log_agents_ai AFTER INSERT ON agents "
+        "BEGIN INSERT INTO change_log (table_name, operation, row_key, changed_at) SELECT 'agents', "
+        "'insert', CAST(new.id AS TEXT), datetime('now'); END"
+    )
+    op.execute(
+        "CREATE TRIGGER change_log_agents_au AFTER UPDATE ON agents "
+        "BEGIN INSERT INTO change_log (table_name, operation, row_key, changed_at) SELECT 'agents', "
+        "'update', CAST(new.id AS TEXT), datetime('now'); "
+        "INSERT INTO change_log (table_name, operation, row_key, changed_at) SELECT 'agents', "
+        "'delete', CAST(old.id AS TEXT), datetime('now') WHERE CAST(old.id AS TEXT) IS NOT "
+        "CAST(new.id AS TEXT); END"
+    )
+    op.execute(
+        "CREATE TRIGGER change_log_agents_ad AFTER DELETE ON agents "
+        "BEGIN INSERT INTO change_log (table_name, operation, row_key, changed_at) SELECT 'agents', "
+        "'delete', CAST(old.id AS TEXT), datetime('now'); END"
+    )
+    op.execute(
+        "CREATE TRIGGER change_log_properties_ai AFTER INSERT ON properties "
+        "BEGIN INSERT INTO change_log (table_name, operation, row_key, changed_at) SELECT "
+        "'properties', 'insert', CAST(new.id AS TEXT), datetime('now'); END"
+    )
+    op.execute(
+        "CREATE TRIGGER change_log_properties_au AFTER UPDATE ON properties "
+        "BEGIN INSERT INTO change_log (table_name, operation, row_key, changed_at) SELECT "
+        "'properties', 'update', CAST(new.id AS TEXT), datetime('now'); "
+        "INSERT INTO change_log (table_name, operation, row_key, changed_at) SELECT 'properties', "
+        "'delete', CAST(old.id AS TEXT), datetime('now') WHERE CAST(old.id AS TEXT) IS NOT "
+        "CAST(new.id AS TEXT); END"
+    )
+    op.execute(
+        "CREATE TRIGGER change_log_properties_ad AFTER DELETE ON properties "
+        "BEGIN INSERT INTO change_log (table_name, operation, row_key, changed_at) SELECT "
+        "'properties', 'delete', CAST(old.id AS TEXT), datetime('now'); END"
+    )
+    op.execute(
+        "CREATE TRIGGER change_log_buyers_ai AFTER INSERT ON buyers "
+        "BEGIN INSERT INTO change_log (table_name, operation, row_key, changed_at) SELECT 'buyers', "
+        "'insert', CAST(new.id AS TEXT), datetime('now'); END"
+    )
+    op.execute(
+        "CREATE TRIGGER change_log_buyers_au AFTER UPDATE ON buyers "
+        "BEGIN INSERT INTO change_log (table_name, operation, row_key, changed_at) SELECT 'buyers', "
+        "'update', CAST(new.id AS TEXT), datetime('now'); "
+        "INSERT INTO change_log (table_name, operation, row_key, changed_at) SELECT 'buyers', "
+        "'delete', CAST(old.id AS TEXT), datetime('now') WHERE CAST(old.id AS TEXT) IS NOT "
+        "CAST(new.id AS TEXT); END"
+    )
+    op.execute(
+        "CREATE TRIGGER change_log_buyers_ad AFTER DELETE ON buyers "
+        "BEGIN INSERT INTO change_log (table_name, operation, row_key, changed_at) SELECT 'buyers', "
+        "'delete', CAST(old.id AS TEXT), datetime('now'); END"
+    )
+    op.execute(
+        "CREATE TRIGGER change_log_buyer_property_association_ai AFTER INSERT ON "
+        "buyer_property_association "
+        "BEGIN INSERT INTO change_log (table_name, operation, row_key, changed_at) SELECT "
+        "'buyer_property_association', 'insert', new.buyer_id || ':' || new.property_id, "
+        "datetime('now'); END"
+    )
+    op.execute(
+        "CREATE TRIGGER change_log_buyer_property_association_au AFTER UPDATE ON "
+        "buyer_property_association "
+        "BEGIN INSERT INTO change_log (table_name, operation, row_key, changed_at) SELECT "
+        "'buyer_property_association', 'update', new.buyer_id || ':' || new.property_id, "
+        "datetime('now'); "
+        "INSERT INTO change_log (table_name, operation, row_key, changed_at) SELECT "
+        "'buyer_property_association', 'delete', old.buyer_id || ':' || old.property_id, "
+        "datetime('now') WHERE old.buyer_id || ':' || old.property_id IS NOT new.buyer_id || ':' || "
+        "new.property_id; END"
+    )
+    op.execute(
+        "CREATE TRIGGER change_log_buyer_property_association_ad AFTER DELETE ON "
+        "buyer_property_association "
+        "BEGIN INSERT INTO change_log (table_name, operation, row_key, changed_at) SELECT "
+        "'buyer_property_association', 'delete', old.buyer_id || ':' || old.property_id, "
+        "datetime('now'); END"
+    )
+
+
+def downgrade() -> None:
+    for trigger in (
+        'change_log_buyer_property_association_ad',
+        'change_log_buyer_property_association_au',
+        'change_log_buyer_property_association_ai',
+        'change_log_buyers_ad',
+        'change_log_buyers_au',
+        'change_log_buyers_ai',
+        'change_log_properties_ad',
+        'change_log_properties_au',
+        'change_log_properties_ai',
+        'change_log_agents_ad',
+        'change_log_agents_au',
+        'change_log_agents_ai',
+    ):
+        op.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    op.drop_table('replica_state')
+    op.drop_table('change_log_state')
+    op.drop_table('change_log')
@@ -0,0 +1,111 @@
+"""Add agent portfolio summary
+
+Revision ID: a40f6e4ddff4
+Revises: 27fe78924786
+Create Date: 2026-10-18 11:26:05.730418
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a40f6e4ddff4'
+down_revision: Union[str, None] = '27fe78924786'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # (agent_id, price) replaces the agent_id index: it serves the same lookups and
+    # gives the triggers an agent's min/max price without a scan
+    op.create_index('ix_properties_agent_id_price', 'properties', ['agent_id', 'price'], unique=False)
+    op.drop_index('ix_properties_agent_id', table_name='properties')
+
+    op.create_table('agent_portfolio_summary',
+    sa.Column('agent_id', sa.Integer(), nullable=False),
+    sa.Column('listing_count', sa.Integer(), nullable=False),
+    sa.Column('total_price', sa.Integer(), nullable=False),
+    sa.Column('min_price', sa.Integer(), nullable=True),
+    sa.Column('max_price', sa.Integer(), nullable=True),
+    sa.Column('interested_buyers', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['agent_id'], ['agents.id'], ),
+    sa.PrimaryKeyConstraint('agent_id')
+    )
+
+    # Backfill from the existing listings and interests
+    op.execute(
+        "INSERT INTO agent_portfolio_summary "
+        "(agent_id, listing_count, total_price, min_price, max_price, interested_buyers) "
+        "SELECT p.agent_id, count(*), sum(p.price), min(p.price), max(p.price), "
+        "(SELECT count(DISTINCT b.buyer_id) FROM buyer_property_association b "
+        "JOIN properties p2 ON p2.id = b.property_id WHERE p2.agent_id = p.agent_id) "
+        "FROM properties p WHERE p.agent_id IS NOT NULL GROUP BY p.agent_id"
+    )
+
+    # Triggers keep the summary current (frozen here: later changes need a new revision)
+    op.execute(
+        "CREATE TRIGGER agent_portfolio_property_ai AFTER INSERT ON properties "
+        "BEGIN INSERT INTO agent_portfolio_summary (agent_id, listing_count, total_price, "
+        "min_price, max_price, interested_buyers) SELECT new.agent_id, 1, new.price, new.price, "
+        "new.price, 0 WHERE new.agent_id IS NOT NULL ON CONFLICT(agent_id) DO UPDATE SET "
+        "listing_count = listing_count + 1, total_price = total_price + excluded.total_price, "
+        "min_price = min(coalesce(min_price, excluded.min_price), excluded.min_price), max_price = "
+        "max(coalesce(max_price, excluded.max_price), excluded.max_price); END"
+    )
+    op.execute(
+        "CREATE TRIGGER agent_portfolio_property_ad AFTER DELETE ON properties "
+        "WHEN old.agent_id IS NOT NULL "
+        "BEGIN UPDATE agent_portfolio_summary SET listing_count = listing_count - 1, total_price = "
+        "total_price - old.price, min_price = (SELECT min(price) FROM properties WHERE agent_id = "
+        "old.agent_id), max_price = (SELECT max(price) FROM properties WHERE agent_id = "
+        "old.agent_id), interested_buyers = (SELECT count(DISTINCT b.buyer_id) FROM "
+        "buyer_property_association b JOIN properties p ON p.id = b.property_id WHERE p.agent_id = "
+        "old.agent_id) WHERE agent_id = old.agent_id; END"
+    )
+    op.execute(
+        "CREATE TRIGGER agent_portfolio_property_au AFTER UPDATE OF price, agent_id ON properties "
+        "BEGIN UPDATE agent_portfolio_summary SET listing_count = listing_count - 1, total_price = "
+        "total_price - old.price, min_price = (SELECT min(price) FROM properties WHERE agent_id = "
+        "old.agent_id), max_price = (SELECT max(price) FROM properties WHERE agent_id = "
+        "old.agent_id), interested_buyers = (SELECT count(DISTINCT b.buyer_id) FROM "
+        "buyer_property_association b JOIN properties p ON p.id = b.property_id WHERE p.agent_id = "
+        "old.agent_id) WHERE agent_id = old.agent_id; "
+        "INSERT INTO agent_portfolio_summary (agent_id, listing_count, total_price, min_price, "
+        "max_price, interested_buyers) SELECT new.agent_id, 1, new.price, new.price, new.price, 0 "
+        "WHERE new.agent_id IS NOT NULL ON CONFLICT(agent_id) DO UPDATE SET listing_count = "
+        "listing_count + 1, total_price = total_price + excluded.total_price, min_price = "
+        "min(coalesce(min_price, excluded.min_price), excluded.min_price), max_price = "
+        "max(coalesce(max_price, excluded.max_price), excluded.max_price); "
+        "UPDATE agent_portfolio_summary SET interested_buyers = (SELECT count(DISTINCT b.buyer_id) "
+        "FROM buyer_property_association b JOIN properties p ON p.id = b.property_id WHERE "
+        "p.agent_id = new.agent_id) WHERE agent_id = new.agent_id AND new.agent_id IS NOT "
+        "old.agent_id; END"
+    )
+    op.execute(
+        "CREATE TRIGGER agent_portfolio_interest_ai AFTER INSERT ON buyer_property_association "
+        "BEGIN UPDATE agent_portfolio_summary SET interested_buyers = interested_buyers + 1 WHERE "
+        "agent_id = (SELECT agent_id FROM properties WHERE id = new.property_id) AND NOT EXISTS "
+        "(SELECT 1 FROM buyer_property_association b JOIN properties p ON p.id = b.property_id "
+        "WHERE b.buyer_id = new.buyer_id AND b.property_id != new.property_id AND p.agent_id = "
+        "(SELECT agent_id FROM properties WHERE id = new.property_id)); END"
+    )
+    op.execute(
+        "CREATE TRIGGER agent_portfolio_interest_ad AFTER DELETE ON buyer_property_association "
+        "BEGIN UPDATE agent_portfolio_summary SET interested_buyers = interested_buyers - 1 WHERE "
+        "agent_id = (SELECT agent_id FROM properties WHERE id = old.property_id) AND NOT EXISTS "
+        "(SELECT 1 FROM buyer_property_association b JOIN properties p ON p.id = b.property_id "
+        "WHERE b.buyer_id = old.buyer_id AND b.property_id != old.property_id AND p.agent_id = "
+        "(SELECT agent_id FROM properties WHERE id = old.property_id)); END"
+    )
+
+
+def downgrade() -> None:
+    for trigger in ('agent_portfolio_interest_ad', 'agent_portfolio_interest_ai', 'agent_portfolio_property_au',
+                    'agent_portfolio_property_ad', 'agent_portfolio_property_ai'):
+        op.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    op.drop_table('agent_portfolio_summary')
+    op.create_index('ix_properties_agent_id', 'properties', ['agent_id'], unique=False)
+    op.drop_index('ix_properties_agent_id_price', table_name='properties')
@@ -0,0 +1,49 @@
+"""Add secondary indexes
+
+Revision ID: c610afb5aab3
+Revises: 992d9307ca14
+Create Date: 2026-10-18 09:12:41.208113
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from db.migrations import MigrationError
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c610afb5aab3'
+down_revision: Union[str, None] = '992d9307ca14'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # The unique index below fails on buyers whose emails differ only in case or
+    # whitespace, which earlier versions accepted. Checked before any index is created:
+    # SQLite migrations are not rolled back on failure.
+    duplicates = op.get_bind().execute(sa.text(
+        "SELECT lower(trim(email)), group_concat(id, ', ') FROM buyers "
+        "GROUP BY lower(trim(email)) HAVING count(*) > 1 ORDER BY min(id)"
+    )).all()
+    if duplicates:
+        shown = '; '.join(f"{email!r}: buyers {ids}" for email, ids in duplicates[:5])
+        more = f" and {len(duplicates) - 5} more" if len(duplicates) > 5 else ""
+        raise MigrationError(
+            f"Buyers share an email (ignoring case and surrounding spaces): {shown}{more}; "
+            "merge or correct them before upgrading"
+        )
+    op.create_index('ix_properties_agent_id', 'properties', ['agent_id'], unique=False)
+    op.create_index('ix_properties_price', 'properties', ['price'], unique=False)
+    op.create_index('ix_buyer_property_association_property_id', 'buyer_property_association', ['property_id'], unique=False)
+    # Expression index: the same email typed with different case/whitespace is a duplicate
+    op.create_index('ux_buyers_email_normalized', 'buyers', [sa.text('lower(trim(email))')], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index('ux_buyers_email_normalized', table_name='buyers')
+    op.drop_index('ix_buyer_property_association_property_id', table_name='buyer_property_association')
+    op.drop_index('ix_properties_price', table_name='properties')
+    op.drop_index('ix_properties_agent_id', table_name='properties')
@@ -0,0 +1,2 @@
+# Local HTTP/JSON API over the asyncio service layer (services/async_service.py).
+# Run it with `python -m api.server` or `python cli/main.py serve`.
@@ -0,0 +1,285 @@
+# Local HTTP/JSON server exposing the CLI operations to concurrent clients.
+#
+# A small HTTP/1.1 server on asyncio streams (keep-alive, JSON bodies), so it adds
+# no web framework dependency. Each request is handled by the asyncio service layer
+# (services/async_service.py): reads run concurrently, writes go through its single
+# batching writer task.
+#
+#   GET  /agents?after_id=&limit=              GET  /agents/{id}
+#   POST /agents {"name", "phone"}             GET  /agents/portfolio?sort=&limit=&agent_id=&live=
+#   GET  /properties?after_id=&limit=          GET  /properties/{id}
+#   POST /properties {"name", "price", "agent_id"}
+#   GET  /properties/search?text=&min_price=&max_price=&agent_id=&sort=&limit=
+#   GET  /buyers?after_id=&limit=              GET  /buyers/{id}
+#   POST /buyers {"name", "email"}             GET  /buyers/{id}/interests
+#   POST /interests {"buyer_id", "property_id"}
+#   GET  /stats                                (table sizes and writer batching)
+#
+# Usage:
+#   python -m api.server --db sqlite:///real_estate.db --port 8080
+#   python cli/main.py serve --port 8080
+import argparse
+import asyncio
+import json
+import re
+import sys
+from urllib.parse import urlsplit, parse_qs
+
+from services.async_service import AsyncRealEstateService
+from services.records import RecordError
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8080
+
+# Largest request body accepted, in bytes
+MAX_BODY = 1 << 20
+
+REASONS = {
+    200: 'OK', 201: 'Created', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+    413: 'Payload Too Large', 500: 'Internal Server Error',
+}
+
+
+# An error answered with `status` and a JSON {"error": message} body
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+# Request parameter helpers: query strings and JSON bodies both arrive as strings or numbers
+def _int(params, name, default=None, required=False):
+    value = params.get(name)
+    if value in (None, ''):
+        if required:
+            raise HTTPError(400, f"Missing parameter: {name}")
+        return default
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise HTTPError(400, f"Parameter {name} must be an integer")
+
+
+def _str(params, name):
+    value = params.get(name)
+    if not isinstance(value, str):
+        raise HTTPError(400, f"Missing parameter: {name}")
+    return value
+
+
+def _flag(params, name):
+    return str(params.get(name, '')).lower() in ('1', 'true', 'yes')
+
+
+class RealEstateAPI:
+    def __init__(self, service):
+        self.service = service
+        # (method, path pattern, handler); the pattern's groups are passed as integers
+        self.routes = [
+            ('GET', r'/agents/portfolio', self.agent_portfolio),
+            ('GET', r'/properties/search', self.property_search),
+            ('GET', r'/buyers/(\d+)/interests', self.buyer_interests),
+            ('GET', r'/(agents|properties|buyers)', self.list_entity),
+            ('GET', r'/(agents|properties|buyers)/(\d+)', self.get_entity),
+            ('POST', r'/agents', self.agent_add),
+            ('POST', r'/properties', self.property_add),
+            ('POST', r'/buyers', self.buyer_add),
+            ('POST', r'/interests', self.interest_add),
+            ('GET', r'/stats', self.stats),
+        ]
+        self.routes = [(method, re.compile(pattern + '$'), handler) for method, pattern, handler in self.routes]
+
+    # Find the handler for a request and run it. Returns (status, JSON-able body).
+    async def dispatch(self, method, target, body):
+        url = urlsplit(target)
+        allowed = False
+        for route_method, pattern, handler in self.routes:
+            match = pattern.match(url.path)
+            if not match:
+                continue
+            allowed = True
+            if route_method != method:
+                continue
+            params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            if method == 'POST':
+                params = self._json_body(body)
+            args = [int(group) if group.isdigit() else group for group in match.groups()]
+            return await handler(params, *args)
+        if allowed:
+            raise HTTPError(405, f"{method} not allowed on {url.path}")
+        raise HTTPError(404, f"No such endpoint: {url.path}")
+
+    @staticmethod
+    def _json_body(body):
+        try:
+            params = json.loads(body or b'{}')
+        except ValueError:
+            raise HTTPError(400, "Request body must be JSON")
+        if not isinstance(params, dict):
+            raise HTTPError(400, "Request body must be a JSON object")
+        return params
+
+    async def list_entity(self, params, entity):
+        return 200, await self.service.list_entity(entity, _int(params, 'after_id'), _int(params, 'limit', 50))
+
+    async def get_entity(self, params, entity, entity_id):
+        record = await self.service.get_entity(entity, entity_id)
+        if record is None:
+            raise HTTPError(404, f"No {entity} row with id {entity_id}")
+        return 200, record
+
+    async def agent_portfolio(self, params):
+        rows = await self.service.portfolio(
+            _flag(params, 'live'), _int(params, 'agent_id'), params.get('sort', 'value'), _int(params, 'limit'),
+        )
+        return 200, rows
+
+    async def property_search(self, params):
+        rows = await self.service.search(
+            params.get('text'), _int(params, 'min_price'), _int(params, 'max_price'),
+            _int(params, 'agent_id'), params.get('sort'), _int(params, 'limit', 20),
+        )
+        return 200, rows
+
+    async def buyer_interests(self, params, buyer_id):
+        rows = await self.service.buyer_interests(buyer_id)
+        if rows is None:
+            raise HTTPError(404, "No buyer found with the given ID.")
+        return 200, rows
+
+    async def agent_add(self, params):
+        return 201, await self.service.create_agent(_str(params, 'name'), _str(params, 'phone'))
+
+    async def property_add(self, params):
+        return 201, await self.service.create_property(
+            _str(params, 'name'), _int(params, 'price', required=True), _int(params, 'agent_id', required=True),
+        )
+
+    async def buyer_add(self, params):
+        return 201, await self.service.create_buyer(_str(params, 'name'), _str(params, 'email'))
+
+    async def interest_add(self, params):
+        return 201, await self.service.record_interest(
+            _int(params, 'buyer_id', required=True), _int(params, 'property_id', required=True),
+        )
+
+    async def stats(self, params):
+        return 200, {'tables': await self.service.table_sizes(), 'writer': self.service.writer_stats()}
+
+    # Serve one client connection until it closes or asks to. A request that cannot
+    # be read is answered with its error, then the connection is closed: the rest of
+    # the stream cannot be trusted to start at a request boundary.
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await _read_request(reader)
+                except HTTPError as error:
+                    _write_response(writer, error.status, {'error': str(error)}, keep_alive=False)
+                    await writer.drain()
+                    break
+                if request is None:
+                    break
+                method, target, headers, body = request
+                try:
+                    status, payload = await self.dispatch(method, target, body)
+                except HTTPError as error:
+                    status, payload = error.status, {'error': str(error)}
+                except (RecordError, ValueError) as error:
+                    status, payload = 400, {'error': str(error)}
+                except Exception as error:
+                    status, payload = 500, {'error': f"{type(error).__name__}: {error}"}
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                _write_response(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+# Read one HTTP/1.1 request. Returns (method, target, headers, body) or None at EOF;
+# raises HTTPError for requests that cannot be read.
+async def _read_request(reader):
+    try:
+        head = await reader.readuntil(b'\r\n\r\n')
+    except asyncio.IncompleteReadError:
+        return None
+    except asyncio.LimitOverrunError:
+        raise HTTPError(400, "Request head too large")
+    lines = head.decode('latin-1').split('\r\n')
+    try:
+        method, target, version = lines[0].split(' ', 2)
+    except ValueError:
+        raise HTTPError(400, "Malformed request line")
+    if not version.startswith('HTTP/'):
+        raise HTTPError(400, "Malformed request line")
+    headers = {}
+    for line in filter(None, lines[1:]):
+        if ':' not in line:
+            raise HTTPError(400, f"Malformed header: {line[:100]}")
+        name, value = line.split(':', 1)
+        headers[name.strip().lower()] = value.strip()
+    try:
+        length = int(headers.get('content-length') or 0)
+    except ValueError:
+        length = -1
+    if length < 0:
+        raise HTTPError(400, "Content-Length must be a non-negative integer")
+    if length > MAX_BODY:
+        raise HTTPError(413, f"Request body larger than {MAX_BODY} bytes")
+    body = await reader.readexactly(length) if length else b''
+    return method.upper(), target, headers, body
+
+
+def _write_response(writer, status, payload, keep_alive=True):
+    body = json.dumps(payload).encode('utf-8')
+    writer.write(
+        f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+        f"Content-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1') + body
+    )
+
+
+# Start the service and listen until cancelled. `ready` (if given) is called with the bound port.
+async def serve(url=None, profile=None, host=DEFAULT_HOST, port=DEFAULT_PORT, max_batch=None, ready=None):
+    options = {'max_batch': max_batch} if max_batch else {}
+    async with AsyncRealEstateService.from_url(url, profile, **options) as service:
+        api = RealEstateAPI(service)
+        server = await asyncio.start_server(api.handle_connection, host, port, backlog=1024)
+        bound_port = server.sockets[0].getsockname()[1]
+        print(f"Serving on http://{host}:{bound_port}", flush=True)
+        if ready is not None:
+            ready(bound_port)
+        async with server:
+            await server.serve_forever()
+
+
+def add_server_options(parser):
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help="port to listen on (0 picks a free one)")
+    parser.add_argument('--max-batch', type=int, help="most writes committed per transaction")
+
+
+# Handler of `cli/main.py serve`
+def serve_command(args):
+    try:
+        asyncio.run(serve(args.db, args.profile, args.host, args.port, args.max_batch))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the real estate operations as a local JSON API.")
+    parser.add_argument('--db', help="database URL (default: from the configuration)")
+    parser.add_argument('--profile', help="engine tuning profile")
+    add_server_options(parser)
+    return serve_command(parser.parse_args(argv))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
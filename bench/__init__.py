@@ -0,0 +1,2 @@
+# Benchmarks for the Real Estate Manager. Each module can be run with
+# `python -m bench.<module>` from the repository root.
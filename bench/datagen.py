@@ -0,0 +1,172 @@
+# Deterministic synthetic data generator for the agents/properties/buyers schema.
+#
+# The same seed and sizes always produce the same database, so benchmark runs on
+# different commits can be compared. Interests are skewed the way real traffic is:
+# property popularity and buyer activity both follow a Zipf-like power law, so a few
+# listings attract most of the interest and a few buyers save thousands of listings.
+#
+# Usage:
+#   python -m bench.datagen --db sqlite:///bench.db --scale small
+#   python -m bench.datagen --db sqlite:///bench.db --agents 1000 --properties 1000000 \
+#       --buyers 500000 --interests 10000000 --seed 42
+import argparse
+import itertools
+import random
+import sys
+import time
+
+from sqlalchemy import insert
+
+from db import make_engine
+from models import Base, Agent, Property, Buyer, buyer_property_association
+
+# Rows inserted per transaction
+CHUNK_SIZE = 20000
+
+# Named dataset sizes: (agents, properties, buyers, interests)
+SCALES = {
+    'tiny': (10, 1000, 500, 5000),
+    'small': (100, 100000, 50000, 500000),
+    'medium': (500, 500000, 200000, 3000000),
+    'large': (1000, 1000000, 500000, 10000000),
+}
+
+NAME_WORDS = [
+    'Sea', 'View', 'Villa', 'Garden', 'Apartment', 'Loft', 'Cottage', 'River', 'House',
+    'Studio', 'Penthouse', 'Manor', 'Court', 'Heights', 'Park', 'Lake', 'Hill', 'Palm',
+    'Cedar', 'Oak', 'Maple', 'Bay', 'Harbour', 'Ridge', 'Meadow', 'Grove', 'Terrace',
+]
+FIRST_NAMES = ['Amina', 'Brian', 'Carol', 'David', 'Esther', 'Faith', 'George', 'Hannah', 'Ivan', 'Joy', 'Kevin', 'Lucy']
+LAST_NAMES = ['Otieno', 'Wanjiru', 'Kamau', 'Achieng', 'Mwangi', 'Njeri', 'Kiptoo', 'Mutua', 'Chebet', 'Odhiambo']
+
+
+# Cumulative Zipf weights for `count` items: item k (0-based) has weight 1 / (k + 1) ** skew
+def zipf_cum_weights(count, skew):
+    return list(itertools.accumulate(1.0 / (rank ** skew) for rank in range(1, count + 1)))
+
+
+# Write `rows` (an iterable of dicts) into `table` in chunked transactions.
+# Returns the number of rows actually inserted.
+def insert_chunks(engine, table, rows, ignore_duplicates=False):
+    statement = insert(table)
+    if ignore_duplicates:
+        statement = statement.prefix_with('OR IGNORE', dialect='sqlite')
+    inserted = 0
+    rows = iter(rows)
+    while True:
+        batch = list(itertools.islice(rows, CHUNK_SIZE))
+        if not batch:
+            return inserted
+        with engine.begin() as connection:
+            result = connection.execute(statement, batch)
+        inserted += result.rowcount if result.rowcount >= 0 else len(batch)
+
+
+def generate_agents(rng, count):
+    for agent_id in range(1, count + 1):
+        yield {
+            'id': agent_id,
+            'name': f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+            'phone': f"07{rng.randint(0, 99999999):08d}",
+        }
+
+
+# Properties are spread over agents with a skew (a few agencies hold most listings);
+# prices follow a log-normal distribution rounded to the nearest thousand
+def generate_properties(rng, count, agents, skew):
+    agent_weights = zipf_cum_weights(agents, skew / 2)
+    agent_ids = list(range(1, agents + 1))
+    rng.shuffle(agent_ids)
+    for property_id in range(1, count + 1):
+        yield {
+            'id': property_id,
+            'name': f"{' '.join(rng.sample(NAME_WORDS, 3))} {property_id}",
+            'price': max(1000, int(round(rng.lognormvariate(15.5, 0.8), -3))),
+            'agent_id': rng.choices(agent_ids, cum_weights=agent_weights)[0],
+        }
+
+
+def generate_buyers(rng, count):
+    for buyer_id in range(1, count + 1):
+        yield {
+            'id': buyer_id,
+            'name': f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+            'email': f"buyer{buyer_id}@example.com",
+        }
+
+
+# Yields (buyer_id, property_id) pairs; both sides are drawn from a Zipf distribution
+# over a shuffled id order so popular listings and busy buyers are spread over the table
+def generate_interest_pairs(rng, buyers, properties, skew, batch=CHUNK_SIZE):
+    buyer_ids = list(range(1, buyers + 1))
+    property_ids = list(range(1, properties + 1))
+    rng.shuffle(buyer_ids)
+    rng.shuffle(property_ids)
+    buyer_weights = zipf_cum_weights(buyers, skew / 2)
+    property_weights = zipf_cum_weights(properties, skew)
+    while True:
+        chosen_buyers = rng.choices(buyer_ids, cum_weights=buyer_weights, k=batch)
+        chosen_properties = rng.choices(property_ids, cum_weights=property_weights, k=batch)
+        for buyer_id, property_id in zip(chosen_buyers, chosen_properties):
+            yield {'buyer_id': buyer_id, 'property_id': property_id}
+
+
+# Populate the database behind `engine`. The schema is created if missing.
+# Returns a dict with the number of rows written per table.
+def generate(engine, agents, properties, buyers, interests, seed=42, skew=1.1, log=print):
+    rng = random.Random(seed)
+    Base.metadata.create_all(engine)
+    counts = {}
+
+    for name, table, rows in (
+        ('agents', Agent.__table__, generate_agents(rng, agents)),
+        ('properties', Property.__table__, generate_properties(rng, properties, agents, skew)),
+        ('buyers', Buyer.__table__, generate_buyers(rng, buyers)),
+    ):
+        started = time.perf_counter()
+        counts[name] = insert_chunks(engine, table, rows)
+        log(f"{name}: {counts[name]} rows in {time.perf_counter() - started:.1f}s")
+
+    # Duplicate pairs are drawn regularly under skew; keep drawing until the target is met
+    started = time.perf_counter()
+    pairs = generate_interest_pairs(rng, buyers, properties, skew)
+    counts['interests'] = 0
+    interests = min(interests, buyers * properties)
+    if interests:
+        while counts['interests'] < interests:
+            wanted = min(CHUNK_SIZE, interests - counts['interests'])
+            counts['interests'] += insert_chunks(
+                engine, buyer_property_association, itertools.islice(pairs, wanted), ignore_duplicates=True
+            )
+    log(f"interests: {counts['interests']} rows in {time.perf_counter() - started:.1f}s")
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fill a database with deterministic synthetic data.")
+    parser.add_argument('--db', required=True, help="database URL to populate, e.g. sqlite:///bench.db")
+    parser.add_argument('--scale', choices=list(SCALES), default='tiny', help="preset sizes (overridden by the options below)")
+    parser.add_argument('--agents', type=int)
+    parser.add_argument('--properties', type=int)
+    parser.add_argument('--buyers', type=int)
+    parser.add_argument('--interests', type=int)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--skew', type=float, default=1.1, help="Zipf exponent of the interest distribution")
+    args = parser.parse_args(argv)
+
+    agents, properties, buyers, interests = SCALES[args.scale]
+    engine = make_engine(args.db, profile='bulk-load')
+    generate(
+        engine,
+        args.agents if args.agents is not None else agents,
+        args.properties if args.properties is not None else properties,
+        args.buyers if args.buyers is not None else buyers,
+        args.interests if args.interests is not None else interests,
+        seed=args.seed,
+        skew=args.skew,
+    )
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
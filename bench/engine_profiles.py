@@ -0,0 +1,139 @@
+# Benchmark the engine tuning profiles from db/engine.py against the SQLAlchemy/SQLite
+# defaults (the "default" profile, i.e. what `create_engine('sqlite:///...')` gives).
+#
+# For every profile a fresh database file is created and three workloads are timed:
+#   bulk insert      - properties inserted in chunked transactions
+#   point reads      - random primary-key lookups
+#   mixed readers    - reader threads doing lookups while a writer commits small
+#                      transactions; shows readers blocking behind the writer
+#
+# Usage:
+#   python -m bench.engine_profiles --rows 200000 --readers 8
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+
+from sqlalchemy import insert, select
+from tabulate import tabulate
+
+from db import PROFILES, make_engine
+from models import Base, Agent, Property
+
+
+# Time inserting `rows` properties in transactions of `chunk` rows
+def bench_bulk_insert(engine, rows, chunk):
+    started = time.perf_counter()
+    with engine.begin() as connection:
+        connection.execute(insert(Agent), [{'name': f"Agent {i}", 'phone': '000'} for i in range(100)])
+    for offset in range(0, rows, chunk):
+        batch = [
+            {'name': f"Property {i}", 'price': 1000 + i, 'agent_id': 1 + i % 100}
+            for i in range(offset, min(offset + chunk, rows))
+        ]
+        with engine.begin() as connection:
+            connection.execute(insert(Property), batch)
+    return rows / (time.perf_counter() - started)
+
+
+# Time `lookups` random primary-key reads on one connection
+def bench_point_reads(engine, rows, lookups):
+    ids = [random.randint(1, rows) for _ in range(lookups)]
+    started = time.perf_counter()
+    with engine.connect() as connection:
+        for property_id in ids:
+            connection.execute(select(Property.name, Property.price).where(Property.id == property_id)).first()
+    return lookups / (time.perf_counter() - started)
+
+
+# Readers look up properties while one writer commits small transactions.
+# Returns (reader lookups/s, writer commits/s, database-locked errors).
+def bench_mixed(engine, rows, readers, seconds):
+    stop = threading.Event()
+    reads = [0] * readers
+    writes = [0]
+    errors = [0]
+
+    def reader(slot):
+        while not stop.is_set():
+            try:
+                with engine.connect() as connection:
+                    for _ in range(50):
+                        connection.execute(
+                            select(Property.price).where(Property.id == random.randint(1, rows))
+                        ).first()
+                        reads[slot] += 1
+            except Exception:
+                errors[0] += 1
+
+    def writer():
+        while not stop.is_set():
+            try:
+                with engine.begin() as connection:
+                    connection.execute(insert(Property), [{'name': 'New listing', 'price': 1, 'agent_id': 1}] * 20)
+                writes[0] += 1
+            except Exception:
+                errors[0] += 1
+
+    threads = [threading.Thread(target=reader, args=(slot,)) for slot in range(readers)]
+    threads.append(threading.Thread(target=writer))
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return sum(reads) / seconds, writes[0] / seconds, errors[0]
+
+
+def run(profiles, rows, chunk, lookups, readers, seconds):
+    results = []
+    workdir = tempfile.mkdtemp(prefix='realestate-bench-')
+    try:
+        for profile in profiles:
+            path = os.path.join(workdir, f"{profile}.db")
+            # The read-replica profile refuses writes, so its data is loaded with bulk-load
+            loader = make_engine(f"sqlite:///{path}", profile='default' if profile == 'default' else 'bulk-load')
+            Base.metadata.create_all(loader)
+            insert_rate = bench_bulk_insert(loader, rows, chunk)
+            loader.dispose()
+
+            engine = make_engine(f"sqlite:///{path}", profile=profile)
+            read_rate = bench_point_reads(engine, rows, lookups)
+            if profile == 'read-replica':
+                mixed = (None, None, None)
+            else:
+                mixed = bench_mixed(engine, rows, readers, seconds)
+            engine.dispose()
+            results.append([profile, insert_rate, read_rate] + list(mixed))
+    finally:
+        shutil.rmtree(workdir)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark database tuning profiles against the defaults.")
+    parser.add_argument('--profiles', nargs='+', default=list(PROFILES), choices=list(PROFILES))
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--chunk', type=int, default=5000)
+    parser.add_argument('--lookups', type=int, default=20000)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=3.0)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args(argv)
+
+    random.seed(args.seed)
+    results = run(args.profiles, args.rows, args.chunk, args.lookups, args.readers, args.seconds)
+    print(tabulate(
+        results,
+        headers=["Profile", "Insert rows/s", "Point reads/s", "Mixed reads/s", "Mixed commits/s", "Lock errors"],
+        floatfmt=",.0f",
+        missingval="-",
+    ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,254 @@
+# Benchmark harness for the CLI operations of the interactive menu (cli/interactive.py).
+#
+# Every menu operation is driven through its real function with scripted answers to
+# its prompts, against a database produced by bench.datagen. For each operation the
+# harness records latency percentiles, the number of SQL statements issued and the
+# peak Python memory allocated, and writes everything to a JSON file together with
+# the git commit and dataset description so runs on different commits can be compared.
+#
+# Usage:
+#   python -m bench.datagen --db sqlite:///bench.db --scale small
+#   python -m bench.harness --db bench.db --output results.json
+#   python -m bench.harness --db bench.db --compare baseline.json
+#
+# The operations run against a temporary copy of the database, so the dataset stays
+# identical from one run to the next.
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from unittest import mock
+
+import sqlalchemy
+from sqlalchemy import event, func, select
+
+from models import Agent, Property, Buyer, buyer_property_association
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# Counts SQL statements sent to the database through `engine`
+class QueryCounter:
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, 'before_cursor_execute', self._on_execute)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+
+# Nearest-rank percentile of an already sorted list
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+# The operations to benchmark: name -> (function name in cli/interactive.py, answers builder).
+# Each builder returns the list of answers fed to input() for one call.
+def build_operations(rng, sizes):
+    def random_id(entity):
+        return str(rng.randint(1, max(1, sizes[entity])))
+
+    counter = iter(range(10 ** 9))
+    return {
+        'add_agent': ('add_agent', lambda: ["Bench Agent", "0700000000"]),
+        'add_property': ('add_property', lambda: ["Bench Property", str(rng.randint(1000, 10 ** 7)), random_id('agents')]),
+        'add_buyer': ('add_buyer', lambda: ["Bench Buyer", f"bench{next(counter)}.{rng.random()}@example.com"]),
+        'list_agents': ('view_all_agents', lambda: ['q']),
+        'list_properties': ('view_all_properties', lambda: ['n', 'n', 'p', 'q']),
+        'list_buyers': ('view_all_buyers', lambda: ['q']),
+        'express_interest': ('express_interest_in_property', lambda: [random_id('buyers'), random_id('properties')]),
+        'view_interests': ('view_buyer_interested_properties', lambda: [random_id('buyers')]),
+        'search': ('search_for_properties', lambda: ["villa", "100000", "5000000", "", "", "20"]),
+        'recommend': ('recommend_for_buyer', lambda: [random_id('buyers')]),
+    }
+
+
+# Call `function` with scripted answers and swallow its output. Errors (e.g. a
+# duplicate interest) are counted instead of aborting the run; each operation has its
+# own session or connection, which is rolled back and closed when it fails.
+def call_operation(function, answers):
+    replies = iter(answers)
+    with mock.patch('builtins.input', lambda prompt='': next(replies, 'q')), contextlib.redirect_stdout(io.StringIO()):
+        try:
+            function()
+            return True
+        except Exception:
+            return False
+
+
+# Time `iterations` calls of every operation. A second, shorter pass measures peak
+# memory under tracemalloc so its overhead does not distort the latencies.
+def run_benchmarks(cli, operations, iterations, memory_iterations):
+    counter = QueryCounter(cli.engine)
+    results = {}
+    for name, (function_name, answers) in operations.items():
+        function = getattr(cli, function_name)
+        latencies = []
+        errors = 0
+        queries_before = counter.count
+        for _ in range(iterations):
+            replies = answers()
+            started = time.perf_counter()
+            ok = call_operation(function, replies)
+            latencies.append((time.perf_counter() - started) * 1000)
+            errors += not ok
+        queries = counter.count - queries_before
+
+        tracemalloc.start()
+        peak = 0
+        for _ in range(memory_iterations):
+            tracemalloc.reset_peak()
+            call_operation(function, answers())
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+        latencies.sort()
+        results[name] = {
+            'iterations': iterations,
+            'errors': errors,
+            'mean_ms': sum(latencies) / len(latencies),
+            'p50_ms': percentile(latencies, 0.50),
+            'p90_ms': percentile(latencies, 0.90),
+            'p99_ms': percentile(latencies, 0.99),
+            'max_ms': latencies[-1],
+            'queries_per_op': queries / iterations,
+            'peak_memory_kib': peak / 1024,
+        }
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=REPO_ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Row counts of the benchmark database, recorded so runs on different data are not compared blindly
+def dataset_sizes(engine):
+    with engine.connect() as connection:
+        return {
+            'agents': connection.execute(select(func.count()).select_from(Agent)).scalar(),
+            'properties': connection.execute(select(func.count()).select_from(Property)).scalar(),
+            'buyers': connection.execute(select(func.count()).select_from(Buyer)).scalar(),
+            'interests': connection.execute(select(func.count()).select_from(buyer_property_association)).scalar(),
+        }
+
+
+# Copy the SQLite database at `path` into `directory` with the backup API
+# (consistent even if the source is in WAL mode) and return the copy's path
+def copy_database(path, directory):
+    target = os.path.join(directory, os.path.basename(path))
+    source = sqlite3.connect(path)
+    destination = sqlite3.connect(target)
+    try:
+        source.backup(destination)
+    finally:
+        destination.close()
+        source.close()
+    return target
+
+
+# Print the change of each operation's p50/p99 and query count relative to a previous run
+def compare(previous, current):
+    if previous.get('dataset') != current.get('dataset'):
+        print("Warning: the two runs used different datasets.")
+    print(f"{'operation':<18} {'p50 ms':>18} {'p99 ms':>18} {'queries/op':>16}")
+    for name, now in current['operations'].items():
+        before = previous['operations'].get(name)
+        if before is None:
+            print(f"{name:<18} (new)")
+            continue
+        cells = []
+        for key in ('p50_ms', 'p99_ms', 'queries_per_op'):
+            change = (now[key] - before[key]) / before[key] * 100 if before[key] else 0.0
+            cells.append(f"{now[key]:.2f} ({change:+.0f}%)")
+        print(f"{name:<18} {cells[0]:>18} {cells[1]:>18} {cells[2]:>16}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark every CLI operation.")
+    parser.add_argument('--db', required=True, help="SQLite database file created by bench.datagen (left unchanged)")
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--memory-iterations', type=int, default=10)
+    parser.add_argument('--operations', nargs='+', help="subset of operations to run")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--compare', help="previous results file to compare against")
+    parser.add_argument('--cache-size', type=int, help="identity cache capacity (default: services.identity_cache.DEFAULT_MAXSIZE, 0 disables it)")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='realestate-bench-')
+    try:
+        results = run(args, copy_database(args.db, workdir))
+    finally:
+        shutil.rmtree(workdir)
+
+    with open(args.output, 'w') as handle:
+        json.dump(results, handle, indent=2)
+
+    print(f"{'operation':<18} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'queries':>8} {'peak KiB':>9} {'errors':>7}")
+    for name, stats in results['operations'].items():
+        print(
+            f"{name:<18} {stats['p50_ms']:8.2f} {stats['p90_ms']:8.2f} {stats['p99_ms']:8.2f} "
+            f"{stats['queries_per_op']:8.1f} {stats['peak_memory_kib']:9.0f} {stats['errors']:7d}"
+        )
+    cache = results['identity_cache']
+    print(
+        f"identity cache: {cache['hits']} hits, {cache['misses']} misses, {cache['evictions']} evictions "
+        f"({cache['hit_rate']:.0%} hit rate, {cache['size']}/{cache['maxsize']} rows)"
+    )
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as handle:
+            compare(json.load(handle), results)
+    return 0
+
+
+# Benchmark the CLI against the database copy at `path` and return the results document
+def run(args, path):
+    from cli import interactive as cli
+    from services.identity_cache import identity_cache
+
+    cli.connect(f"sqlite:///{path}")
+    if args.cache_size is not None:
+        identity_cache.resize(args.cache_size)
+    identity_cache.clear()
+    identity_cache.reset_stats()
+
+    sizes = dataset_sizes(cli.engine)
+    rng = random.Random(args.seed)
+    operations = build_operations(rng, sizes)
+    if args.operations:
+        operations = {name: operations[name] for name in args.operations}
+
+    results = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'sqlalchemy': sqlalchemy.__version__,
+        'seed': args.seed,
+        'dataset': sizes,
+        'operations': run_benchmarks(cli, operations, args.iterations, args.memory_iterations),
+        'identity_cache': identity_cache.stats(),
+    }
+    cli.engine.dispose()
+    return results
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,220 @@
+# Load test for the JSON API (api/server.py).
+#
+# Opens `--concurrency` keep-alive connections and has each one send requests back
+# to back for `--duration` seconds: a mix of reads (property by id, listing pages,
+# search, buyer interests, the portfolio report) and, with probability
+# `--write-ratio`, writes (record an interest, add a property). Reports requests per
+# second and p50/p90/p99 latency overall and per operation, plus how the server's
+# writer task batched the writes.
+#
+# Usage:
+#   python -m bench.loadtest --db bench.db                      # serve a temporary copy of bench.db
+#   python -m bench.loadtest --url http://127.0.0.1:8080        # an already running server
+#   python -m bench.loadtest --db bench.db --concurrency 64 --duration 30 --write-ratio 0.2
+import argparse
+import asyncio
+import json
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import urlsplit
+
+from bench.harness import REPO_ROOT, copy_database, percentile
+
+
+# A keep-alive HTTP/1.1 connection sending JSON requests
+class Client:
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = self.writer = None
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    async def request(self, method, path, payload=None):
+        body = json.dumps(payload).encode('utf-8') if payload is not None else b''
+        self.writer.write(
+            f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\n"
+            f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n".encode('latin-1') + body
+        )
+        head = await self.reader.readuntil(b'\r\n\r\n')
+        lines = head.decode('latin-1').split('\r\n')
+        status = int(lines[0].split(' ', 2)[1])
+        length = 0
+        for line in lines[1:]:
+            if line.lower().startswith('content-length:'):
+                length = int(line.split(':', 1)[1])
+        return status, json.loads(await self.reader.readexactly(length))
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+# The request mix: name -> function(rng, sizes) returning (method, path, payload)
+def build_operations(sizes):
+    def some(entity, rng):
+        return rng.randint(1, max(1, sizes[entity]))
+
+    reads = {
+        'get_property': lambda rng: ('GET', f"/properties/{some('properties', rng)}", None),
+        'list_properties': lambda rng: ('GET', f"/properties?after_id={some('properties', rng)}&limit=50", None),
+        'search': lambda rng: ('GET', f"/properties/search?max_price={rng.randint(1, 50) * 100000}&limit=20", None),
+        'buyer_interests': lambda rng: ('GET', f"/buyers/{some('buyers', rng)}/interests", None),
+        'portfolio': lambda rng: ('GET', "/agents/portfolio?limit=10", None),
+    }
+    writes = {
+        'record_interest': lambda rng: (
+            'POST', "/interests", {'buyer_id': some('buyers', rng), 'property_id': some('properties', rng)},
+        ),
+        'add_property': lambda rng: (
+            'POST', "/properties",
+            {'name': f"Load Test House {rng.randint(1, 10 ** 6)}", 'price': rng.randint(1, 100) * 50000,
+             'agent_id': some('agents', rng)},
+        ),
+    }
+    return reads, writes
+
+
+async def worker(client, rng, reads, writes, write_ratio, deadline, samples):
+    read_names, write_names = list(reads), list(writes)
+    while time.perf_counter() < deadline:
+        if writes and rng.random() < write_ratio:
+            name = rng.choice(write_names)
+            method, path, payload = writes[name](rng)
+        else:
+            name = rng.choice(read_names)
+            method, path, payload = reads[name](rng)
+        started = time.perf_counter()
+        try:
+            status, _ = await client.request(method, path, payload)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            status = None
+            await client.connect()
+        samples.append((name, (time.perf_counter() - started) * 1000, status))
+
+
+def summarize(latencies):
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'p50_ms': percentile(latencies, 0.50),
+        'p90_ms': percentile(latencies, 0.90),
+        'p99_ms': percentile(latencies, 0.99),
+        'max_ms': latencies[-1] if latencies else 0.0,
+    }
+
+
+async def run_load(host, port, concurrency, duration, write_ratio, seed):
+    control = Client(host, port)
+    await control.connect()
+    _, stats = await control.request('GET', '/stats')
+    sizes = stats['tables']
+    writer_before = stats['writer']
+    reads, writes = build_operations(sizes)
+
+    clients = [Client(host, port) for _ in range(concurrency)]
+    await asyncio.gather(*(client.connect() for client in clients))
+    samples = []
+    started = time.perf_counter()
+    deadline = started + duration
+    await asyncio.gather(*(
+        worker(client, random.Random(seed + index), reads, writes, write_ratio, deadline, samples)
+        for index, client in enumerate(clients)
+    ))
+    elapsed = time.perf_counter() - started
+    for client in clients:
+        client.close()
+
+    _, stats = await control.request('GET', '/stats')
+    control.close()
+    writer = stats['writer']
+    batches = writer['batches'] - writer_before['batches']
+    written = writer['writes'] - writer_before['writes']
+
+    by_operation = {}
+    for name, latency, status in samples:
+        by_operation.setdefault(name, []).append(latency)
+    return {
+        'concurrency': concurrency,
+        'duration_s': elapsed,
+        'write_ratio': write_ratio,
+        'dataset': sizes,
+        'requests_per_second': len(samples) / elapsed,
+        'overall': summarize([latency for _, latency, _ in samples]),
+        'rejected': sum(1 for _, _, status in samples if status is not None and 400 <= status < 500),
+        'errors': sum(1 for _, _, status in samples if status is None or status >= 500),
+        'operations': {name: summarize(latencies) for name, latencies in sorted(by_operation.items())},
+        'writer': {'batches': batches, 'writes': written, 'mean_batch_size': written / batches if batches else 0.0},
+    }
+
+
+# Start api.server on a copy of `db_path` and return (process, port)
+def start_server(db_path, directory, profile=None):
+    copy = copy_database(db_path, directory)
+    command = [sys.executable, '-m', 'api.server', '--db', f"sqlite:///{copy}", '--port', '0']
+    if profile:
+        command += ['--profile', profile]
+    process = subprocess.Popen(command, cwd=REPO_ROOT, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    if not line.startswith('Serving on '):
+        process.kill()
+        raise RuntimeError(f"The server did not start: {line!r}")
+    return process, int(line.rsplit(':', 1)[1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the JSON API.")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--url', help="base URL of a running server, e.g. http://127.0.0.1:8080")
+    target.add_argument('--db', help="SQLite database file; a server is started on a temporary copy")
+    parser.add_argument('--profile', help="engine profile of the started server")
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=10.0, help="seconds")
+    parser.add_argument('--write-ratio', type=float, default=0.1)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help="write the results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    process = workdir = None
+    try:
+        if args.db:
+            workdir = tempfile.mkdtemp(prefix='realestate-load-')
+            process, port = start_server(args.db, workdir, args.profile)
+            host = '127.0.0.1'
+        else:
+            url = urlsplit(args.url)
+            host, port = url.hostname, url.port or 80
+        results = asyncio.run(run_load(host, port, args.concurrency, args.duration, args.write_ratio, args.seed))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+        if workdir is not None:
+            shutil.rmtree(workdir)
+
+    overall = results['overall']
+    print(
+        f"{overall['requests']} requests in {results['duration_s']:.1f}s with {args.concurrency} connections: "
+        f"{results['requests_per_second']:.0f} req/s, p50 {overall['p50_ms']:.2f} ms, p99 {overall['p99_ms']:.2f} ms"
+    )
+    print(f"{'operation':<18} {'requests':>9} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8}")
+    for name, stats in results['operations'].items():
+        print(f"{name:<18} {stats['requests']:9d} {stats['p50_ms']:8.2f} {stats['p90_ms']:8.2f} {stats['p99_ms']:8.2f}")
+    writer = results['writer']
+    print(
+        f"writes: {writer['writes']} in {writer['batches']} transactions "
+        f"(mean batch {writer['mean_batch_size']:.1f}); rejected {results['rejected']}, errors {results['errors']}"
+    )
+    if args.output:
+        with open(args.output, 'w') as handle:
+            json.dump(results, handle, indent=2)
+    return 1 if results['errors'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,92 @@
+# Memory regression check for long interactive sessions.
+#
+# Each option of the interactive menu (cli/interactive.py) is a unit of work with its
+# own session or connection, so a menu left open for a day must use no more memory
+# after thousands of options than after the first few hundred. This benchmark runs
+# the menu operations of bench.harness round-robin, `--commands` times, against a
+# temporary copy of a bench.datagen database, sampling the process's resident set
+# size and the number of live Python objects as it goes. After `--warmup` commands
+# (SQLite's page cache and SQLAlchemy's statement cache filling up), the RSS may not
+# grow by more than `--budget-mib`; it exits non-zero when it does.
+#
+# Usage:
+#   python -m bench.memory --db bench.db --commands 5000 --budget-mib 8
+import argparse
+import gc
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+
+from bench.harness import build_operations, call_operation, copy_database, dataset_sizes
+
+
+# Current resident set size in MiB (peak RSS where /proc is not available)
+def resident_mib():
+    try:
+        with open('/proc/self/statm') as handle:
+            return int(handle.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+
+# Run `commands` menu operations, returning [(commands run, RSS MiB, live objects)]
+# sampled every `sample_every` commands
+def run(cli, operations, commands, sample_every):
+    functions = [(getattr(cli, function_name), answers) for function_name, answers in operations.values()]
+    samples = []
+    errors = 0
+    for index in range(commands):
+        function, answers = functions[index % len(functions)]
+        errors += not call_operation(function, answers())
+        if (index + 1) % sample_every == 0:
+            gc.collect()
+            samples.append((index + 1, resident_mib(), len(gc.get_objects())))
+    return samples, errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check that memory stays flat over many interactive commands.")
+    parser.add_argument('--db', required=True, help="SQLite database file created by bench.datagen (left unchanged)")
+    parser.add_argument('--profile', help="engine tuning profile (default: the CLI's)")
+    parser.add_argument('--commands', type=int, default=5000)
+    parser.add_argument('--warmup', type=int, default=500, help="commands run before growth is measured")
+    parser.add_argument('--sample-every', type=int, default=250)
+    parser.add_argument('--budget-mib', type=float, default=8.0, help="allowed RSS growth after the warm-up")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args(argv)
+    if args.warmup >= args.commands:
+        parser.error("--warmup must be smaller than --commands")
+
+    from cli import interactive as cli
+
+    workdir = tempfile.mkdtemp(prefix='realestate-memory-')
+    try:
+        cli.connect(f"sqlite:///{copy_database(args.db, workdir)}", args.profile)
+        operations = build_operations(random.Random(args.seed), dataset_sizes(cli.engine))
+        samples, errors = run(cli, operations, args.commands, args.sample_every)
+        cli.engine.dispose()
+    finally:
+        shutil.rmtree(workdir)
+
+    print(f"{'commands':>8} {'RSS MiB':>8} {'objects':>9}")
+    for commands, rss, objects in samples:
+        print(f"{commands:8d} {rss:8.1f} {objects:9d}")
+
+    after_warmup = [sample for sample in samples if sample[0] >= args.warmup]
+    baseline = after_warmup[0]
+    growth = max(rss for _, rss, _ in after_warmup) - baseline[1]
+    objects = after_warmup[-1][2] - baseline[2]
+    status = 'ok' if growth <= args.budget_mib else 'GROWING'
+    print(
+        f"After {baseline[0]} commands: RSS {growth:+.1f} MiB (budget {args.budget_mib:g} MiB), "
+        f"{objects:+d} live objects, {errors} failed commands: {status}"
+    )
+    return 0 if status == 'ok' else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
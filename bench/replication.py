@@ -0,0 +1,127 @@
+# Replica refresh cost: incremental sync from the change log against a full copy.
+#
+# Works on a temporary copy of a bench.datagen database. A replica is seeded from it,
+# then for each size in --changes that many random writes (price and agent changes,
+# new and deleted listings, interests recorded and removed, new buyers) are made to
+# the source and the replica is brought up to date with services.replication. Each
+# sync is timed next to a full copy of the source with the backup API, which is what
+# refreshing the replica wholesale costs; the sync should grow with the number of
+# changes, the copy with the size of the database. Row counts and the portfolio
+# summary of the replica are checked against the source after every sync.
+#
+# Usage:
+#   python -m bench.replication --db bench.db --changes 100,1000,10000
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+from bench.harness import copy_database
+
+TABLES = ('agents', 'properties', 'buyers', 'buyer_property_association')
+
+
+# Make `count` random writes to the SQLite database at `path`, committing every 100
+def random_writes(path, count, rng):
+    connection = sqlite3.connect(path)
+    properties = connection.execute("SELECT max(id) FROM properties").fetchone()[0]
+    buyers = connection.execute("SELECT max(id) FROM buyers").fetchone()[0]
+    agents = connection.execute("SELECT max(id) FROM agents").fetchone()[0]
+    for index in range(count):
+        choice = rng.random()
+        if choice < 0.35:
+            connection.execute("UPDATE properties SET price = ? WHERE id = ?", (rng.randint(50000, 2000000), rng.randint(1, properties)))
+        elif choice < 0.45:
+            connection.execute("UPDATE properties SET agent_id = ? WHERE id = ?", (rng.randint(1, agents), rng.randint(1, properties)))
+        elif choice < 0.55:
+            properties += 1
+            connection.execute(
+                "INSERT INTO properties (id, name, price, agent_id) VALUES (?, ?, ?, ?)",
+                (properties, f"Listing {properties}", rng.randint(50000, 2000000), rng.randint(1, agents)),
+            )
+        elif choice < 0.6:
+            connection.execute("DELETE FROM properties WHERE id = ?", (rng.randint(1, properties),))
+        elif choice < 0.85:
+            connection.execute(
+                "INSERT OR IGNORE INTO buyer_property_association (buyer_id, property_id) VALUES (?, ?)",
+                (rng.randint(1, buyers), rng.randint(1, properties)),
+            )
+        elif choice < 0.95:
+            connection.execute(
+                "DELETE FROM buyer_property_association WHERE rowid = "
+                "(SELECT rowid FROM buyer_property_association WHERE buyer_id = ? LIMIT 1)",
+                (rng.randint(1, buyers),),
+            )
+        else:
+            buyers += 1
+            connection.execute("INSERT INTO buyers (id, name, email) VALUES (?, ?, ?)", (buyers, f"Buyer {buyers}", f"buyer{buyers}@example.com"))
+        if index % 100 == 99:
+            connection.commit()
+    connection.commit()
+    connection.close()
+
+
+def row_counts(path):
+    connection = sqlite3.connect(path)
+    try:
+        return [connection.execute(f"SELECT count(*) FROM {table}").fetchone()[0] for table in TABLES]
+    finally:
+        connection.close()
+
+
+def portfolio_summary(path):
+    connection = sqlite3.connect(path)
+    try:
+        return connection.execute("SELECT * FROM agent_portfolio_summary ORDER BY agent_id").fetchall()
+    finally:
+        connection.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time incremental replica syncs against full copies.")
+    parser.add_argument('--db', required=True, help="SQLite database file created by bench.datagen (left unchanged)")
+    parser.add_argument('--changes', default='100,1000,10000', help="comma-separated numbers of writes between syncs")
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args(argv)
+
+    from db import make_engine
+    from services.replication import compact_log, last_seq, sync_replica
+
+    rng = random.Random(args.seed)
+    workdir = tempfile.mkdtemp(prefix='realestate-replication-')
+    failures = 0
+    try:
+        source = copy_database(args.db, workdir)
+        replica = os.path.join(workdir, 'replica.db')
+        engine = make_engine(f"sqlite:///{source}", 'bulk-load')
+        # Start from an empty log, as after `changes compact` once the replicas are seeded
+        with engine.connect() as connection:
+            compact_log(connection, last_seq(connection))
+        result = sync_replica(engine, replica, args.batch_size)
+        print(f"Seeded the replica in {result.seconds:.2f}s ({os.path.getsize(source) / 2 ** 20:.0f} MiB)")
+
+        print(f"{'changes':>8} {'entries':>8} {'sync s':>8} {'copy s':>8} {'rows':>5}")
+        for count in (int(value) for value in args.changes.split(',')):
+            random_writes(source, count, rng)
+            result = sync_replica(engine, replica, args.batch_size)
+            copy_dir = tempfile.mkdtemp(dir=workdir)
+            started = time.perf_counter()
+            copy_database(source, copy_dir)
+            copied = time.perf_counter() - started
+            shutil.rmtree(copy_dir)
+            same = row_counts(source) == row_counts(replica) and portfolio_summary(source) == portfolio_summary(replica)
+            failures += not same
+            print(f"{count:8d} {result.entries:8d} {result.seconds:8.2f} {copied:8.2f} {'ok' if same else 'DIFF':>5}")
+        engine.dispose()
+    finally:
+        shutil.rmtree(workdir)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,81 @@
+# Startup-time benchmark for the command line entry point.
+#
+# Scripted use runs cli/main.py once per operation, so its start-up cost is paid on
+# every call. This benchmark times `--help` and the trivial `config` command in fresh
+# interpreters, compares them with a bare `python -c pass`, and checks with
+# `python -X importtime` that none of the heavy modules (SQLAlchemy, the models,
+# tabulate) are imported. It exits non-zero when either budget is exceeded.
+#
+# Usage:
+#   python -m bench.startup --runs 20 --budget-ms 75
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLI = os.path.join(REPO_ROOT, 'cli', 'main.py')
+
+# Modules that must not be loaded for --help and trivial commands
+HEAVY_MODULES = ('sqlalchemy', 'tabulate', 'models', 'services', 'numpy')
+
+COMMANDS = {
+    'baseline (python -c pass)': [sys.executable, '-c', 'pass'],
+    '--help': [sys.executable, CLI, '--help'],
+    'config': [sys.executable, CLI, 'config'],
+}
+
+
+# Median wall time in ms of running `command` `runs` times
+def time_command(command, runs):
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+# Top-level modules imported by `command`, from the -X importtime report
+def imported_modules(command):
+    result = subprocess.run(
+        [command[0], '-X', 'importtime'] + command[1:],
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, check=True,
+    )
+    modules = set()
+    for line in result.stderr.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            name = line.rsplit('|', 1)[1].strip()
+            modules.add(name.split('.')[0])
+    return modules
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check that the CLI starts fast and imports lazily.")
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--budget-ms', type=float, default=75.0, help="allowed overhead over a bare interpreter")
+    args = parser.parse_args(argv)
+
+    timings = {name: time_command(command, args.runs) for name, command in COMMANDS.items()}
+    baseline = timings.pop('baseline (python -c pass)')
+    print(f"{'python -c pass':<16} {baseline:7.1f} ms")
+
+    failures = 0
+    for name, median in timings.items():
+        overhead = median - baseline
+        status = 'ok' if overhead <= args.budget_ms else 'SLOW'
+        failures += status != 'ok'
+        print(f"{name:<16} {median:7.1f} ms  (+{overhead:.1f} ms) {status}")
+
+        heavy = sorted(imported_modules(COMMANDS[name]) & set(HEAVY_MODULES))
+        if heavy:
+            failures += 1
+            print(f"{'':<16} imports heavy modules: {', '.join(heavy)}")
+
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,4 @@
+# Command line interface of the Real Estate Manager.
+#
+# cli/main.py is the entry point: with no arguments it starts the interactive menu
+# (cli/interactive.py), otherwise it runs one subcommand (cli/commands.py).
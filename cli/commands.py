@@ -0,0 +1,496 @@
+# Handlers for the non-interactive subcommands of cli/main.py.
+#
+# Each handler takes the parsed argparse namespace, runs one operation and returns
+# the process exit code. This module (and with it SQLAlchemy and the models) is only
+# imported once a subcommand that needs the database has been chosen.
+import sys
+
+from db import make_engine, make_session_factory
+from services.listing import LISTINGS, iter_pages
+from services.records import (
+    RecordError, create_agent, create_property, create_buyer, buyer_interests as find_buyer_interests,
+    record_interest, record_interests,
+)
+from services.search import search_properties
+
+from cli.output import write_pages, write_record
+
+
+# Open a session on the database chosen by --db/--profile (or the configuration), for
+# the commands that write. Used as `with open_session(args) as session:`, which closes it.
+def open_session(args):
+    engine = make_engine(args.db, args.profile)
+    return make_session_factory(engine, expire_on_commit=False)()
+
+
+# Open a connection for the read-only commands, which run Core statements and need no
+# Session. Used as `with open_connection(args) as connection:`.
+def open_connection(args):
+    return make_engine(args.db, args.profile).connect()
+
+
+# Print a user error on stderr and return the failure exit code
+def fail(message):
+    sys.stderr.write(f"Error: {message}\n")
+    return 1
+
+
+# Stream every row of `entity` (or `--limit` rows after `--after-id`) in the chosen format
+def list_entity(args, entity):
+    with open_connection(args) as connection:
+        pages = iter_pages(connection, entity, args.page_size, after_id=args.after_id)
+        if args.limit is not None:
+            pages = _limit_pages(pages, args.limit)
+        write_pages(pages, LISTINGS[entity][2], args.format)
+    return 0
+
+
+# Stop a page stream after `limit` rows
+def _limit_pages(pages, limit):
+    remaining = limit
+    for rows in pages:
+        if remaining <= 0:
+            return
+        yield rows[:remaining]
+        remaining -= len(rows)
+
+
+def agent_add(args):
+    try:
+        with open_session(args) as session:
+            agent = create_agent(session, args.name, args.phone)
+    except RecordError as error:
+        return fail(error)
+    write_record({'id': agent.id, 'name': agent.name, 'phone': agent.phone}, args.format)
+    return 0
+
+
+def agent_list(args):
+    return list_entity(args, 'agents')
+
+
+def agent_portfolio(args):
+    from services.analytics import PORTFOLIO_HEADERS, agent_portfolio
+
+    with open_connection(args) as connection:
+        rows = agent_portfolio(connection, args.live, args.agent_id, args.sort, args.limit)
+    write_pages([rows], PORTFOLIO_HEADERS, args.format)
+    return 0
+
+
+def agent_rebuild_portfolio(args):
+    from services.analytics import rebuild_summary
+
+    engine = make_engine(args.db, args.profile)
+    with engine.begin() as connection:
+        count = rebuild_summary(connection)
+    print(f"Rebuilt portfolio summary for {count} agents")
+    return 0
+
+
+def property_add(args):
+    try:
+        with open_session(args) as session:
+            new_property = create_property(session, args.name, args.price, args.agent_id)
+    except RecordError as error:
+        return fail(error)
+    write_record(
+        {'id': new_property.id, 'name': new_property.name, 'price': new_property.price, 'agent_id': new_property.agent_id},
+        args.format,
+    )
+    return 0
+
+
+def property_list(args):
+    return list_entity(args, 'properties')
+
+
+def property_search(args):
+    with open_connection(args) as connection:
+        results = search_properties(
+            connection, args.text, args.min_price, args.max_price, args.agent_id, args.sort, args.limit
+        )
+    write_pages([results], ["ID", "Name", "Price", "Agent ID"], args.format)
+    return 0
+
+
+def property_stats(args):
+    from services.price_stats import DEFAULT_BANDS, DEFAULT_QUANTILES, StatisticsError, price_statistics
+
+    engine = make_engine(args.db, args.profile)
+    try:
+        report, cached = price_statistics(
+            engine, args.quantiles or DEFAULT_QUANTILES, args.bands or DEFAULT_BANDS, args.by_agent, args.outliers,
+            args.approx, args.accuracy, args.iqr_factor, args.chunk_size, use_cache=not args.no_cache,
+        )
+    except StatisticsError as error:
+        return fail(error)
+    finally:
+        engine.dispose()
+    if args.format == 'json':
+        import json
+
+        print(json.dumps(dict(report, cached=cached), indent=2))
+    else:
+        print_price_stats(report, cached)
+    return 0
+
+
+def _price(value):
+    return '' if value is None else f"{value:,.0f}"
+
+
+# Print a price statistics report; reports over several shards (cli/sharded.py) have
+# a data version per region and a Region column for agents and outlying listings
+def print_price_stats(report, cached=False):
+    from tabulate import tabulate
+
+    mode = 'exact' if report['mode'] == 'exact' else f"approximate, ±{report['accuracy']:.1%}"
+    version = report['data_version']
+    if isinstance(version, dict):
+        version = ', '.join(f"{region} {number}" for region, number in version.items())
+    print(f"{report['count']:,} listings ({mode}, data version {version}{', cached' if cached else ''})")
+    if not report['count']:
+        return
+    print(f"mean {_price(report['mean'])}, std {_price(report['std'])}, min {_price(report['min'])}, max {_price(report['max'])}\n")
+    print(tabulate([(f"p{q['quantile'] * 100:g}", _price(q['price'])) for q in report['quantiles']], headers=["Quantile", "Price"]))
+    print()
+    bands = [
+        (_price(band['low']) if band['low'] is not None else '', _price(band['high']), band['count'],
+         f"{band['count'] / report['count']:.1%}")
+        for band in report['histogram']
+    ]
+    print(tabulate(bands, headers=["From", "Below", "Listings", "Share"]))
+    outliers = report.get('outliers')
+    if outliers:
+        print(
+            f"\nOutliers beyond {outliers['iqr_factor']:g} IQR: {outliers['below']:,} below {_price(outliers['low_fence'])}, "
+            f"{outliers['above']:,} above {_price(outliers['high_fence'])}"
+        )
+        examples = outliers['lowest'] + outliers['highest']
+        if examples:
+            regions = 'region' in examples[0]
+            print(tabulate(
+                [([e['region']] if regions else []) + [e['id'], e['name'], _price(e['price']), e['agent_id']] for e in examples],
+                headers=(["Region"] if regions else []) + ["ID", "Name", "Price", "Agent ID"],
+            ))
+    if 'agents' in report:
+        regions = isinstance(report['data_version'], dict)
+        headers = ["Agent ID", "Agent", "Listings", "Mean"] + [f"p{q['quantile'] * 100:g}" for q in report['quantiles']]
+        if regions:
+            headers.insert(0, "Region")
+        if outliers:
+            headers.append("Outliers")
+        rows = []
+        for agent in report['agents']:
+            row = [agent['agent_id'], agent['name'], agent['count'], _price(agent['mean'])]
+            if regions:
+                row.insert(0, agent['region'])
+            row += [_price(q['price']) for q in agent['quantiles']]
+            if outliers:
+                row.append(agent.get('outliers', 0))
+            rows.append(row)
+        print()
+        print(tabulate(rows, headers=headers))
+
+
+def buyer_add(args):
+    try:
+        with open_session(args) as session:
+            buyer = create_buyer(session, args.name, args.email)
+    except RecordError as error:
+        return fail(error)
+    write_record({'id': buyer.id, 'name': buyer.name, 'email': buyer.email}, args.format)
+    return 0
+
+
+def buyer_list(args):
+    return list_entity(args, 'buyers')
+
+
+def buyer_interests(args):
+    try:
+        with open_connection(args) as connection:
+            _, rows = find_buyer_interests(connection, args.buyer_id)
+    except RecordError as error:
+        return fail(error)
+    write_pages([rows], ["ID", "Name", "Price"], args.format)
+    return 0
+
+
+def interest_add(args):
+    try:
+        with open_session(args) as session:
+            buyer, interesting_property = record_interest(session, args.buyer_id, args.property_id)
+    except RecordError as error:
+        return fail(error)
+    write_record({'buyer_id': buyer.id, 'property_id': interesting_property.id}, args.format)
+    return 0
+
+
+def buyer_recommend(args):
+    from services.recommendations import RECOMMENDATION_HEADERS, recommend_properties
+
+    try:
+        with open_connection(args) as connection:
+            _, rows = recommend_properties(connection, args.buyer_id, args.limit, args.band, live=args.live or None)
+    except RecordError as error:
+        return fail(error)
+    write_pages([rows], RECOMMENDATION_HEADERS, args.format)
+    return 0
+
+
+def recommendations_rebuild(args):
+    from services.recommendations import rebuild_neighbors
+
+    engine = make_engine(args.db, args.profile or 'bulk-load')
+    snapshot = None
+    if args.snapshot:
+        from services.columnar import Snapshot, SnapshotError
+        from services.snapshot import snapshot_status
+
+        try:
+            snapshot = Snapshot(args.snapshot)
+        except SnapshotError as error:
+            return fail(error)
+        with engine.connect() as connection:
+            status = snapshot_status(connection, snapshot)
+        if status['stale'] and not args.allow_stale:
+            return fail(f"{args.snapshot} is stale ({', '.join(status['changed'])} changed); write a new one or pass --allow-stale")
+    rebuild_neighbors(engine, args.k, args.block_size, log=print, snapshot=snapshot)
+    return 0
+
+
+def recommendations_update(args):
+    from services.recommendations import UPDATE_BATCH_SIZE, update_neighbors
+
+    engine = make_engine(args.db, args.profile or 'bulk-load')
+    applied = 0
+    # One short transaction per batch, so interests recorded meanwhile wait for one batch at most
+    while True:
+        with engine.begin() as connection:
+            batch = update_neighbors(connection, UPDATE_BATCH_SIZE)
+        applied += batch
+        if batch < UPDATE_BATCH_SIZE:
+            break
+    print(f"Applied {applied} new interests to the neighbour table")
+    return 0
+
+
+def snapshot_write(args):
+    from services.columnar import SnapshotError
+    from services.snapshot import write_snapshot
+
+    # The snapshot only reads the database
+    engine = make_engine(args.db, args.profile or 'read-replica')
+    try:
+        write_snapshot(engine, args.path, args.chunk_size, log=print)
+    except SnapshotError as error:
+        return fail(error)
+    return 0
+
+
+# Describe a snapshot and compare it with the database; exits with 1 when it is stale,
+# so scripts can run `snapshot status || snapshot write`
+def snapshot_status(args):
+    from services.columnar import Snapshot, SnapshotError
+    from services.snapshot import snapshot_status as compare
+
+    try:
+        snapshot = Snapshot(args.path)
+    except SnapshotError as error:
+        return fail(error)
+    engine = make_engine(args.db, args.profile or 'read-replica')
+    with engine.connect() as connection:
+        status = compare(connection, snapshot)
+    header = snapshot.header
+    if args.format == 'json':
+        import json
+
+        print(json.dumps(dict(status, path=snapshot.path, header=header), indent=2))
+    else:
+        from tabulate import tabulate
+
+        print(f"{snapshot.path}: {snapshot.properties} properties, {snapshot.interests} interests, "
+              f"written {snapshot.created_at} from {header['source']}")
+        print(tabulate(
+            [(name, spec['dtype'], spec['length']) for name, spec in header['columns'].items()],
+            headers=["Column", "Type", "Rows"],
+        ))
+        if status['stale']:
+            print(f"Stale: {', '.join(status['changed'])} changed since the snapshot was written")
+        else:
+            print("Up to date")
+    return 1 if status['stale'] else 0
+
+
+def migrations_status(args):
+    from db.migrations import checkpoints
+
+    engine = make_engine(args.db, args.profile)
+    with engine.connect() as connection:
+        rows = checkpoints(connection)
+    if not rows:
+        print("No online migration in progress")
+        return 0
+    write_pages([[
+        (row['name'], f"{row['position'] / max(row['end_position'], 1):.0%}", row['rows'], row['updated_at']) for row in rows
+    ]], ["Operation", "Done", "Rows", "Last Chunk"], 'table')
+    return 0
+
+
+def migrations_discard(args):
+    from db.migrations import discard_rebuild
+
+    engine = make_engine(args.db, args.profile)
+    with engine.begin() as connection:
+        discard_rebuild(connection, args.table)
+    print(f"Discarded the rebuild of {args.table}; `alembic upgrade` will start it over")
+    return 0
+
+
+# "BUYER_ID:PROPERTY_ID" (command line) or "BUYER_ID,PROPERTY_ID" (file line) as a pair of ints
+def parse_pair(text):
+    buyer_id, separator, property_id = text.strip().replace(',', ':').partition(':')
+    if not separator:
+        raise ValueError(f"Expected BUYER_ID:PROPERTY_ID, got {text.strip()!r}")
+    return int(buyer_id), int(property_id)
+
+
+# Pairs given on the command line followed by those read from --file ("-" for stdin).
+# Blank lines and a "buyer_id,property_id" header line are skipped.
+def _read_pairs(args):
+    pairs = [parse_pair(pair) for pair in args.pairs]
+    if args.file:
+        handle = sys.stdin if args.file == '-' else open(args.file, encoding='utf-8')
+        try:
+            for line in handle:
+                if line.strip() and not line.lstrip().startswith('buyer_id'):
+                    pairs.append(parse_pair(line))
+        finally:
+            if handle is not sys.stdin:
+                handle.close()
+    return pairs
+
+
+def interest_add_many(args):
+    try:
+        pairs = _read_pairs(args)
+    except ValueError as error:
+        return fail(error)
+    with open_session(args) as session:
+        report = record_interests(session, pairs)
+    for buyer_id, property_id, reason in report.rejected:
+        sys.stderr.write(f"Rejected {buyer_id}:{property_id}: {reason}\n")
+    print(report)
+    return 1 if report.rejected else 0
+
+
+def bulk_import(args):
+    from services.bulk_import import import_file
+
+    engine = make_engine(args.db, args.profile or 'bulk-load')
+    try:
+        report = import_file(engine, args.entity, args.path, args.file_format, args.chunk_size, args.rejects)
+    except OSError as error:
+        return fail(error)
+    print(report)
+    if report.rejected:
+        print(f"Rejected rows written to {args.rejects or args.path + '.rejects.jsonl'}")
+    return 0
+
+
+def export_table(args):
+    from services.export import export
+
+    # Exports only read, so they run with the read-only, large-cache profile by default
+    engine = make_engine(args.db, args.profile or 'read-replica')
+    count = export(engine, args.entity, args.output, args.export_format, args.joined, args.gzip, args.batch_size)
+    if args.output not in (None, '-'):
+        print(f"Exported {count} {args.entity} to {args.output}")
+    return 0
+
+
+def changes_status(args):
+    from services.replication import ReplicationError, check_change_log, log_status, pending_changes, read_replica_state
+
+    with open_connection(args) as connection:
+        try:
+            check_change_log(connection)
+            replica = read_replica_state(args.replica) if args.replica else None
+        except ReplicationError as error:
+            return fail(error)
+        status = log_status(connection)
+        if replica:
+            status['replica'] = dict(replica, path=args.replica, behind=pending_changes(connection, replica['position']))
+    if args.format == 'json':
+        import json
+
+        print(json.dumps(status, indent=2))
+        return 0
+    print(f"Last change:       {status['last_seq']}")
+    print(f"Entries kept:      {status['entries']}" + (f" (from {status['oldest_seq']})" if status['entries'] else ""))
+    print(f"Compacted through: {status['compacted_through']}")
+    if args.replica:
+        replica = status['replica']
+        print(f"Replica {replica['path']}: at change {replica['position']}, {replica['behind']} behind, "
+              f"last synced {replica['synced_at']}")
+    return 0
+
+
+# The change log entries after --after, as a feed for other consumers
+def changes_feed(args):
+    from services.replication import ReplicationError, check_change_log, iter_changes
+
+    with open_connection(args) as connection:
+        try:
+            check_change_log(connection)
+        except ReplicationError as error:
+            return fail(error)
+        pages = iter_changes(connection, args.after, args.page_size, args.limit)
+        write_pages(pages, ["Seq", "Table", "Operation", "Key", "Changed At"], args.format)
+    return 0
+
+
+def changes_sync(args):
+    from services.replication import ReplicationError, sync_replica
+
+    # The source is only read
+    engine = make_engine(args.db, args.profile or 'read-replica')
+    try:
+        result = sync_replica(engine, args.replica, args.batch_size, args.reseed, log=print if args.verbose else None)
+    except ReplicationError as error:
+        return fail(error)
+    print(result)
+    return 0
+
+
+# Drop superseded entries, and the entries up to --through or the lowest position of
+# the --replica files (every replica that syncs from the log should be named)
+def changes_compact(args):
+    from services.replication import ReplicationError, check_change_log, compact_log, read_replica_state
+
+    through = args.through
+    try:
+        for path in args.replica:
+            position = read_replica_state(path)['position']
+            through = position if through is None else min(through, position)
+    except ReplicationError as error:
+        return fail(error)
+    with open_connection(args) as connection:
+        try:
+            check_change_log(connection)
+        except ReplicationError as error:
+            return fail(error)
+        superseded, truncated, through = compact_log(connection, through)
+    message = f"Removed {superseded} superseded entries"
+    if through is not None:
+        message += f" and {truncated} entries through change {through}"
+    print(message)
+    return 0
+
+
+def check_plans(args):
+    from services.query_plans import main as query_plans_main
+
+    return query_plans_main(['--db', args.db] if args.db else [])
@@ -0,0 +1,304 @@
+# The interactive menu of the Real Estate Manager CLI.
+#
+# This module is only imported when the CLI is started without a subcommand
+# (see cli/main.py), so the database and the ORM are not loaded for scripted use.
+
+# Engine/session factory shared with Alembic: reads realestate.ini / REALESTATE_DB_* settings
+# and applies the tuning profile (WAL mode, pragmas, pool) to every connection.
+from db import make_engine, make_session_factory
+
+# Importing `tabulate` for formatting output in a tabular format in the CLI.
+from tabulate import tabulate
+
+# Keyset-paginated listings used by the "View All" options.
+from services.listing import page_through
+from services.search import search_properties, SORTS, DEFAULT_LIMIT
+# Checks and writes shared with the non-interactive subcommands.
+from services.records import (
+    RecordError, create_agent, create_property, create_buyer, buyer_interests, record_interest,
+)
+
+# The engine and the session factory used by the menu options.
+# They are created by `connect()` when the menu starts, not at import time.
+#
+# Every menu option is one unit of work: options that write open their own session
+# (`with Session() as session:`), which is closed, and its identity map emptied, when
+# the option returns; options that only read run Core statements on a connection
+# and load no ORM objects at all. Nothing is kept between options, so memory does
+# not grow with the number of options run, and a failed option cannot leave a
+# broken transaction behind for the next one.
+engine = None
+Session = None
+
+
+# Creating an engine that connects to the SQLite database and a session factory on it.
+# By default the database is `real_estate.db` (created if it doesn't exist), opened with
+# the "interactive" profile; both can be changed through realestate.ini, the environment
+# or the --db/--profile options of cli/main.py.
+def connect(url=None, profile=None):
+    global engine, Session
+    engine = make_engine(url, profile)
+
+    # sessionmaker is a factory for session objects.
+    # Sessions are the intermediate between the Python code and the database,
+    # allowing you to query, add, and commit changes. Objects are not expired on
+    # commit, so the confirmation messages can show them without another query.
+    Session = make_session_factory(engine, expire_on_commit=False)
+    return Session
+
+# Function to display the main menu of the CLI.
+# It prints the available options for the user to interact with the system.
+def display_menu():
+    print("\nReal Estate Manager CLI")
+    print("1. Add Agent")
+    print("2. Add Property")
+    print("3. Add Buyer")
+    print("4. View All Agents")
+    print("5. View All Properties")
+    print("6. View All Buyers")
+    print("7. Express Interest in Property")  # New option for many-to-many relationship
+    print("8. View Buyer's Interested Properties")  # New option to view many-to-many relationship
+    print("9. Search Properties")
+    print("10. Recommend Properties for Buyer")
+    print("11. Exit")
+
+
+# Function to add a new agent to the system.
+# It takes the agent's name and phone number as input and creates a new Agent object.
+def add_agent():
+    # User input for the agent's name and phone number
+    name = input("Enter agent name: ")
+    phone = input("Enter agent phone: ")
+
+    # Create the agent and commit it to the database
+    try:
+        with Session() as session:
+            create_agent(session, name, phone)
+    except RecordError as error:
+        print(f"Error: {error}")
+        return
+
+    print("Agent added successfully.")  # Confirmation message for the user
+
+# Function to add a new property to the system.
+# It takes the property's name, price, and associated agent's ID as input and creates a new Property object.
+def add_property():
+    # User input for the property's name, price, and the ID of the agent managing it
+    name = input("Enter property name: ").strip()
+    if not name:
+        print("Error: Property name cannot be empty.")
+        return
+
+    try:
+        price = int(input("Enter property price: "))  # Ensuring price is an integer
+        if price <= 0:
+            print("Error: Price must be a positive integer.")
+            return
+    except ValueError:
+        print("Error: Invalid input for price. Please enter a valid integer.")
+        return
+
+    try:
+        agent_id = int(input("Enter agent ID: "))  # Ensuring agent ID is an integer
+    except ValueError:
+        print("Error: Invalid input for agent ID. Please enter a valid integer.")
+        return
+
+    # Create the property linked to the agent (the agent must exist) and commit it
+    try:
+        with Session() as session:
+            create_property(session, name, price, agent_id)
+    except RecordError as error:
+        print(f"Error: {error}")
+        return
+
+    print("Property added successfully.")  # Confirmation message for the user
+
+# Function to add a new buyer to the system.
+# It takes the buyer's name and email as input and creates a new Buyer object.
+
+def add_buyer():
+    # User input for the buyer's name and email address
+    name = input("Enter buyer name: ")
+    email = input("Enter buyer email: ")
+
+    # Create the buyer (valid, not yet registered email) and commit it
+    try:
+        with Session() as session:
+            create_buyer(session, name, email)
+    except RecordError as error:
+        print(f"Error: {error}")
+        return
+
+    print("Buyer added successfully.")  # Confirmation message for the user
+
+# Function to display all agents currently stored in the system.
+# Agents are fetched one page at a time (keyset pagination on the primary key)
+# and each page is printed as soon as it arrives.
+def view_all_agents():
+    with engine.connect() as connection:
+        page_through(connection, 'agents')
+
+# Function to display all properties currently stored in the system.
+# Properties are fetched and printed page by page, so memory stays flat
+# however many listings there are.
+def view_all_properties():
+    with engine.connect() as connection:
+        page_through(connection, 'properties')
+
+# Function to display all buyers currently stored in the system.
+# Buyers are fetched and printed page by page.
+def view_all_buyers():
+    with engine.connect() as connection:
+        page_through(connection, 'buyers')
+
+def express_interest_in_property():
+    try:
+        buyer_id = int(input("Enter buyer ID: "))
+        property_id = int(input("Enter property ID: "))
+    except ValueError:
+        print("Error: Please enter a valid integer ID.")
+        return
+
+    # Both the buyer and the property must exist
+    try:
+        with Session() as session:
+            buyer, property = record_interest(session, buyer_id, property_id)
+    except RecordError as error:
+        print(f"Error: {error}")
+        return
+
+    print(f"Buyer {buyer.name} is now interested in property {property.name}.")
+
+def view_buyer_interested_properties():
+    try:
+        buyer_id = int(input("Enter buyer ID: "))
+    except ValueError:
+        print("Error: Please enter a valid integer ID.")
+        return
+
+    # Check if the buyer exists and fetch the properties they are interested in
+    try:
+        with engine.connect() as connection:
+            buyer, rows = buyer_interests(connection, buyer_id)
+    except RecordError as error:
+        print(f"Error: {error}")
+        return
+
+    # Print out all the properties this buyer is interested in
+    if rows:
+        print(f"Buyer {buyer.name} is interested in the following properties:")
+        print(tabulate(rows, headers=["ID", "Name", "Price"]))
+    else:
+        print(f"Buyer {buyer.name} is not interested in any properties yet.")
+
+# Reads an optional integer from the user; an empty answer means "no filter".
+# Returns (value, ok) so invalid input can be reported to the user.
+def read_optional_int(prompt):
+    answer = input(prompt).strip()
+    if not answer:
+        return None, True
+    try:
+        return int(answer), True
+    except ValueError:
+        print("Error: Please enter a valid integer or leave it empty.")
+        return None, False
+
+# Function to search properties by name, price range and agent.
+# Every filter is optional; only the top results are fetched and printed.
+def search_for_properties():
+    text = input("Search property name (leave empty for any): ").strip()
+
+    min_price, ok = read_optional_int("Minimum price (optional): ")
+    if not ok:
+        return
+    max_price, ok = read_optional_int("Maximum price (optional): ")
+    if not ok:
+        return
+    agent_id, ok = read_optional_int("Agent ID (optional): ")
+    if not ok:
+        return
+
+    sort = input(f"Sort by ({', '.join(SORTS)}) [default: {'relevance' if text else 'price'}]: ").strip() or None
+    if sort is not None and sort not in SORTS:
+        print("Error: Unknown sort order.")
+        return
+
+    limit, ok = read_optional_int(f"Number of results [default: {DEFAULT_LIMIT}]: ")
+    if not ok:
+        return
+
+    with engine.connect() as connection:
+        results = search_properties(connection, text, min_price, max_price, agent_id, sort, limit or DEFAULT_LIMIT)
+    if results:
+        print(tabulate(results, headers=["ID", "Name", "Price", "Agent ID"]))
+    else:
+        print("No properties match your search.")
+
+
+# Function to recommend properties to a buyer from what buyers with similar
+# interests wanted, within the price range the buyer has been looking at.
+def recommend_for_buyer():
+    # Imported here so the menu starts without loading the recommendation code
+    from services.recommendations import RECOMMENDATION_HEADERS, recommend_properties
+
+    try:
+        buyer_id = int(input("Enter buyer ID: "))
+    except ValueError:
+        print("Error: Please enter a valid integer ID.")
+        return
+
+    try:
+        with engine.connect() as connection:
+            buyer, rows = recommend_properties(connection, buyer_id)
+    except RecordError as error:
+        print(f"Error: {error}")
+        return
+
+    if rows:
+        print(f"Properties recommended for {buyer.name}:")
+        print(tabulate(rows, headers=RECOMMENDATION_HEADERS))
+    else:
+        print(f"No recommendations for {buyer.name} yet; they need to express interest in some properties first.")
+
+
+# The main function that controls the flow of the application.
+# It continuously displays the menu and executes the corresponding function based on user input.
+# `run` calls each chosen menu action; cli/main.py passes one that profiles it
+def main(run=None):
+    if engine is None:
+        connect()
+    run = run or (lambda action: action())
+
+    while True:  # Loop to keep the CLI running until the user chooses to exit
+        display_menu()  # Display the menu options
+        
+        # Get user input (menu option)
+        choice = input("Enter choice: ")
+        
+        # Based on the user's choice, call the corresponding function
+        if choice == '1':
+            run(add_agent)
+        elif choice == '2':
+            run(add_property)
+        elif choice == '3':
+            run(add_buyer)
+        elif choice == '4':
+            run(view_all_agents)
+        elif choice == '5':
+            run(view_all_properties)
+        elif choice == '6':
+            run(view_all_buyers)
+        elif choice == '7':
+            run(express_interest_in_property)  # Call the new function to express interest
+        elif choice == '8':
+            run(view_buyer_interested_properties)  # Call the new function to view interested properties
+        elif choice == '9':
+            run(search_for_properties)
+        elif choice == '10':
+            run(recommend_for_buyer)
+        elif choice == '11':
+            print("Exiting...")
+            break
+        else:
+            print("Invalid choice, please try again.")
@@ -1,242 +1,376 @@
 import sys
 import os
-import re
 
 # sys.path.append adds the parent directory to the system path.
 # This is necessary because the `models` folder is located in the parent directory.
 # Without this, Python wouldn't be able to locate and import the `models` package.
 sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
 
-# Importing necessary components from SQLAlchemy
-from sqlalchemy import create_engine  # Used to create a connection to the SQLite database
-from sqlalchemy.orm import sessionmaker  # Used to create session objects for DB transactions
-
-# Importing the Base class and ORM models (Agent, Property, Buyer) from the `models` package.
-# These models represent the database tables.
-from models import Base, Agent, Property, Buyer
-
-# Importing `tabulate` for formatting output in a tabular format in the CLI.
-from tabulate import tabulate
-
-# Creating an engine that connects to the SQLite database.
-# The database is named `real_estate.db` and will be created if it doesn't exist.
-engine = create_engine('sqlite:///real_estate.db')
-
-# Binds the engine to the Base class, allowing the models defined in Base
-# (Agent, Property, Buyer) to interact with the database schema.
-Base.metadata.bind = engine
-
-# sessionmaker is a factory for session objects.
-# Sessions are the intermediate between the Python code and the database,
-# allowing you to query, add, and commit changes.
-DBSession = sessionmaker(bind=engine)
-
-# Creating a new session to start interacting with the database.
-session = DBSession()
-
-# Function to display the main menu of the CLI.
-# It prints the available options for the user to interact with the system.
-def display_menu():
-    print("\nReal Estate Manager CLI")
-    print("1. Add Agent")
-    print("2. Add Property")
-    print("3. Add Buyer")
-    print("4. View All Agents")
-    print("5. View All Properties")
-    print("6. View All Buyers")
-    print("7. Express Interest in Property")  # New option for many-to-many relationship
-    print("8. View Buyer's Interested Properties")  # New option to view many-to-many relationship
-    print("9. Exit")
-
-
-# Function to add a new agent to the system.
-# It takes the agent's name and phone number as input and creates a new Agent object.
-def add_agent():
-    # User input for the agent's name and phone number
-    name = input("Enter agent name: ")
-    phone = input("Enter agent phone: ")
-    
-    # Create a new Agent object using the input data
-    new_agent = Agent(name=name, phone=phone)
-    
-    # Add the new Agent object to the session (staging it for committing to the DB)
-    session.add(new_agent)
-    
-    # Commit the session to persist the new agent into the database
-    session.commit()
-    
-    print("Agent added successfully.")  # Confirmation message for the user
-
-# Function to add a new property to the system.
-# It takes the property's name, price, and associated agent's ID as input and creates a new Property object.
-def add_property():
-    # User input for the property's name, price, and the ID of the agent managing it
-    name = input("Enter property name: ").strip()
-    if not name:
-        print("Error: Property name cannot be empty.")
-        return
+# Only the standard library is imported here. SQLAlchemy, the models and `tabulate`
+# are imported by the module that runs the chosen command, so `--help` and trivial
+# commands start without loading them (see bench/startup.py).
+import argparse
+import importlib
+
+from cli.output import FORMATS
+from db.engine import PROFILES
+from db.shards import ShardError, check_shards, load_shards, shard_url
+
+
+# Attach a handler to a subcommand parser. Handlers are given as "module:function"
+# and only imported when that subcommand runs (or as a function defined here).
+# `sharded` is the handler that runs the command on every regional shard at once
+# (cli/sharded.py); commands without one need --region when shards are configured.
+def set_handler(parser, handler, sharded=None):
+    parser.set_defaults(handler=handler, sharded_handler=sharded)
+
+
+def add_format_option(parser):
+    parser.add_argument('--format', choices=FORMATS, default='table', help="output format (default: table)")
+
+
+def add_listing_options(parser):
+    add_format_option(parser)
+    parser.add_argument('--page-size', type=int, default=500, help="rows fetched per page (default: 500)")
+    parser.add_argument('--after-id', type=int, help="start after this id (keyset pagination)")
+    parser.add_argument('--limit', type=int, help="stop after this many rows")
+
+
+# argparse type for comma-separated numbers, e.g. "0.1,0.5,0.9"
+def number_list(convert):
+    def parse(text):
+        try:
+            return [convert(item) for item in text.split(',') if item.strip()]
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"expected comma-separated numbers, got {text!r}")
+    return parse
+
+
+# Build the argparse parser for the non-interactive subcommands, e.g.
+#   python cli/main.py property list --format json
+#   python cli/main.py property search --text "sea view" --max-price 5000000
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='realestate',
+        description="Real Estate Manager. Run without arguments for the interactive menu.",
+    )
+    parser.add_argument('--db', help="database URL (default: realestate.ini / REALESTATE_DB_URL / sqlite:///real_estate.db)")
+    parser.add_argument('--profile', choices=list(PROFILES), help="engine tuning profile")
+    parser.add_argument('--region', help="run on this region's shard (see [shards] in realestate.ini / REALESTATE_DB_SHARDS)")
+    # Query profiling (see db/instrumentation.py). Every menu action of the interactive
+    # mode is profiled as a command of its own.
+    parser.add_argument('--sql-profile', action='store_true', help="print the command's query count, SQL time, rows and slowest statements on stderr")
+    parser.add_argument('--cprofile', metavar='FILE', help="run the command under cProfile and save the stats to FILE ('-' prints the top functions)")
+    parser.add_argument('--slow-log', metavar='FILE', default=os.environ.get('REALESTATE_SLOW_LOG'), help="append statements slower than --slow-ms to FILE as JSON Lines (default: $REALESTATE_SLOW_LOG)")
+    parser.add_argument('--slow-ms', type=float, default=float(os.environ.get('REALESTATE_SLOW_MS', 100)), help="slow-query threshold in ms (default: $REALESTATE_SLOW_MS or 100)")
+    parser.add_argument('--repeat-threshold', type=int, default=20, help="warn of a possible N+1 when one statement runs more often than this in a command (default: 20)")
+    commands = parser.add_subparsers(dest='command', metavar='COMMAND')
+
+    # realestate agent ...
+    agent = commands.add_parser('agent', help="add or list agents, report on their portfolios").add_subparsers(dest='action', metavar='ACTION', required=True)
+    add = agent.add_parser('add', help="add an agent")
+    add.add_argument('--name', required=True)
+    add.add_argument('--phone', required=True)
+    add_format_option(add)
+    set_handler(add, 'cli.commands:agent_add')
+    listing = agent.add_parser('list', help="list agents")
+    add_listing_options(listing)
+    set_handler(listing, 'cli.commands:agent_list', 'cli.sharded:agent_list')
+    portfolio = agent.add_parser('portfolio', help="listings, inventory value and interested buyers per agent")
+    portfolio.add_argument('--agent-id', type=int, help="report on this agent only")
+    portfolio.add_argument('--sort', choices=['agent', 'listings', 'value', 'buyers'], default='value')
+    portfolio.add_argument('--limit', type=int)
+    portfolio.add_argument('--live', action='store_true', help="aggregate the base tables instead of the summary table")
+    add_format_option(portfolio)
+    set_handler(portfolio, 'cli.commands:agent_portfolio', 'cli.sharded:agent_portfolio')
+    rebuild = agent.add_parser('rebuild-portfolio', help="recompute the portfolio summary table from scratch")
+    set_handler(rebuild, 'cli.commands:agent_rebuild_portfolio')
+
+    # realestate property ...
+    prop = commands.add_parser('property', help="add, list or search properties").add_subparsers(dest='action', metavar='ACTION', required=True)
+    add = prop.add_parser('add', help="add a property")
+    add.add_argument('--name', required=True)
+    add.add_argument('--price', type=int, required=True)
+    add.add_argument('--agent-id', type=int, required=True)
+    add_format_option(add)
+    set_handler(add, 'cli.commands:property_add')
+    listing = prop.add_parser('list', help="list properties")
+    add_listing_options(listing)
+    set_handler(listing, 'cli.commands:property_list', 'cli.sharded:property_list')
+    search = prop.add_parser('search', help="search properties by name, price and agent")
+    search.add_argument('--text', help="words to look for in the property name")
+    search.add_argument('--min-price', type=int)
+    search.add_argument('--max-price', type=int)
+    search.add_argument('--agent-id', type=int)
+    search.add_argument('--sort', choices=['price', 'price-desc', 'newest', 'relevance'])
+    search.add_argument('--limit', type=int, default=20)
+    add_format_option(search)
+    set_handler(search, 'cli.commands:property_search', 'cli.sharded:property_search')
+    stats = prop.add_parser('stats', help="price quantiles, histogram by price band, per-agent distributions and outliers")
+    stats.add_argument('--quantiles', type=number_list(float), help="comma-separated, e.g. 0.1,0.5,0.9 (default: 0.01,0.1,0.25,0.5,0.75,0.9,0.99)")
+    stats.add_argument('--bands', type=number_list(int), help="comma-separated lower edges of the price bands of the histogram")
+    stats.add_argument('--by-agent', action='store_true', help="add the price distribution of every agent")
+    stats.add_argument('--outliers', action='store_true', help="count listings beyond --iqr-factor interquartile ranges from Q1/Q3")
+    stats.add_argument('--iqr-factor', type=float, default=1.5)
+    stats.add_argument('--approx', action='store_true', help="one unordered pass with a quantile sketch instead of exact quantiles")
+    stats.add_argument('--accuracy', type=float, default=0.01, help="relative error of the approximate quantiles (default: 0.01, at least 2.1e-05)")
+    stats.add_argument('--chunk-size', type=int, default=100000, help="rows read per chunk (default: 100000)")
+    stats.add_argument('--no-cache', action='store_true', help="recompute even if no listing changed since the last report")
+    stats.add_argument('--format', choices=['table', 'json'], default='table')
+    set_handler(stats, 'cli.commands:property_stats', 'cli.sharded:property_stats')
+
+    # realestate buyer ...
+    buyer = commands.add_parser('buyer', help="add or list buyers, show their interests and recommendations").add_subparsers(dest='action', metavar='ACTION', required=True)
+    add = buyer.add_parser('add', help="add a buyer")
+    add.add_argument('--name', required=True)
+    add.add_argument('--email', required=True)
+    add_format_option(add)
+    set_handler(add, 'cli.commands:buyer_add')
+    listing = buyer.add_parser('list', help="list buyers")
+    add_listing_options(listing)
+    set_handler(listing, 'cli.commands:buyer_list', 'cli.sharded:buyer_list')
+    interests = buyer.add_parser('interests', help="properties a buyer is interested in")
+    interests.add_argument('buyer_id', type=int)
+    add_format_option(interests)
+    set_handler(interests, 'cli.commands:buyer_interests')
+    recommend = buyer.add_parser('recommend', help="properties wanted by buyers with similar interests")
+    recommend.add_argument('buyer_id', type=int)
+    recommend.add_argument('--limit', type=int, default=10)
+    recommend.add_argument('--band', type=float, default=0.25, help="price band around the buyer's interests (default: 0.25)")
+    recommend.add_argument('--live', action='store_true', help="count co-interest from the interest table instead of the neighbour table")
+    add_format_option(recommend)
+    set_handler(recommend, 'cli.commands:buyer_recommend')
+
+    # realestate interest ...
+    interest = commands.add_parser('interest', help="record buyer interest in properties").add_subparsers(dest='action', metavar='ACTION', required=True)
+    add = interest.add_parser('add', help="record that a buyer is interested in a property")
+    add.add_argument('--buyer-id', type=int, required=True)
+    add.add_argument('--property-id', type=int, required=True)
+    add_format_option(add)
+    set_handler(add, 'cli.commands:interest_add')
+    many = interest.add_parser('add-many', help="record many interests in one transaction, skipping duplicates")
+    many.add_argument('pairs', nargs='*', metavar='BUYER_ID:PROPERTY_ID')
+    many.add_argument('--file', help="read more pairs, one 'buyer_id,property_id' per line, from this file ('-' for stdin)")
+    set_handler(many, 'cli.commands:interest_add_many')
+
+    # realestate recommendations ...
+    recommendations = commands.add_parser('recommendations', help="maintain the co-interest neighbour table").add_subparsers(dest='action', metavar='ACTION', required=True)
+    rebuild = recommendations.add_parser('rebuild', help="recompute the neighbour table from all interests")
+    rebuild.add_argument('--k', type=int, default=20, help="neighbours kept per property (default: 20)")
+    rebuild.add_argument('--block-size', type=int, help="properties per block of the sparse matrix product")
+    rebuild.add_argument('--snapshot', metavar='PATH', help="map the interests from this listing snapshot instead of reading the database")
+    rebuild.add_argument('--allow-stale', action='store_true', help="use the snapshot even if the database changed since it was written")
+    set_handler(rebuild, 'cli.commands:recommendations_rebuild')
+    refresh = recommendations.add_parser('update', help="fold interests recorded since the last rebuild/update into the table")
+    set_handler(refresh, 'cli.commands:recommendations_update')
+
+    # realestate snapshot ...
+    snapshot = commands.add_parser('snapshot', help="write or check the memory-mapped listing snapshot used by analytics").add_subparsers(dest='action', metavar='ACTION', required=True)
+    write = snapshot.add_parser('write', help="copy property ids, prices, agents and interests into a columnar snapshot file")
+    write.add_argument('path', nargs='?', default=os.environ.get('REALESTATE_SNAPSHOT', 'listings.snapshot'), help="snapshot file (default: $REALESTATE_SNAPSHOT or listings.snapshot)")
+    write.add_argument('--chunk-size', type=int, default=100000, help="rows read per chunk (default: 100000)")
+    set_handler(write, 'cli.commands:snapshot_write')
+    status = snapshot.add_parser('status', help="describe a snapshot; exits with 1 if the database changed since it was written")
+    status.add_argument('path', nargs='?', default=os.environ.get('REALESTATE_SNAPSHOT', 'listings.snapshot'))
+    status.add_argument('--format', choices=['table', 'json'], default='table')
+    set_handler(status, 'cli.commands:snapshot_status')
+
+    # realestate migrations ...
+    migrations = commands.add_parser('migrations', help="follow or abandon chunked online migrations (db/migrations.py)").add_subparsers(dest='action', metavar='ACTION', required=True)
+    status = migrations.add_parser('status', help="show the progress of interrupted or running online migrations")
+    set_handler(status, 'cli.commands:migrations_status')
+    discard = migrations.add_parser('discard', help="drop the partial copy of an interrupted table rebuild instead of resuming it")
+    discard.add_argument('table')
+    set_handler(discard, 'cli.commands:migrations_discard')
+
+    # realestate changes ...
+    changes = commands.add_parser('changes', help="follow the change log and refresh read replicas from it").add_subparsers(dest='action', metavar='ACTION', required=True)
+    status = changes.add_parser('status', help="show the change log, and how far behind a replica is")
+    status.add_argument('--replica', default=os.environ.get('REALESTATE_REPLICA'), help="replica database file to report on (default: $REALESTATE_REPLICA)")
+    status.add_argument('--format', choices=['table', 'json'], default='table')
+    set_handler(status, 'cli.commands:changes_status')
+    feed = changes.add_parser('feed', help="list the inserts, updates and deletes logged after a sequence number")
+    feed.add_argument('--after', type=int, default=0, help="sequence number to start after (default: 0)")
+    feed.add_argument('--limit', type=int)
+    feed.add_argument('--page-size', type=int, default=1000, help="entries fetched per query (default: 1000)")
+    add_format_option(feed)
+    set_handler(feed, 'cli.commands:changes_feed')
+    sync = changes.add_parser('sync', help="apply the changes logged since a replica's last sync, seeding it first if missing")
+    sync.add_argument('replica', nargs='?', default=os.environ.get('REALESTATE_REPLICA', 'replica.db'), help="replica database file (default: $REALESTATE_REPLICA or replica.db)")
+    sync.add_argument('--batch-size', type=int, default=5000, help="changes applied per replica transaction (default: 5000)")
+    sync.add_argument('--reseed', action='store_true', help="replace the replica with a new full copy first")
+    sync.add_argument('--verbose', '-v', action='store_true', help="report every batch")
+    set_handler(sync, 'cli.commands:changes_sync')
+    compact = changes.add_parser('compact', help="drop superseded log entries, and those every replica has applied")
+    compact.add_argument('--replica', action='append', default=[], help="replica whose position bounds the entries dropped (repeat for each replica)")
+    compact.add_argument('--through', type=int, help="drop every entry up to this sequence number")
+    set_handler(compact, 'cli.commands:changes_compact')
+
+    # realestate import ...
+    bulk = commands.add_parser('import', help="bulk import a CSV or JSON Lines file")
+    bulk.add_argument('entity', choices=['agents', 'buyers', 'interests', 'properties'])
+    bulk.add_argument('path')
+    bulk.add_argument('--format', choices=['csv', 'jsonl'], dest='file_format')
+    bulk.add_argument('--chunk-size', type=int, default=5000)
+    bulk.add_argument('--rejects', help="where to write rejected rows (default: <path>.rejects.jsonl)")
+    set_handler(bulk, 'cli.commands:bulk_import')
+
+    # realestate export ...
+    export = commands.add_parser('export', help="stream a table to CSV or JSON Lines")
+    export.add_argument('entity', choices=['agents', 'buyers', 'interests', 'properties'])
+    export.add_argument('--format', choices=['csv', 'jsonl'], default='csv', dest='export_format')
+    export.add_argument('--output', '-o', help="file to write (default: stdout)")
+    export.add_argument('--gzip', action='store_true', help="gzip the output (implied by a .gz file name)")
+    export.add_argument('--joined', action='store_true', help="add agent names and interest counts (properties) or buyer/property names (interests)")
+    export.add_argument('--batch-size', type=int, default=10000, help="rows fetched from the cursor at a time")
+    set_handler(export, 'cli.commands:export_table', 'cli.sharded:export_table')
+
+    # realestate serve
+    serve = commands.add_parser('serve', help="serve the operations as a local HTTP/JSON API")
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, default=8080, help="port to listen on (0 picks a free one)")
+    serve.add_argument('--max-batch', type=int, help="most writes committed per transaction")
+    set_handler(serve, 'api.server:serve_command')
+
+    # realestate shards
+    shards = commands.add_parser('shards', help="list the regional shards with their row counts and schema revision")
+    add_format_option(shards)
+    set_handler(shards, 'cli.sharded:shards_status', 'cli.sharded:shards_status')
+
+    # realestate check-plans / config
+    plans = commands.add_parser('check-plans', help="fail if any CLI query regresses to a table scan")
+    set_handler(plans, 'cli.commands:check_plans')
+    config = commands.add_parser('config', help="show the database configuration in use")
+    set_handler(config, show_config, show_config)
 
+    return parser
+
+
+# Trivial command: print the resolved database settings without opening the database
+def show_config(args):
+    from db.engine import load_config
+
+    config = load_config()
+    print(f"url:     {args.db or config.url}")
+    print(f"profile: {args.profile or config.profile}")
+    for name, value in sorted(config.pragmas.items()):
+        print(f"{name}: {value}")
+    for region, url in load_shards().items():
+        print(f"shard {region}: {url}")
+    return 0
+
+
+# With regional shards configured (db/shards.py), point --db at the shard chosen with
+# --region, or pick the handler running the command on every shard. An explicit --db
+# bypasses the shards. Returns the handler to run.
+def route(args, handler, sharded=None):
+    if args.db is not None:
+        return handler
+    shards = load_shards()
+    if args.region is not None:
+        if not shards:
+            raise ShardError("--region needs shards: configure them in [shards] of realestate.ini or REALESTATE_DB_SHARDS")
+        args.db = shard_url(shards, args.region)
+        check_shards({args.region: args.db})
+        return handler
+    if not shards:
+        return handler
+    if sharded is None:
+        raise ShardError(f"This command works on one shard: choose one with --region ({', '.join(shards)})")
+    return sharded
+
+
+# Import the "module:function" handler of the chosen subcommand and run it
+def run_command(args):
     try:
-        price = int(input("Enter property price: "))  # Ensuring price is an integer
-        if price <= 0:
-            print("Error: Price must be a positive integer.")
-            return
-    except ValueError:
-        print("Error: Invalid input for price. Please enter a valid integer.")
-        return
+        handler = route(args, args.handler, args.sharded_handler)
+        if isinstance(handler, str):
+            module_name, function_name = handler.split(':')
+            handler = getattr(importlib.import_module(module_name), function_name)
+        if profiling(args):
+            name = ' '.join(filter(None, [args.command, getattr(args, 'action', None)]))
+            return run_profiled(args, name, lambda: handler(args))
+        return handler(args)
+    except ShardError as error:
+        print(f"Error: {error}", file=sys.stderr)
+        return 1
+
+
+def profiling(args):
+    return bool(args.sql_profile or args.cprofile or args.slow_log)
+
+
+# Run `call` as the command `name` with the SQL instrumentation on (and cProfile with
+# --cprofile), then print the summary (--sql-profile) and any N+1 warnings on stderr
+def run_profiled(args, name, call):
+    from db.instrumentation import SlowQueryLog, instrumented
+
+    slow_log = SlowQueryLog(args.slow_log, args.slow_ms) if args.slow_log else None
+    profiler = None
+    if args.cprofile:
+        import cProfile
 
+        profiler = cProfile.Profile()
     try:
-        agent_id = int(input("Enter agent ID: "))  # Ensuring agent ID is an integer
-        # Check if the agent ID exists in the database
-        agent = session.query(Agent).filter_by(id=agent_id).first()
-        if not agent:
-            print("Error: No agent found with the given ID.")
-            return
-    except ValueError:
-        print("Error: Invalid input for agent ID. Please enter a valid integer.")
-        return
-    # Create a new Property object with the input values, linking it to the agent by agent_id
-    new_property = Property(name=name, price=price, agent_id=agent_id)
-    
-    # Add the new Property object to the session (staging it for committing to the DB)
-    session.add(new_property)
-    
-    # Commit the session to persist the new property into the database
-    session.commit()
-    
-    print("Property added successfully.")  # Confirmation message for the user
-
-# Function to add a new buyer to the system.
-# It takes the buyer's name and email as input and creates a new Buyer object.
-
-def is_valid_email(email):
-    regex = r'^\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b'
-    return re.match(regex, email)
-
-def add_buyer():
-    # User input for the buyer's name and email address
-    name = input("Enter buyer name: ")
-    email = input("Enter buyer email: ")
-    if not is_valid_email(email):
-        print("Error: Invalid email format.")
-        return
-    
-    # Create a new Buyer object using the input data
-    new_buyer = Buyer(name=name, email=email)
-    
-    # Add the new Buyer object to the session (staging it for committing to the DB)
-    session.add(new_buyer)
-    
-    # Commit the session to persist the new buyer into the database
-    session.commit()
-    
-    print("Buyer added successfully.")  # Confirmation message for the user
-
-# Function to display all agents currently stored in the system.
-# It queries the database for all Agent objects and prints them in a table format.
-def view_all_agents():
-    # Query the session to retrieve all Agent objects from the database
-    agents = session.query(Agent).all()
-    
-    # Display the agents in a tabular format (using tabulate)
-    # Each row contains the agent's ID, name, and phone number
-    print(tabulate([[agent.id, agent.name, agent.phone] for agent in agents], headers=["ID", "Name", "Phone"]))
-
-# Function to display all properties currently stored in the system.
-# It queries the database for all Property objects and prints them in a table format.
-def view_all_properties():
-    # Query the session to retrieve all Property objects from the database
-    properties = session.query(Property).all()
-    
-    # Display the properties in a tabular format (using tabulate)
-    # Each row contains the property's ID, name, price, and the ID of the agent managing it
-    print(tabulate([[prop.id, prop.name, prop.price, prop.agent_id] for prop in properties], headers=["ID", "Name", "Price", "Agent ID"]))
-
-# Function to display all buyers currently stored in the system.
-# It queries the database for all Buyer objects and prints them in a table format.
-def view_all_buyers():
-    # Query the session to retrieve all Buyer objects from the database
-    buyers = session.query(Buyer).all()
-    
-    # Display the buyers in a tabular format (using tabulate)
-    # Each row contains the buyer's ID, name, and email address
-    print(tabulate([[buyer.id, buyer.name, buyer.email] for buyer in buyers], headers=["ID", "Name", "Email"]))
-
-def express_interest_in_property():
-    buyer_id = int(input("Enter buyer ID: "))
-    
-    # Check if the buyer exists
-    buyer = session.query(Buyer).filter_by(id=buyer_id).first()
-    if not buyer:
-        print("Error: No buyer found with the given ID.")
-        return
+        with instrumented(name, slow_log=slow_log, repeat_threshold=args.repeat_threshold) as stats:
+            return profiler.runcall(call) if profiler else call()
+    finally:
+        lines = [stats.report()] if args.sql_profile else stats.warnings()
+        for line in lines:
+            print(line, file=sys.stderr)
+        if profiler is not None:
+            write_cprofile(profiler, args.cprofile)
 
-    property_id = int(input("Enter property ID: "))
-    
-    # Check if the property exists
-    property = session.query(Property).filter_by(id=property_id).first()
-    if not property:
-        print("Error: No property found with the given ID.")
-        return
 
-    # Add the property to the buyer's interested_properties list
-    buyer.interested_properties.append(property)
-    
-    # Commit the changes to the database
-    session.commit()
-    
-    print(f"Buyer {buyer.name} is now interested in property {property.name}.")
-
-def view_buyer_interested_properties():
-    buyer_id = int(input("Enter buyer ID: "))
-
-    # Check if the buyer exists
-    buyer = session.query(Buyer).filter_by(id=buyer_id).first()
-    if not buyer:
-        print("Error: No buyer found with the given ID.")
+# Save cProfile stats to `path` (for pstats/snakeviz), or print the top functions for '-'
+def write_cprofile(profiler, path, top=25):
+    if path != '-':
+        profiler.dump_stats(path)
         return
+    import pstats
+
+    pstats.Stats(profiler, stream=sys.stderr).sort_stats('cumulative').print_stats(top)
+
 
-    # Print out all the properties this buyer is interested in
-    if buyer.interested_properties:
-        print(f"Buyer {buyer.name} is interested in the following properties:")
-        print(tabulate([[prop.id, prop.name, prop.price] for prop in buyer.interested_properties], headers=["ID", "Name", "Price"]))
-    else:
-        print(f"Buyer {buyer.name} is not interested in any properties yet.")
-
-
-# The main function that controls the flow of the application.
-# It continuously displays the menu and executes the corresponding function based on user input.
-def main():
-    while True:  # Loop to keep the CLI running until the user chooses to exit
-        display_menu()  # Display the menu options
-        
-        # Get user input (menu option)
-        choice = input("Enter choice: ")
-        
-        # Based on the user's choice, call the corresponding function
-        if choice == '1':
-            add_agent()
-        elif choice == '2':
-            add_property()
-        elif choice == '3':
-            add_buyer()
-        elif choice == '4':
-            view_all_agents()
-        elif choice == '5':
-            view_all_properties()
-        elif choice == '6':
-            view_all_buyers()
-        elif choice == '7':
-            express_interest_in_property()  # Call the new function to express interest
-        elif choice == '8':
-            view_buyer_interested_properties()  # Call the new function to view interested properties
-        elif choice == '9':
-            print("Exiting...")
-            break
+# The main function: without arguments it starts the interactive menu,
+# otherwise it runs the requested subcommand and returns its exit code.
+# Output piped into a command that stops reading (`| head`) ends the command quietly:
+# stdout is pointed at devnull so the interpreter's final flush does not fail again
+def main(argv=None):
+    try:
+        status = _main(argv)
+        # Flushed here, so a closed pipe is caught below instead of at interpreter exit
+        sys.stdout.flush()
+        return status
+    except BrokenPipeError:
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        return 1
+
+
+def _main(argv):
+    argv = sys.argv[1:] if argv is None else argv
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    if args.command is None:
+        try:
+            route(args, handler=None)
+        except ShardError as error:
+            print(f"Error: {error}", file=sys.stderr)
+            return 1
+        from cli import interactive
+
+        interactive.connect(args.db, args.profile)
+        if profiling(args):
+            interactive.main(run=lambda action: run_profiled(args, action.__name__.replace('_', ' '), action))
         else:
-            print("Invalid choice, please try again.")
+            interactive.main()
+        return 0
+    return run_command(args)
+
 
 # This ensures that the `main()` function is only executed when the script is run directly
 # It prevents the function from being run if the script is imported as a module
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
@@ -0,0 +1,57 @@
+# Output formats for the non-interactive subcommands.
+#
+# Rows arrive as an iterable of pages (lists of tuples) and are written as they come,
+# so listings are streamed instead of being collected first. `tabulate` is only
+# imported for the table format.
+import csv
+import json
+import sys
+
+FORMATS = ('table', 'json', 'jsonl', 'csv')
+
+
+# Write `pages` (iterable of lists of row tuples) with column names `headers`
+# to `out` in the given format. Returns the number of rows written.
+def write_pages(pages, headers, output_format='table', out=None):
+    out = out or sys.stdout
+    keys = [header.lower().replace(' ', '_') for header in headers]
+    count = 0
+
+    if output_format == 'table':
+        from tabulate import tabulate
+
+        for rows in pages:
+            out.write(tabulate(rows, headers=headers) + "\n")
+            count += len(rows)
+    elif output_format == 'csv':
+        writer = csv.writer(out)
+        writer.writerow(keys)
+        for rows in pages:
+            writer.writerows(rows)
+            count += len(rows)
+    elif output_format == 'jsonl':
+        for rows in pages:
+            for row in rows:
+                out.write(json.dumps(dict(zip(keys, row))) + "\n")
+            count += len(rows)
+    elif output_format == 'json':
+        # A JSON array written element by element
+        out.write("[")
+        for rows in pages:
+            for row in rows:
+                out.write(("," if count else "") + "\n  " + json.dumps(dict(zip(keys, row))))
+                count += 1
+        out.write("\n]\n" if count else "]\n")
+    else:
+        raise ValueError(f"Unknown output format: {output_format}")
+    return count
+
+
+# Write a single record (dict) in the given format
+def write_record(record, output_format='table', out=None):
+    headers = [key.replace('_', ' ').title() for key in record]
+    if output_format == 'json':
+        out = out or sys.stdout
+        out.write(json.dumps(record, indent=2) + "\n")
+        return
+    write_pages([[tuple(record.values())]], headers, output_format, out)
@@ -0,0 +1,148 @@
+# Handlers of the subcommands that run on every regional shard at once.
+#
+# With shards configured (db/shards.py) and no --region, cli/main.py runs these
+# instead of the handlers of cli/commands.py. Each one sends its query to all shards
+# through a process pool (services/fanout.py) and combines the results as they come:
+# listings and exports are k-way merged on their keys and written page by page,
+# searches and portfolios merge the per-shard top rows, and price statistics combine
+# the partial aggregates of every shard. Rows gain a leading Region column, since ids
+# are only unique within a shard (an --agent-id or --after-id applies to every shard).
+import itertools
+import sys
+
+from db.shards import load_shards
+from services.fanout import ShardPool, merge, paginate
+from services.listing import LISTINGS, fetch_page
+
+from cli.output import write_pages
+
+
+# A pool over the configured shards; reads use the read-only profile by default
+def open_pool(args):
+    return ShardPool(load_shards(), args.profile or 'read-replica')
+
+
+def list_entity(args, entity):
+    with open_pool(args) as pool:
+        streams = pool.streams(fetch_page, (entity,), args.page_size, key=lambda row: row[0], after=args.after_id)
+        rows = merge(streams, key=lambda row: row[0])
+        write_pages(paginate(rows, args.page_size, args.limit), ["Region"] + LISTINGS[entity][2], args.format)
+    return 0
+
+
+def agent_list(args):
+    return list_entity(args, 'agents')
+
+
+def property_list(args):
+    return list_entity(args, 'properties')
+
+
+def buyer_list(args):
+    return list_entity(args, 'buyers')
+
+
+# The top --limit results of every shard, merged in the order of the chosen sort
+def property_search(args):
+    from services.search import MERGE_KEYS, resolve_sort, search_properties_ranked
+
+    sort = resolve_sort(args.text, args.sort)
+    with open_pool(args) as pool:
+        results = pool.map(
+            search_properties_ranked, args.text, args.min_price, args.max_price, args.agent_id, sort, args.limit,
+        )
+    rows = merge({region: [rows] for region, rows in results.items()}, MERGE_KEYS[sort])
+    # Drop the bm25 rank that relevance results carry for the merge
+    rows = [row[:5] for row in itertools.islice(rows, args.limit)]
+    write_pages([rows], ["Region", "ID", "Name", "Price", "Agent ID"], args.format)
+    return 0
+
+
+# Sort key of a portfolio row for each --sort, as portfolio_query() orders them
+PORTFOLIO_KEYS = {
+    'agent': lambda row: (row[0],),
+    'listings': lambda row: (-row[2], row[0]),
+    'value': lambda row: (-row[3], row[0]),
+    'buyers': lambda row: (-row[7], row[0]),
+}
+
+
+def agent_portfolio(args):
+    from services.analytics import PORTFOLIO_HEADERS, agent_portfolio
+
+    with open_pool(args) as pool:
+        results = pool.map(agent_portfolio, args.live, args.agent_id, args.sort, args.limit)
+    rows = merge({region: [rows] for region, rows in results.items()}, PORTFOLIO_KEYS[args.sort])
+    if args.limit is not None:
+        rows = itertools.islice(rows, args.limit)
+    write_pages([list(rows)], ["Region"] + PORTFOLIO_HEADERS, args.format)
+    return 0
+
+
+# Statistics over all shards: exact figures (count, mean, std, min, max, histogram)
+# and approximate quantiles from the merged sketches of the shards
+def property_stats(args):
+    from services.price_stats import DEFAULT_BANDS, DEFAULT_QUANTILES, StatisticsError, sharded_price_statistics
+
+    from cli.commands import fail, print_price_stats
+
+    if not args.approx:
+        sys.stderr.write(f"Across shards, quantiles are approximate (±{args.accuracy:.1%}, see --accuracy)\n")
+    try:
+        with open_pool(args) as pool:
+            report = sharded_price_statistics(
+                pool, args.quantiles or DEFAULT_QUANTILES, args.bands or DEFAULT_BANDS, args.by_agent, args.outliers,
+                args.accuracy, args.iqr_factor, args.chunk_size,
+            )
+    except StatisticsError as error:
+        return fail(error)
+    if args.format == 'json':
+        import json
+
+        print(json.dumps(report, indent=2))
+    else:
+        print_price_stats(report)
+    return 0
+
+
+# Every shard's rows, merged in key order, with a leading `region` column
+def export_table(args):
+    from services.export import export_key, export_page, export_query, output, write_rows
+
+    width = len(export_key(args.entity))
+
+    def key(row):
+        return tuple(row[:width])
+
+    keys = ['region'] + [column.key for column in export_query(args.entity, args.joined).selected_columns]
+    with open_pool(args) as pool, output(args.output, args.gzip) as out:
+        streams = pool.streams(export_page, (args.entity, args.joined), args.batch_size, key)
+        count = write_rows(out, keys, paginate(merge(streams, key), args.batch_size), args.export_format)
+    if args.output not in (None, '-'):
+        print(f"Exported {count} {args.entity} from {len(pool.shards)} shards to {args.output}")
+    return 0
+
+
+# Row counts and Alembic revision of one shard (run in the pool)
+def shard_summary(connection):
+    from sqlalchemy import func, inspect, select, text
+
+    from models import Agent, Property, Buyer, buyer_property_association
+
+    counts = [
+        connection.scalar(select(func.count()).select_from(table))
+        for table in (Agent.__table__, Property.__table__, Buyer.__table__, buyer_property_association)
+    ]
+    revision = None
+    if inspect(connection).has_table('alembic_version'):
+        revision = connection.scalar(text('SELECT version_num FROM alembic_version'))
+    return counts + [revision]
+
+
+def shards_status(args):
+    shards = load_shards()
+    with open_pool(args) as pool:
+        summaries = pool.map(shard_summary)
+    rows = [[region, shards[region]] + summary for region, summary in summaries.items()]
+    write_pages([rows], ["Region", "Database", "Agents", "Properties", "Buyers", "Interests", "Revision"], args.format)
+    return 0
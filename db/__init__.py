@@ -0,0 +1,3 @@
+# The db package holds the database plumbing shared by the CLI, the services and
+# Alembic: engine/session construction, connection tuning and related helpers.
+from .engine import DatabaseConfig, PROFILES, load_config, make_engine, make_async_engine, make_session_factory
@@ -0,0 +1,225 @@
+# Engine and session factory shared by the CLI, the services and alembic/env.py.
+#
+# Instead of a bare `create_engine('sqlite:///real_estate.db')`, engines are built from
+# a named tuning profile. Each profile sets SQLite pragmas on every new connection
+# (WAL journal, synchronous level, page cache, memory-mapped I/O, busy timeout) and
+# picks a connection pool suited to the workload.
+#
+# Settings are resolved in this order (later wins):
+#   1. built-in defaults (sqlite:///real_estate.db, "interactive" profile)
+#   2. a config file: $REALESTATE_DB_CONFIG, or ./realestate.ini if it exists
+#   3. environment variables: REALESTATE_DB_URL, REALESTATE_DB_PROFILE and
+#      REALESTATE_DB_<PRAGMA> (e.g. REALESTATE_DB_CACHE_SIZE=-131072)
+#   4. arguments passed to `make_engine()`
+#
+# Example realestate.ini:
+#   [database]
+#   url = sqlite:////var/lib/realestate/real_estate.db
+#   profile = interactive
+#   mmap_size = 1073741824
+#
+# SQLAlchemy is only imported when an engine is actually built, so reading the
+# configuration stays cheap for commands that never touch the database.
+import configparser
+import os
+
+DEFAULT_URL = 'sqlite:///real_estate.db'
+DEFAULT_PROFILE = 'interactive'
+DEFAULT_CONFIG_FILE = 'realestate.ini'
+
+# Pragmas that can be tuned through the config file or the environment
+PRAGMAS = ('journal_mode', 'synchronous', 'cache_size', 'mmap_size', 'busy_timeout', 'temp_store', 'query_only')
+
+# Named tuning profiles. `pragmas` are executed on every new connection, `pool` names
+# the pool class (see POOLS) and `pool_options` are passed on to create_engine().
+PROFILES = {
+    # The CLI and scripted commands: a few short transactions, readers must not
+    # block behind a writer.
+    'interactive': {
+        'pragmas': {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'cache_size': -65536,  # negative = KiB, i.e. 64 MiB of page cache
+            'mmap_size': 268435456,  # 256 MiB
+            'busy_timeout': 5000,  # ms to wait for a lock before "database is locked"
+            'temp_store': 'MEMORY',
+        },
+        'pool': 'queue',
+        'pool_options': {'pool_size': 5, 'max_overflow': 5},
+    },
+    # Imports and migrations: one long-lived writer connection with a big cache.
+    'bulk-load': {
+        'pragmas': {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'cache_size': -262144,  # 256 MiB
+            'mmap_size': 1073741824,  # 1 GiB
+            'busy_timeout': 30000,
+            'temp_store': 'MEMORY',
+        },
+        'pool': 'queue',
+        'pool_options': {'pool_size': 1, 'max_overflow': 0},
+    },
+    # Reporting and analytics on a copy of the database: many concurrent readers,
+    # writes refused at the connection level.
+    'read-replica': {
+        'pragmas': {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'cache_size': -131072,  # 128 MiB
+            'mmap_size': 1073741824,
+            'busy_timeout': 5000,
+            'temp_store': 'MEMORY',
+            'query_only': 'ON',
+        },
+        'pool': 'queue',
+        'pool_options': {'pool_size': 10, 'max_overflow': 10},
+    },
+    # SQLAlchemy/SQLite defaults (rollback journal, no pragmas), kept as a baseline
+    # for benchmarks.
+    'default': {
+        'pragmas': {},
+        'pool': None,
+        'pool_options': {},
+    },
+}
+
+# Pool classes selectable by name in profiles and the config file (pool = null)
+POOLS = {'queue': 'QueuePool', 'null': 'NullPool', 'static': 'StaticPool'}
+
+
+# Resolved database settings: which URL, which profile and any pragma/pool overrides
+class DatabaseConfig:
+    def __init__(self, url=DEFAULT_URL, profile=DEFAULT_PROFILE, pragmas=None, pool=None):
+        if profile not in PROFILES:
+            raise ValueError(f"Unknown database profile: {profile} (choose from {', '.join(PROFILES)})")
+        self.url = url
+        self.profile = profile
+        self.pragmas = dict(pragmas or {})
+        self.pool = pool
+
+    def __repr__(self):
+        return f"<DatabaseConfig(url={self.url}, profile={self.profile})>"
+
+
+# Parse the config file: `path`, $REALESTATE_DB_CONFIG, or ./realestate.ini if it
+# exists. Returns None when there is no config file.
+def read_config_file(path=None, environ=None):
+    environ = os.environ if environ is None else environ
+    path = path or environ.get('REALESTATE_DB_CONFIG')
+    if path is None and os.path.exists(DEFAULT_CONFIG_FILE):
+        path = DEFAULT_CONFIG_FILE
+    if path is None:
+        return None
+    parser = configparser.ConfigParser()
+    if not parser.read(path):
+        raise FileNotFoundError(f"Database config file not found: {path}")
+    return parser
+
+
+# Build the configuration from defaults, the config file and the environment.
+# `default_url` lets callers with their own notion of the database (alembic.ini) supply it.
+def load_config(path=None, environ=None, default_url=DEFAULT_URL):
+    environ = os.environ if environ is None else environ
+    settings = {'url': default_url, 'profile': DEFAULT_PROFILE}
+
+    parser = read_config_file(path, environ)
+    if parser is not None and parser.has_section('database'):
+        settings.update(parser.items('database'))
+
+    for key in ('url', 'profile', 'pool') + PRAGMAS:
+        value = environ.get(f"REALESTATE_DB_{key.upper()}")
+        if value is not None:
+            settings[key] = value
+
+    pool = settings.pop('pool', None)
+    if pool is not None and pool not in POOLS:
+        raise ValueError(f"Unknown pool class: {pool} (choose from {', '.join(POOLS)})")
+    pragmas = {key: settings.pop(key) for key in PRAGMAS if key in settings}
+    return DatabaseConfig(settings['url'], settings['profile'], pragmas, pool)
+
+
+# True for SQLite databases that live only in memory (no WAL / mmap possible)
+def _is_memory_database(url):
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+
+# Register a connect hook that applies `pragmas` to every new DBAPI connection
+def _install_pragmas(engine, pragmas):
+    from sqlalchemy import event
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+
+
+# Resolve the URL, pool options and pragmas for `profile` (see make_engine())
+def _engine_settings(url, profile, config, pragma_overrides):
+    from sqlalchemy.engine import make_url
+
+    config = config or load_config()
+    url = make_url(url or config.url)
+    profile = profile or config.profile
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown database profile: {profile} (choose from {', '.join(PROFILES)})")
+    settings = PROFILES[profile]
+
+    pragmas = dict(settings['pragmas'])
+    pragmas.update(config.pragmas)
+    pragmas.update(pragma_overrides)
+
+    pool = config.pool or settings['pool']
+    if _is_memory_database(url):
+        # A private in-memory database only exists on its one connection
+        pool = 'static'
+        pragmas.pop('journal_mode', None)
+        pragmas.pop('mmap_size', None)
+    pool_options = settings['pool_options'] if pool == 'queue' else {}
+    return url, pool, pool_options, pragmas
+
+
+# Create an engine for the given URL/profile. Anything not given comes from
+# `load_config()`. Extra keyword arguments override individual pragmas.
+def make_engine(url=None, profile=None, config=None, **pragma_overrides):
+    from sqlalchemy import create_engine, pool as pools
+
+    url, pool, pool_options, pragmas = _engine_settings(url, profile, config, pragma_overrides)
+    options = dict(pool_options)
+    if pool is not None:
+        options['poolclass'] = getattr(pools, POOLS[pool])
+
+    engine = create_engine(url, **options)
+    if pragmas and url.get_backend_name() == 'sqlite':
+        _install_pragmas(engine, pragmas)
+    return engine
+
+
+# Async counterpart of make_engine() for the asyncio service layer. SQLite URLs are
+# switched to the aiosqlite driver; profiles, pragmas and pools work the same way.
+def make_async_engine(url=None, profile=None, config=None, **pragma_overrides):
+    from sqlalchemy import pool as pools
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    url, pool, pool_options, pragmas = _engine_settings(url, profile, config, pragma_overrides)
+    if url.get_backend_name() == 'sqlite' and url.get_driver_name() != 'aiosqlite':
+        url = url.set(drivername='sqlite+aiosqlite')
+    options = dict(pool_options)
+    if pool is not None:
+        options['poolclass'] = pools.AsyncAdaptedQueuePool if pool == 'queue' else getattr(pools, POOLS[pool])
+
+    engine = create_async_engine(url, **options)
+    if pragmas and url.get_backend_name() == 'sqlite':
+        _install_pragmas(engine.sync_engine, pragmas)
+    return engine
+
+
+# Session factory bound to `engine` (or to a new engine from the configuration)
+def make_session_factory(engine=None, **session_options):
+    from sqlalchemy.orm import sessionmaker
+
+    return sessionmaker(bind=engine or make_engine(), **session_options)
@@ -0,0 +1,235 @@
+# SQL instrumentation: what each command asks of the database.
+#
+# Listeners on SQLAlchemy's `before_cursor_execute` / `after_cursor_execute` events
+# (registered once, for every engine) feed the active `QueryStats` collector: number
+# of statements, time spent executing them, rows returned or affected, the slowest
+# statements and how often each statement shape ran. Outside of `instrumented()`
+# blocks the listeners return immediately.
+#
+# On top of that:
+#   - statements slower than a threshold are appended to a JSON Lines slow-query log
+#   - a statement shape (the SQL with literals and IN lists collapsed) executed more
+#     than `repeat_threshold` times in one command is reported as a likely N+1 pattern
+#
+# Times cover `cursor.execute()`; with SQLite that is the time to the first row, rows
+# fetched later are counted but their fetch time is not. Rows are counted with a
+# `row_factory` on sqlite3 cursors, and from `rowcount` for INSERT/UPDATE/DELETE.
+#
+# Used by `cli/main.py --sql-profile / --slow-log` (see README "Profiling").
+import datetime
+import heapq
+import itertools
+import json
+import re
+import sqlite3
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Slowest statements kept per command
+DEFAULT_SLOWEST = 5
+
+# Statements at least this slow (ms) go to the slow-query log
+DEFAULT_SLOW_MS = 100.0
+
+# A statement shape run more often than this in one command is reported as N+1
+DEFAULT_REPEAT_THRESHOLD = 20
+
+# Characters of SQL shown per statement in the summary
+SUMMARY_SQL_WIDTH = 160
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDERS = re.compile(r"\?(?:\s*,\s*\?)+")
+_SPACE = re.compile(r"\s+")
+
+# The collector of the command being run, if any
+_current = None
+_installed = False
+
+
+# The statement with literals replaced by ? and parameter lists collapsed, so that
+# "WHERE id IN (?, ?, ?)" and "WHERE id IN (?, ?)" count as the same statement
+def statement_shape(statement):
+    shape = _SPACE.sub(' ', statement).strip()
+    shape = _STRING.sub('?', shape)
+    shape = _NUMBER.sub('?', shape)
+    return _PLACEHOLDERS.sub('?', shape)
+
+
+def _one_line(statement, width=None):
+    text = _SPACE.sub(' ', statement).strip()
+    if width and len(text) > width:
+        text = text[:width - 3] + '...'
+    return text
+
+
+# One executed statement
+class Statement:
+    __slots__ = ('sql', 'duration', 'rows', 'executemany')
+
+    def __init__(self, sql, duration, executemany):
+        self.sql = sql
+        self.duration = duration
+        self.rows = 0
+        self.executemany = executemany
+
+
+# Appends statements slower than `threshold_ms` to `path`, one JSON object per line
+class SlowQueryLog:
+    def __init__(self, path, threshold_ms=DEFAULT_SLOW_MS):
+        self.path = path
+        self.threshold = threshold_ms / 1000.0
+        self.written = 0
+
+    # Append (Statement, parameters) pairs run by `command`
+    def write(self, command, statements):
+        with open(self.path, 'a', encoding='utf-8') as handle:
+            for statement, parameters in statements:
+                handle.write(json.dumps(self._entry(command, statement, parameters), default=str) + '\n')
+        self.written += len(statements)
+
+    @staticmethod
+    def _entry(command, statement, parameters):
+        entry = {
+            'time': datetime.datetime.now().isoformat(timespec='milliseconds'),
+            'command': command,
+            'duration_ms': round(statement.duration * 1000, 3),
+            'rows': statement.rows,
+            'statement': _one_line(statement.sql),
+        }
+        if statement.executemany:
+            entry['parameter_sets'] = len(parameters)
+        else:
+            entry['parameters'] = parameters
+        return entry
+
+
+# Statistics of the statements run by one command
+class QueryStats:
+    def __init__(self, command, slowest=DEFAULT_SLOWEST, slow_log=None, repeat_threshold=DEFAULT_REPEAT_THRESHOLD):
+        self.command = command
+        self.keep = slowest
+        self.slow_log = slow_log
+        self.repeat_threshold = repeat_threshold
+        self.queries = 0
+        self.sql_time = 0.0
+        self.rows = 0
+        self.elapsed = 0.0
+        self.shapes = Counter()
+        self._slowest = []  # min-heap of (duration, sequence, Statement)
+        self._sequence = itertools.count()
+        self._slow = []  # (Statement, parameters) waiting for the slow-query log
+
+    def add(self, statement, parameters):
+        self.queries += 1
+        self.sql_time += statement.duration
+        self.shapes[statement_shape(statement.sql)] += 1
+        entry = (statement.duration, next(self._sequence), statement)
+        if len(self._slowest) < self.keep:
+            heapq.heappush(self._slowest, entry)
+        elif self._slowest and entry > self._slowest[0]:
+            heapq.heapreplace(self._slowest, entry)
+        if self.slow_log is not None and statement.duration >= self.slow_log.threshold:
+            self._slow.append((statement, parameters))
+
+    # Write the slow statements to the slow-query log. Done when the command ends,
+    # once their rows have been fetched and counted.
+    def flush(self):
+        if self._slow:
+            self.slow_log.write(self.command, self._slow)
+            self._slow = []
+
+    def slowest(self):
+        return [statement for _, _, statement in sorted(self._slowest, reverse=True)]
+
+    # (shape, count) of the statements run more than `repeat_threshold` times
+    def repeated(self):
+        return [(shape, count) for shape, count in self.shapes.most_common() if count > self.repeat_threshold]
+
+    def as_dict(self):
+        return {
+            'command': self.command,
+            'queries': self.queries,
+            'sql_ms': self.sql_time * 1000,
+            'elapsed_ms': self.elapsed * 1000,
+            'rows': self.rows,
+            'slowest': [
+                {'duration_ms': s.duration * 1000, 'rows': s.rows, 'statement': _one_line(s.sql)} for s in self.slowest()
+            ],
+            'repeated': [{'count': count, 'statement': shape} for shape, count in self.repeated()],
+        }
+
+    # The per-command summary printed by `--sql-profile`
+    def report(self):
+        lines = [
+            f"[sql] {self.command}: {self.queries} queries, {self.sql_time * 1000:.1f} ms in SQL "
+            f"({self.elapsed * 1000:.1f} ms total), {self.rows} rows"
+        ]
+        for statement in self.slowest():
+            lines.append(
+                f"[sql]   {statement.duration * 1000:8.2f} ms {statement.rows:8d} rows  "
+                f"{_one_line(statement.sql, SUMMARY_SQL_WIDTH)}"
+            )
+        lines.extend(self.warnings())
+        return '\n'.join(lines)
+
+    def warnings(self):
+        return [
+            f"[sql] Warning: possible N+1, ran {count} times in one command: {_one_line(shape, SUMMARY_SQL_WIDTH)}"
+            for shape, count in self.repeated()
+        ]
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current is None:
+        return
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current
+    starts = conn.info.get('query_started')
+    if stats is None or not starts:
+        return
+    record = Statement(statement, time.perf_counter() - starts.pop(), executemany)
+    if cursor.description is None:
+        # INSERT/UPDATE/DELETE without RETURNING: rows affected
+        record.rows = max(cursor.rowcount, 0)
+        stats.rows += record.rows
+    elif isinstance(cursor, sqlite3.Cursor):
+        # Count rows as the caller fetches them (the row itself is passed through unchanged)
+        def count_row(cursor, row):
+            record.rows += 1
+            stats.rows += 1
+            return row
+        cursor.row_factory = count_row
+    stats.add(record, parameters)
+
+
+# Register the cursor listeners on every engine (once per process)
+def install():
+    global _installed
+    if not _installed:
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        _installed = True
+
+
+# Collect the statements run inside the block into a QueryStats named `command`
+@contextmanager
+def instrumented(command, **options):
+    global _current
+    install()
+    stats = QueryStats(command, **options)
+    previous, _current = _current, stats
+    started = time.perf_counter()
+    try:
+        yield stats
+    finally:
+        stats.elapsed = time.perf_counter() - started
+        _current = previous
+        stats.flush()
@@ -0,0 +1,347 @@
+# Chunked, resumable online operations for Alembic revisions on large SQLite tables.
+#
+# A plain Alembic operation runs as one statement inside the revision's transaction. A
+# column change that SQLite can only make by rebuilding the table (such as adding NOT
+# NULL) then holds the write lock for as long as it takes to copy every row. The
+# helpers here work in short transactions instead, committing every chunk:
+#
+#   rebuild_table()  copies a table into a new one with altered columns, a rowid range
+#                    at a time. Triggers on the old table mirror every write made in the
+#                    meantime into the copy, and a final short transaction swaps the two
+#                    and recreates the table's indexes and triggers.
+#   backfill()       runs an UPDATE over a table a rowid range at a time.
+#
+# Progress is checkpointed in `migration_checkpoints` with every chunk, so an
+# interrupted `alembic upgrade` resumes where it stopped when it is run again. Each
+# chunk is sized to hold the write lock for about `chunk_seconds`, and the helpers sleep
+# `pause` seconds between chunks so other writers (which wait up to busy_timeout for
+# the lock) get in. REALESTATE_MIGRATION_CHUNK_SECONDS and REALESTATE_MIGRATION_PAUSE
+# override the defaults.
+#
+# Progress is logged to `alembic.online`, which `alembic upgrade` shows with the
+# logging configuration of alembic.ini.
+import datetime
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+log = logging.getLogger('alembic.online')
+
+CHECKPOINT_TABLE = 'migration_checkpoints'
+
+# Target time a chunk holds the write lock, and the pause between chunks, in seconds
+DEFAULT_CHUNK_SECONDS = 0.2
+DEFAULT_PAUSE = 0.05
+
+# Rowids per chunk: the first chunk, and the bounds the adaptive size stays within
+INITIAL_CHUNK_ROWS = 10000
+MIN_CHUNK_ROWS = 100
+MAX_CHUNK_ROWS = 1000000
+
+# Seconds between progress lines
+PROGRESS_INTERVAL = 5.0
+
+# Name prefix of the copy of a table being rebuilt, and of the triggers feeding it
+REBUILD_PREFIX = '_rebuild_'
+_MIRROR_PREFIX = '_rebuild_mirror_'
+
+
+class MigrationError(Exception):
+    pass
+
+
+def _env_float(name, default):
+    value = os.environ.get(name)
+    return float(value) if value else default
+
+
+# Pace of a chunked operation: chunks are resized after each one so that the next
+# should take about `chunk_seconds` (at most doubling or halving at a time), and
+# `pause` seconds are left between chunks for other writers
+class Throttle:
+    def __init__(self, chunk_seconds=None, pause=None, chunk_rows=INITIAL_CHUNK_ROWS):
+        self.chunk_seconds = chunk_seconds if chunk_seconds is not None else _env_float(
+            'REALESTATE_MIGRATION_CHUNK_SECONDS', DEFAULT_CHUNK_SECONDS,
+        )
+        self.pause = pause if pause is not None else _env_float('REALESTATE_MIGRATION_PAUSE', DEFAULT_PAUSE)
+        self.chunk_rows = chunk_rows
+
+    def done(self, elapsed):
+        if elapsed > 0:
+            factor = min(2.0, max(0.5, self.chunk_seconds / elapsed))
+            self.chunk_rows = int(min(MAX_CHUNK_ROWS, max(MIN_CHUNK_ROWS, self.chunk_rows * factor)))
+        if self.pause:
+            time.sleep(self.pause)
+
+
+# Logs how far a chunked operation has got, at most every PROGRESS_INTERVAL seconds
+class Progress:
+    def __init__(self, name, position, end, rows):
+        self.name = name
+        self.start = position
+        self.end = end
+        self.rows = rows
+        self.started = self.logged = time.perf_counter()
+
+    def update(self, position, rows):
+        self.rows = rows
+        now = time.perf_counter()
+        if now - self.logged < PROGRESS_INTERVAL:
+            return
+        self.logged = now
+        done = (position - self.start) / max(self.end - self.start, 1)
+        elapsed = now - self.started
+        left = elapsed * (1 - done) / done if done else 0
+        log.info(f"{self.name}: {done:.0%} (rowid {position} of {self.end}), {rows} rows, about {left:.0f}s left")
+
+    def finish(self):
+        log.info(f"{self.name}: {self.rows} rows in {time.perf_counter() - self.started:.1f}s")
+
+
+# The migration's connection, switched to autocommit so the helpers can commit chunk
+# by chunk (Alembic commits the revision's work so far and begins anew afterwards)
+@contextmanager
+def _autocommit(op):
+    context = op.get_context()
+    if context.as_sql:
+        raise MigrationError("Online migrations need a database connection; they cannot be rendered with --sql")
+    with context.autocommit_block():
+        yield op.get_bind()
+
+
+@contextmanager
+def _write_transaction(connection):
+    connection.exec_driver_sql('BEGIN IMMEDIATE')
+    try:
+        yield
+    except BaseException:
+        connection.exec_driver_sql('ROLLBACK')
+        raise
+    connection.exec_driver_sql('COMMIT')
+
+
+def _ensure_checkpoints(connection):
+    connection.exec_driver_sql(
+        f"CREATE TABLE IF NOT EXISTS {CHECKPOINT_TABLE} (name VARCHAR PRIMARY KEY, position INTEGER NOT NULL, "
+        "end_position INTEGER NOT NULL, rows INTEGER NOT NULL, updated_at VARCHAR NOT NULL)"
+    )
+
+
+# (position, end, rows) saved for the operation `name`, or None
+def _checkpoint(connection, name):
+    row = connection.exec_driver_sql(
+        f"SELECT position, end_position, rows FROM {CHECKPOINT_TABLE} WHERE name = ?", (name,)
+    ).first()
+    return tuple(row) if row else None
+
+
+def _save_checkpoint(connection, name, position, end, rows):
+    connection.exec_driver_sql(
+        f"INSERT OR REPLACE INTO {CHECKPOINT_TABLE} (name, position, end_position, rows, updated_at) VALUES (?, ?, ?, ?, ?)",
+        (name, position, end, rows, datetime.datetime.now().isoformat(timespec='seconds')),
+    )
+
+
+def _clear_checkpoint(connection, name):
+    connection.exec_driver_sql(f"DELETE FROM {CHECKPOINT_TABLE} WHERE name = ?", (name,))
+
+
+# Every saved checkpoint as a dict, for `cli/main.py migrations status`
+def checkpoints(connection):
+    if not _exists(connection, CHECKPOINT_TABLE):
+        return []
+    result = connection.exec_driver_sql(
+        f"SELECT name, position, end_position, rows, updated_at FROM {CHECKPOINT_TABLE} ORDER BY name"
+    )
+    return [dict(row._mapping) for row in result]
+
+
+def _exists(connection, table):
+    return connection.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+    ).first() is not None
+
+
+# (rowid before the first row, last rowid) of `table`, two index lookups
+def _rowid_range(connection, table):
+    low = connection.exec_driver_sql(f"SELECT min(rowid) FROM {table}").scalar()
+    high = connection.exec_driver_sql(f"SELECT max(rowid) FROM {table}").scalar()
+    return (low - 1, high) if low is not None else (0, 0)
+
+
+# Run `statement`, with :low and :high rowid bounds, over the rowids (position, end]
+# chunk by chunk, each chunk committed together with its checkpoint. `rows` counts
+# the rows changed. Returns the total.
+def _run_chunks(connection, name, statement, position, end, rows, throttle):
+    progress = Progress(name, position, end, rows)
+    while position < end:
+        high = min(end, position + throttle.chunk_rows)
+        with _write_transaction(connection):
+            # Timed once the lock is held: waiting for other writers is not the chunk's cost
+            started = time.perf_counter()
+            changed = connection.exec_driver_sql(statement, {'low': position, 'high': high}).rowcount
+            _save_checkpoint(connection, name, high, end, rows + changed)
+        position, rows = high, rows + changed
+        progress.update(position, rows)
+        throttle.done(time.perf_counter() - started)
+    progress.finish()
+    return rows
+
+
+# UPDATE `table` SET `assignments` [WHERE `where`] a rowid range at a time, e.g.
+#   backfill(op, 'properties', "name = trim(name)", where="name != trim(name)")
+# Rows inserted after the backfill started are not visited: the application must
+# already write them in the new form. Returns the number of rows updated.
+def backfill(op, table, assignments, where=None, checkpoint=None, throttle=None):
+    name = checkpoint or f"backfill {table}"
+    statement = f"UPDATE {table} SET {assignments} WHERE rowid > :low AND rowid <= :high"
+    if where:
+        statement += f" AND ({where})"
+    throttle = throttle or Throttle()
+    with _autocommit(op) as connection:
+        _ensure_checkpoints(connection)
+        saved = _checkpoint(connection, name)
+        if saved:
+            position, end, rows = saved
+            log.info(f"{name}: resuming after rowid {position}")
+        else:
+            (position, end), rows = _rowid_range(connection, table), 0
+        rows = _run_chunks(connection, name, statement, position, end, rows, throttle)
+        _clear_checkpoint(connection, name)
+    return rows
+
+
+def _mirror_triggers(table, copy, columns, select):
+    target = ', '.join(columns)
+    insert = f"INSERT INTO {copy} ({target}) SELECT {select} FROM {table} WHERE rowid = NEW.rowid;"
+    delete = f"DELETE FROM {copy} WHERE rowid = OLD.rowid;"
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS {_MIRROR_PREFIX}{table}_ai AFTER INSERT ON {table} BEGIN {insert} END",
+        f"CREATE TRIGGER IF NOT EXISTS {_MIRROR_PREFIX}{table}_au AFTER UPDATE ON {table} BEGIN {delete} {insert} END",
+        f"CREATE TRIGGER IF NOT EXISTS {_MIRROR_PREFIX}{table}_ad AFTER DELETE ON {table} BEGIN {delete} END",
+    ]
+
+
+# Column names of the copy, and the SELECT list filling them from `table`. The
+# rowid is copied too unless a column is an alias for it (INTEGER PRIMARY KEY), so
+# rowids other tables keep (e.g. recommendation marks) stay valid.
+def _copy_columns(connection, table, expressions):
+    info = connection.exec_driver_sql(f"PRAGMA table_info({table})").all()
+    key = [row for row in info if row.pk]
+    columns = [row.name for row in info]
+    select = [expressions.get(column, column) for column in columns]
+    if not (len(key) == 1 and key[0].type.upper() == 'INTEGER'):
+        columns.insert(0, 'rowid')
+        select.insert(0, 'rowid')
+    return columns, ', '.join(select)
+
+
+# CREATE TABLE for the copy: `table` as reflected, renamed, with `alter_columns` applied
+def _create_copy_sql(connection, table, copy, alter_columns):
+    import sqlalchemy as sa
+    from sqlalchemy.schema import CreateTable
+
+    metadata = sa.MetaData()
+    reflected = sa.Table(table, metadata, autoload_with=connection)
+    if reflected.dialect_options['sqlite'].get('with_rowid') is False:
+        raise MigrationError(f"{table} is a WITHOUT ROWID table; it cannot be copied by rowid range")
+    target = reflected.to_metadata(metadata, name=copy)
+    for column, changes in alter_columns.items():
+        if column not in target.c:
+            raise MigrationError(f"{table} has no column {column!r}")
+        for attribute, value in changes.items():
+            if attribute not in ('nullable', 'type'):
+                raise MigrationError(f"Unsupported column change {attribute!r} (only nullable and type)")
+            setattr(target.c[column], attribute, value)
+    return str(CreateTable(target).compile(dialect=connection.dialect))
+
+
+# Rebuild `table` with the column changes `alter_columns`, {column: {'nullable': bool,
+# 'type': SQLAlchemy type}}, filling columns from the SQL `expressions` ({column: SQL})
+# where given, e.g.
+#   rebuild_table(op, 'properties', alter_columns={'agent_id': {'nullable': False}})
+# Rows are copied in chunks while the table stays in use. Only the final swap, which
+# drops the old table and builds its indexes on the new one, holds the lock for longer.
+def rebuild_table(op, table, alter_columns=None, expressions=None, checkpoint=None, throttle=None):
+    name = checkpoint or f"rebuild {table}"
+    copy = REBUILD_PREFIX + table
+    throttle = throttle or Throttle()
+    with _autocommit(op) as connection:
+        _ensure_checkpoints(connection)
+        columns, select = _copy_columns(connection, table, expressions or {})
+        saved = _checkpoint(connection, name)
+        if saved and _exists(connection, copy):
+            position, end, rows = saved
+            log.info(f"{name}: resuming after rowid {position}")
+        else:
+            create = _create_copy_sql(connection, table, copy, alter_columns or {})
+            _discard(connection, table, name)
+            # The copy and its mirror triggers appear together with the rowid range to
+            # copy: every row beyond it, or written meanwhile, is mirrored
+            with _write_transaction(connection):
+                connection.exec_driver_sql(create)
+                for statement in _mirror_triggers(table, copy, columns, select):
+                    connection.exec_driver_sql(statement)
+                (position, end), rows = _rowid_range(connection, table), 0
+                _save_checkpoint(connection, name, position, end, rows)
+            log.info(f"{name}: copying rows up to rowid {end}")
+
+        # Rows the mirror triggers already copied are skipped; a row breaking a new
+        # constraint fails the chunk
+        statement = (
+            f"INSERT INTO {copy} ({', '.join(columns)}) SELECT {select} FROM {table} "
+            f"WHERE rowid > :low AND rowid <= :high AND NOT EXISTS (SELECT 1 FROM {copy} WHERE {copy}.rowid = {table}.rowid)"
+        )
+        _run_chunks(connection, name, statement, position, end, rows, throttle)
+        _swap(connection, table, copy, name)
+
+
+# Replace `table` by its finished copy in one transaction
+def _swap(connection, table, copy, name):
+    started = time.perf_counter()
+    foreign_keys = connection.exec_driver_sql("PRAGMA foreign_keys").scalar()
+    if foreign_keys:
+        # Dropping a table referenced by enforced foreign keys would delete through them
+        connection.exec_driver_sql("PRAGMA foreign_keys = OFF")
+    try:
+        with _write_transaction(connection):
+            old = connection.exec_driver_sql(f"SELECT count(*) FROM {table}").scalar()
+            new = connection.exec_driver_sql(f"SELECT count(*) FROM {copy}").scalar()
+            if old != new:
+                raise MigrationError(f"{name}: the copy has {new} rows, {table} has {old}; discard the rebuild and run it again")
+            # The table's own indexes and triggers, recreated on the copy once renamed
+            schema = [
+                sql for name, sql in connection.exec_driver_sql(
+                    "SELECT name, sql FROM sqlite_master WHERE tbl_name = ? AND type IN ('index', 'trigger') "
+                    "AND sql IS NOT NULL ORDER BY type = 'trigger', name", (table,),
+                )
+                if not name.startswith(_MIRROR_PREFIX)
+            ]
+            # Triggers and views of other tables refer to `table` by name: keep the
+            # rename from rewriting or re-checking them while it is missing
+            connection.exec_driver_sql("PRAGMA legacy_alter_table = ON")
+            connection.exec_driver_sql(f"DROP TABLE {table}")
+            connection.exec_driver_sql(f"ALTER TABLE {copy} RENAME TO {table}")
+            connection.exec_driver_sql("PRAGMA legacy_alter_table = OFF")
+            for statement in schema:
+                connection.exec_driver_sql(statement)
+            _clear_checkpoint(connection, name)
+    finally:
+        if foreign_keys:
+            connection.exec_driver_sql("PRAGMA foreign_keys = ON")
+    log.info(f"{name}: swapped in the rebuilt table in {time.perf_counter() - started:.1f}s")
+
+
+def _discard(connection, table, name):
+    for suffix in ('ai', 'au', 'ad'):
+        connection.exec_driver_sql(f"DROP TRIGGER IF EXISTS {_MIRROR_PREFIX}{table}_{suffix}")
+    connection.exec_driver_sql(f"DROP TABLE IF EXISTS {REBUILD_PREFIX}{table}")
+    if _exists(connection, CHECKPOINT_TABLE):
+        _clear_checkpoint(connection, name)
+
+
+# Abandon an interrupted rebuild of `table` instead of resuming it: drop the partial
+# copy, the triggers feeding it and its checkpoint
+def discard_rebuild(connection, table, checkpoint=None):
+    _discard(connection, table, checkpoint or f"rebuild {table}")
@@ -0,0 +1,85 @@
+# Regional shards: one SQLite database per regional office, all with the `models` schema.
+#
+# The shards are named in the [shards] section of the config file (see db/engine.py),
+# region = database URL or path to the SQLite file:
+#   [shards]
+#   north = /var/lib/realestate/north.db
+#   coast = sqlite:////var/lib/realestate/coast.db
+# or in $REALESTATE_DB_SHARDS as "north=north.db,coast=coast.db" (which wins over the
+# file). Region names are case-insensitive and listed in the order given.
+#
+# With shards configured, the CLI routes every command that writes to the shard chosen
+# with --region, and runs listings, search, export and analytics on all shards at once
+# (cli/sharded.py, services/fanout.py). Alembic migrates every shard (alembic/env.py).
+# Row ids are only unique within a shard: across shards a row is identified by its
+# region and id.
+#
+# Only the standard library is used here, so the CLI entry point can route commands
+# without loading SQLAlchemy.
+import os
+
+from db.engine import read_config_file
+
+SQLITE_PREFIX = 'sqlite:///'
+
+
+class ShardError(Exception):
+    pass
+
+
+def _url(location):
+    location = location.strip()
+    return location if '://' in location else SQLITE_PREFIX + location
+
+
+# {region: database URL} from the environment or the config file; empty without shards
+def load_shards(path=None, environ=None):
+    environ = os.environ if environ is None else environ
+    text = environ.get('REALESTATE_DB_SHARDS')
+    if text is not None:
+        entries = []
+        for item in filter(None, (item.strip() for item in text.split(','))):
+            region, separator, location = item.partition('=')
+            if not separator or not region.strip() or not location.strip():
+                raise ShardError(f"Expected region=database in REALESTATE_DB_SHARDS, got {item!r}")
+            entries.append((region.strip().lower(), location))
+    else:
+        parser = read_config_file(path, environ)
+        if parser is None or not parser.has_section('shards'):
+            return {}
+        # Keys of the [DEFAULT] section would show up in every section: skip them
+        entries = [(region, location) for region, location in parser.items('shards') if region not in parser.defaults()]
+
+    shards = {}
+    for region, location in entries:
+        if region in shards:
+            raise ShardError(f"Region {region!r} is configured twice")
+        shards[region] = _url(location)
+    return shards
+
+
+# The URL of `region`'s shard
+def shard_url(shards, region):
+    try:
+        return shards[region.lower()]
+    except KeyError:
+        raise ShardError(f"Unknown region {region!r} (configured: {', '.join(shards) or 'none'})")
+
+
+# The file behind a SQLite URL, or None for other databases and in-memory SQLite
+def sqlite_path(url):
+    if not url.startswith(('sqlite:', 'sqlite+')) or '///' not in url:
+        return None
+    path = url.split('///', 1)[1].split('?', 1)[0]
+    return path if path and path != ':memory:' else None
+
+
+# Refuse to run on shards whose SQLite file does not exist: connecting would silently
+# create an empty database (create the shards with `alembic upgrade head` first)
+def check_shards(shards):
+    missing = [region for region, url in shards.items() if sqlite_path(url) and not os.path.exists(sqlite_path(url))]
+    if missing:
+        raise ShardError(
+            f"No database file for region{'s' if len(missing) > 1 else ''} {', '.join(missing)}; "
+            f"create {'them' if len(missing) > 1 else 'it'} with `alembic upgrade head`"
+        )
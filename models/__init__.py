@@ -11,4 +11,18 @@ Base = declarative_base()
 from .agent import Agent
 from .property import Property
 from .buyer import Buyer
-from .buyer_property_association import buyer_property_association
\ No newline at end of file
+from .buyer_property_association import buyer_property_association
+# Full-text search index kept in sync with the properties table
+from .property_search import properties_fts
+
+# Per-agent portfolio summary kept up to date by triggers
+from .agent_portfolio_summary import agent_portfolio_summary
+
+# Top-K co-interest neighbours used by property recommendations
+from .property_neighbors import property_neighbors, property_neighbors_state
+
+# Change counters and the cached price statistics they invalidate
+from .price_statistics import table_versions, price_stats_cache
+
+# Append-only change log feeding read replicas, and the sync bookkeeping
+from .change_log import change_log, change_log_state, replica_state
@@ -0,0 +1,95 @@
+# Per-agent portfolio summary, maintained incrementally by SQLite triggers.
+#
+# Holds one row per agent with its listing count, total/min/max price and the number
+# of distinct buyers interested in any of its listings, so the portfolio dashboard
+# reads O(agents) rows instead of aggregating every property and interest. The
+# triggers below update it on each property insert/update/delete and each recorded or
+# removed interest, whatever code path wrote the row (ORM, bulk import, raw SQL).
+# The Alembic revision a40f6e4ddff4 creates the same objects on existing databases from
+# a frozen copy of the DDL: changing a trigger here needs a revision that recreates it.
+from sqlalchemy import Table, Column, Integer, ForeignKey, DDL, event
+
+from models import Base
+
+agent_portfolio_summary = Table(
+    'agent_portfolio_summary', Base.metadata,
+    Column('agent_id', Integer, ForeignKey('agents.id'), primary_key=True),
+    Column('listing_count', Integer, nullable=False, default=0),
+    Column('total_price', Integer, nullable=False, default=0),
+    Column('min_price', Integer),
+    Column('max_price', Integer),
+    Column('interested_buyers', Integer, nullable=False, default=0),
+)
+
+# Distinct buyers interested in any listing of the agent `agent` (an SQL expression)
+_INTERESTED_BUYERS = (
+    "(SELECT count(DISTINCT b.buyer_id) FROM buyer_property_association b "
+    "JOIN properties p ON p.id = b.property_id WHERE p.agent_id = {agent})"
+)
+
+# Add a listing to its agent's summary row (creating the row on the agent's first listing)
+_ADD_LISTING = (
+    "INSERT INTO agent_portfolio_summary "
+    "(agent_id, listing_count, total_price, min_price, max_price, interested_buyers) "
+    "SELECT new.agent_id, 1, new.price, new.price, new.price, 0 WHERE new.agent_id IS NOT NULL "
+    "ON CONFLICT(agent_id) DO UPDATE SET "
+    "listing_count = listing_count + 1, "
+    "total_price = total_price + excluded.total_price, "
+    "min_price = min(coalesce(min_price, excluded.min_price), excluded.min_price), "
+    "max_price = max(coalesce(max_price, excluded.max_price), excluded.max_price);"
+)
+
+# Remove a listing from its agent's summary; min/max come from ix_properties_agent_id_price
+_REMOVE_LISTING = (
+    "UPDATE agent_portfolio_summary SET "
+    "listing_count = listing_count - 1, "
+    "total_price = total_price - old.price, "
+    "min_price = (SELECT min(price) FROM properties WHERE agent_id = old.agent_id), "
+    "max_price = (SELECT max(price) FROM properties WHERE agent_id = old.agent_id), "
+    "interested_buyers = " + _INTERESTED_BUYERS.format(agent='old.agent_id') + " "
+    "WHERE agent_id = old.agent_id;"
+)
+
+# Agent of the property an interest row points at
+_INTEREST_AGENT = "(SELECT agent_id FROM properties WHERE id = {row}.property_id)"
+
+# True when the buyer has no other interest in a listing of the same agent
+_FIRST_FOR_AGENT = (
+    "NOT EXISTS (SELECT 1 FROM buyer_property_association b "
+    "JOIN properties p ON p.id = b.property_id "
+    "WHERE b.buyer_id = {row}.buyer_id AND b.property_id != {row}.property_id "
+    "AND p.agent_id = " + _INTEREST_AGENT + ")"
+)
+
+# Trigger name -> DDL
+PORTFOLIO_SUMMARY_TRIGGERS = {
+    'agent_portfolio_property_ai':
+        "CREATE TRIGGER IF NOT EXISTS agent_portfolio_property_ai AFTER INSERT ON properties "
+        "BEGIN " + _ADD_LISTING + " END",
+
+    'agent_portfolio_property_ad':
+        "CREATE TRIGGER IF NOT EXISTS agent_portfolio_property_ad AFTER DELETE ON properties "
+        "WHEN old.agent_id IS NOT NULL BEGIN " + _REMOVE_LISTING + " END",
+
+    # An update is a removal from the old agent followed by an addition to the new one
+    'agent_portfolio_property_au':
+        "CREATE TRIGGER IF NOT EXISTS agent_portfolio_property_au AFTER UPDATE OF price, agent_id ON properties "
+        "BEGIN " + _REMOVE_LISTING + " " + _ADD_LISTING + " "
+        "UPDATE agent_portfolio_summary SET interested_buyers = " + _INTERESTED_BUYERS.format(agent='new.agent_id') + " "
+        "WHERE agent_id = new.agent_id AND new.agent_id IS NOT old.agent_id; END",
+
+    'agent_portfolio_interest_ai':
+        "CREATE TRIGGER IF NOT EXISTS agent_portfolio_interest_ai AFTER INSERT ON buyer_property_association "
+        "BEGIN UPDATE agent_portfolio_summary SET interested_buyers = interested_buyers + 1 "
+        "WHERE agent_id = " + _INTEREST_AGENT.format(row='new') + " AND " + _FIRST_FOR_AGENT.format(row='new') + "; END",
+
+    'agent_portfolio_interest_ad':
+        "CREATE TRIGGER IF NOT EXISTS agent_portfolio_interest_ad AFTER DELETE ON buyer_property_association "
+        "BEGIN UPDATE agent_portfolio_summary SET interested_buyers = interested_buyers - 1 "
+        "WHERE agent_id = " + _INTEREST_AGENT.format(row='old') + " AND " + _FIRST_FOR_AGENT.format(row='old') + "; END",
+}
+
+# The triggers reference properties and the interest table, so they are created
+# once the whole schema exists
+for _statement in PORTFOLIO_SUMMARY_TRIGGERS.values():
+    event.listen(Base.metadata, 'after_create', DDL(_statement).execute_if(dialect='sqlite'))
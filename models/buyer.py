@@ -1,6 +1,6 @@
 # Import necessary SQLAlchemy components
 # Column, Integer, String for defining the database columns
-from sqlalchemy import Column, Integer, String
+from sqlalchemy import Column, Integer, String, Index, func
 from sqlalchemy.orm import relationship
 from models import Base
 from models.buyer_property_association import buyer_property_association  # Import the Base class to define the Buyer model
@@ -15,11 +15,20 @@ class Buyer(Base):
     name = Column(String, nullable=False)  # Name of the buyer (cannot be null)
     email = Column(String, nullable=False)  # Email address of the buyer (cannot be null)
 
+    # Each email address can only belong to one buyer, compared case-insensitively
+    # and ignoring surrounding whitespace
+    __table_args__ = (
+        Index('ux_buyers_email_normalized', func.lower(func.trim(email)), unique=True),
+    )
+
     # Establish a many-to-many relationship with the Property class
+    # Write-only, like Property.interested_buyers: adding an interest never loads the
+    # buyer's existing ones. Use services.records.buyer_interests() to read them.
     interested_properties = relationship(
         "Property",
         secondary=buyer_property_association,  # Use the association table
-        back_populates="interested_buyers"  # Link back to Property
+        back_populates="interested_buyers",  # Link back to Property
+        lazy="write_only",
     )
 
     # String representation of the Buyer object
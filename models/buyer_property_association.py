@@ -1,9 +1,12 @@
-from sqlalchemy import Table, Column, Integer, ForeignKey
+from sqlalchemy import Table, Column, Integer, ForeignKey, Index
 from models import Base
 
 # Define the association table to link buyers and properties (Many-to-Many)
 buyer_property_association = Table(
     'buyer_property_association', Base.metadata,
     Column('buyer_id', Integer, ForeignKey('buyers.id'), primary_key=True),  # Link to buyer
-    Column('property_id', Integer, ForeignKey('properties.id'), primary_key=True)  # Link to property
+    Column('property_id', Integer, ForeignKey('properties.id'), primary_key=True),  # Link to property
+    # The primary key (buyer_id, property_id) covers "what does buyer X want";
+    # this index covers the reverse "which buyers want property X" lookup
+    Index('ix_buyer_property_association_property_id', 'property_id')
 )
@@ -0,0 +1,84 @@
+# Append-only change log of the base tables, read by the replica sync (services/replication.py).
+#
+# SQLite triggers append one entry per row inserted, updated or deleted in `agents`,
+# `properties`, `buyers` and `buyer_property_association`, whatever code path wrote it
+# (ORM sessions, bulk imports, Core statements, the API). `seq` is an AUTOINCREMENT
+# key, so sequence numbers only grow and are never reused, even once old entries have
+# been compacted away. An entry names the row by its key, "id" or
+# "buyer_id:property_id"; the row's values are read from the table when the change is
+# applied. The Alembic revision 9a3e5c7d1b42 creates the same objects on existing
+# databases from a frozen copy of the DDL: changing a trigger here needs a revision
+# that recreates it.
+from sqlalchemy import Table, Column, Integer, String, DDL, event
+
+from models import Base
+
+change_log = Table(
+    'change_log', Base.metadata,
+    Column('seq', Integer, primary_key=True),
+    Column('table_name', String, nullable=False),
+    # 'insert', 'update' or 'delete'
+    Column('operation', String, nullable=False),
+    Column('row_key', String, nullable=False),
+    Column('changed_at', String, nullable=False),
+    sqlite_autoincrement=True,
+)
+
+# Single-row bookkeeping of the source database: the last sequence number removed by
+# `changes compact` (replicas behind it cannot catch up from the log)
+change_log_state = Table(
+    'change_log_state', Base.metadata,
+    Column('id', Integer, primary_key=True),
+    Column('compacted_through', Integer, nullable=False),
+)
+
+# Single-row bookkeeping of a replica: the database it copies and the sequence number
+# of the last change log entry applied to it
+replica_state = Table(
+    'replica_state', Base.metadata,
+    Column('id', Integer, primary_key=True),
+    Column('source', String, nullable=False),
+    Column('position', Integer, nullable=False),
+    Column('synced_at', String, nullable=False),
+)
+
+# Logged tables and the expression of a row's key
+LOGGED_TABLES = {
+    'agents': "CAST({row}.id AS TEXT)",
+    'properties': "CAST({row}.id AS TEXT)",
+    'buyers': "CAST({row}.id AS TEXT)",
+    'buyer_property_association': "{row}.buyer_id || ':' || {row}.property_id",
+}
+
+
+def _log(table, operation, row, condition=None):
+    key = LOGGED_TABLES[table].format(row=row)
+    statement = (
+        f"INSERT INTO change_log (table_name, operation, row_key, changed_at) "
+        f"SELECT '{table}', '{operation}', {key}, datetime('now')"
+    )
+    return statement + (f" WHERE {condition};" if condition else ";")
+
+
+# Trigger name -> DDL for `table`. An update that changes a row's key also logs the
+# old key as deleted.
+def _triggers(table):
+    changed = LOGGED_TABLES[table].format(row='old') + " IS NOT " + LOGGED_TABLES[table].format(row='new')
+    events = {
+        f"change_log_{table}_ai": (f"AFTER INSERT ON {table}", _log(table, 'insert', 'new')),
+        f"change_log_{table}_au": (
+            f"AFTER UPDATE ON {table}", f"{_log(table, 'update', 'new')} {_log(table, 'delete', 'old', changed)}",
+        ),
+        f"change_log_{table}_ad": (f"AFTER DELETE ON {table}", _log(table, 'delete', 'old')),
+    }
+    return {name: f"CREATE TRIGGER IF NOT EXISTS {name} {event} BEGIN {body} END" for name, (event, body) in events.items()}
+
+
+# Trigger name -> DDL, for every logged table
+CHANGE_LOG_TRIGGERS = {name: statement for table in LOGGED_TABLES for name, statement in _triggers(table).items()}
+
+# Trigger names, for dropping them (replicas)
+CHANGE_LOG_TRIGGER_NAMES = list(CHANGE_LOG_TRIGGERS)
+
+for _statement in CHANGE_LOG_TRIGGERS.values():
+    event.listen(Base.metadata, 'after_create', DDL(_statement).execute_if(dialect='sqlite'))
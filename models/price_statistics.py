@@ -0,0 +1,67 @@
+# Change counters and the result cache for the price statistics (services/price_stats.py).
+#
+# `table_versions` holds a counter per table that SQLite triggers bump on every insert,
+# delete and price/agent change of a property, whatever code path wrote the row (and on
+# every interest recorded or removed, see INTEREST_VERSION_TRIGGERS). A
+# statistics report is stored in `price_stats_cache` together with the counter value it
+# was computed at, so repeating the report is one primary-key lookup until a listing
+# changes. The Alembic revisions 8c4d2e6f1a57 and 3b7f9d1c6e28 create the same objects on
+# existing databases from frozen copies of the DDL: changing a trigger here needs a
+# revision that recreates it.
+from sqlalchemy import Table, Column, Integer, String, Text, DateTime, DDL, event
+
+from models import Base
+
+table_versions = Table(
+    'table_versions', Base.metadata,
+    Column('table_name', String, primary_key=True),
+    Column('version', Integer, nullable=False, default=0),
+)
+
+price_stats_cache = Table(
+    'price_stats_cache', Base.metadata,
+    # The report's parameters, as canonical JSON
+    Column('cache_key', String, primary_key=True),
+    # table_versions.version of `properties` when the report was computed
+    Column('data_version', Integer, nullable=False),
+    Column('computed_at', DateTime, nullable=False),
+    Column('result', Text, nullable=False),
+)
+
+_BUMP_PROPERTIES = (
+    "INSERT INTO table_versions (table_name, version) VALUES ('properties', 1) "
+    "ON CONFLICT(table_name) DO UPDATE SET version = version + 1;"
+)
+
+
+# CREATE TRIGGER `name` running `bump` on `event`
+def _trigger(name, event, bump):
+    return f"CREATE TRIGGER IF NOT EXISTS {name} {event} BEGIN {bump} END"
+
+
+# Trigger name -> DDL
+TABLE_VERSION_TRIGGERS = {
+    name: _trigger(name, event, _BUMP_PROPERTIES) for name, event in [
+        ('table_versions_properties_ai', "AFTER INSERT ON properties"),
+        ('table_versions_properties_ad', "AFTER DELETE ON properties"),
+        ('table_versions_properties_au', "AFTER UPDATE OF price, agent_id ON properties"),
+    ]
+}
+
+# The interest counter tells listing snapshots (services/snapshot.py) that the interest
+# pairs changed. Created by the Alembic revision 3b7f9d1c6e28.
+_BUMP_INTERESTS = (
+    "INSERT INTO table_versions (table_name, version) VALUES ('buyer_property_association', 1) "
+    "ON CONFLICT(table_name) DO UPDATE SET version = version + 1;"
+)
+
+INTEREST_VERSION_TRIGGERS = {
+    name: _trigger(name, event, _BUMP_INTERESTS) for name, event in [
+        ('table_versions_interests_ai', "AFTER INSERT ON buyer_property_association"),
+        ('table_versions_interests_ad', "AFTER DELETE ON buyer_property_association"),
+        ('table_versions_interests_au', "AFTER UPDATE ON buyer_property_association"),
+    ]
+}
+
+for _statement in [*TABLE_VERSION_TRIGGERS.values(), *INTEREST_VERSION_TRIGGERS.values()]:
+    event.listen(Base.metadata, 'after_create', DDL(_statement).execute_if(dialect='sqlite'))
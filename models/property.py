@@ -1,6 +1,6 @@
 # Import Column, Integer, String, ForeignKey to define the columns and relationships in the table
 # Import relationship to establish relationships between tables
-from sqlalchemy import Column, Integer, String, ForeignKey
+from sqlalchemy import Column, Integer, String, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from models import Base  # Import the Base class to define the Property model
 from models.buyer_property_association import buyer_property_association
@@ -13,7 +13,7 @@ class Property(Base):
     # Define the columns of the 'properties' table
     id = Column(Integer, primary_key=True)  # Unique identifier for each property (primary key)
     name = Column(String, nullable=False)  # Name of the property (cannot be null)
-    price = Column(Integer, nullable=False)  # Price of the property (cannot be null)
+    price = Column(Integer, nullable=False, index=True)  # Price of the property (cannot be null), indexed for price filters
     
     # ForeignKey establishes a relationship between properties and agents
     # The agent_id column links each property to the agent who manages it
@@ -23,11 +23,20 @@ class Property(Base):
     # A property is "managed by" an agent, and this establishes a link back to the agent
     agent = relationship("Agent", back_populates="properties")
     
+    # "All properties of agent X" is an index search, and the same index answers an
+    # agent's cheapest/most expensive listing (and price-sorted listings) without sorting
+    __table_args__ = (
+        Index('ix_properties_agent_id_price', 'agent_id', 'price'),
+    )
+
     # Establish a many-to-many relationship with the Buyer class
+    # The collection is write-only: it is never loaded as a whole (a listing can have
+    # thousands of interested buyers). Read it with `session.scalars(prop.interested_buyers.select())`.
     interested_buyers = relationship(
         "Buyer",
         secondary=buyer_property_association,  # Use the association table
-        back_populates="interested_properties"  # Link back to Buyer
+        back_populates="interested_properties",  # Link back to Buyer
+        lazy="write_only",
     )
 
     # String representation of the Property object
@@ -0,0 +1,24 @@
+from sqlalchemy import Table, Column, Integer, ForeignKey
+from models import Base
+
+# Precomputed item-item co-interest: for each property, its top-K "neighbours", the
+# properties most often wanted by the same buyers, with `score` = number of buyers
+# interested in both. Rebuilt offline and kept current by services/recommendations.py.
+# WITHOUT ROWID stores the rows clustered by property, so a property's neighbours are
+# read from one contiguous range of the primary key.
+property_neighbors = Table(
+    'property_neighbors', Base.metadata,
+    Column('property_id', Integer, ForeignKey('properties.id'), primary_key=True),
+    Column('neighbor_id', Integer, ForeignKey('properties.id'), primary_key=True),
+    Column('score', Integer, nullable=False),
+    sqlite_with_rowid=False,
+)
+
+# Single-row bookkeeping for the neighbour table: K and the change log sequence number
+# of the last change folded in (newer interests are applied incrementally)
+property_neighbors_state = Table(
+    'property_neighbors_state', Base.metadata,
+    Column('id', Integer, primary_key=True),
+    Column('k', Integer, nullable=False),
+    Column('interest_mark', Integer, nullable=False),
+)
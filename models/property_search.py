@@ -0,0 +1,31 @@
+# Full-text search index over property names.
+#
+# `properties_fts` is an SQLite FTS5 virtual table using `properties` as its external
+# content table: it only stores the search index, and the triggers below keep it in
+# sync on every insert, update and delete. It is not a mapped model; the DDL is
+# attached to the `properties` table so `Base.metadata.create_all()` creates it too.
+# The Alembic revision 27fe78924786 creates the same objects on existing databases.
+from sqlalchemy import DDL, event
+from sqlalchemy.sql import table, column
+
+from models.property import Property
+
+# Lightweight handle for use in queries (rowid is the property id, rank is the bm25 score)
+properties_fts = table('properties_fts', column('rowid'), column('rank'))
+
+PROPERTY_SEARCH_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS properties_fts USING fts5("
+    "name, content='properties', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    "CREATE TRIGGER IF NOT EXISTS properties_fts_ai AFTER INSERT ON properties BEGIN "
+    "INSERT INTO properties_fts(rowid, name) VALUES (new.id, new.name); END",
+    "CREATE TRIGGER IF NOT EXISTS properties_fts_ad AFTER DELETE ON properties BEGIN "
+    "INSERT INTO properties_fts(properties_fts, rowid, name) VALUES ('delete', old.id, old.name); END",
+    "CREATE TRIGGER IF NOT EXISTS properties_fts_au AFTER UPDATE OF name ON properties BEGIN "
+    "INSERT INTO properties_fts(properties_fts, rowid, name) VALUES ('delete', old.id, old.name); "
+    "INSERT INTO properties_fts(rowid, name) VALUES (new.id, new.name); END",
+]
+
+# Only SQLite has FTS5; other backends simply do without the search index
+for _statement in PROPERTY_SEARCH_DDL:
+    event.listen(Property.__table__, 'after_create', DDL(_statement).execute_if(dialect='sqlite'))
@@ -0,0 +1,3 @@
+# The services package holds the reusable operations behind the CLI menu.
+# Each module works on a SQLAlchemy session (or engine) handed in by the caller,
+# so the same code can be driven from cli/main.py, scripts or migrations.
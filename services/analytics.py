@@ -0,0 +1,122 @@
+# Agent portfolio analytics: listings, inventory value and buyer interest per agent.
+#
+# The live report is computed entirely in SQL: one GROUP BY over agents LEFT JOIN
+# properties for the price statistics, plus a correlated count of distinct interested
+# buyers answered from the interest table's indexes. No Property object is loaded.
+#
+# The dashboard report reads `agent_portfolio_summary` instead, a table kept up to date
+# by triggers (see models/agent_portfolio_summary.py), so it costs O(agents) whatever
+# the number of listings. `rebuild_summary()` recomputes it from scratch if needed.
+from sqlalchemy import select, func, delete, insert
+
+from models import Agent, Property, buyer_property_association, agent_portfolio_summary
+
+PORTFOLIO_HEADERS = ["Agent ID", "Agent", "Listings", "Total Value", "Average Price", "Min Price", "Max Price", "Interested Buyers"]
+
+# Sort keys offered by the report (column label -> descending)
+PORTFOLIO_SORTS = ('agent', 'listings', 'value', 'buyers')
+
+
+# Distinct buyers interested in any listing of the agent in the outer query.
+# The inner query uses its own alias of properties so it never correlates with an
+# outer query over properties.
+def _interested_buyers(agent_id_column):
+    association = buyer_property_association
+    listing = Property.__table__.alias('listing')
+    return (
+        select(func.count(func.distinct(association.c.buyer_id)))
+        .select_from(association.join(listing, listing.c.id == association.c.property_id))
+        .where(listing.c.agent_id == agent_id_column)
+        .scalar_subquery()
+    )
+
+
+# Live report computed from the base tables
+def live_portfolio_query():
+    return (
+        select(
+            Agent.id.label('agent_id'),
+            Agent.name.label('agent'),
+            func.count(Property.id).label('listings'),
+            func.coalesce(func.sum(Property.price), 0).label('value'),
+            func.avg(Property.price).label('average_price'),
+            func.min(Property.price).label('min_price'),
+            func.max(Property.price).label('max_price'),
+            _interested_buyers(Agent.id).label('buyers'),
+        )
+        .outerjoin(Property, Property.agent_id == Agent.id)
+        .group_by(Agent.id)
+    )
+
+
+# Dashboard report read from the incrementally maintained summary table
+def summary_portfolio_query():
+    summary = agent_portfolio_summary
+    listings = func.coalesce(summary.c.listing_count, 0)
+    value = func.coalesce(summary.c.total_price, 0)
+    return (
+        select(
+            Agent.id.label('agent_id'),
+            Agent.name.label('agent'),
+            listings.label('listings'),
+            value.label('value'),
+            (value * 1.0 / func.nullif(listings, 0)).label('average_price'),
+            summary.c.min_price.label('min_price'),
+            summary.c.max_price.label('max_price'),
+            func.coalesce(summary.c.interested_buyers, 0).label('buyers'),
+        )
+        .outerjoin(summary, summary.c.agent_id == Agent.id)
+    )
+
+
+# Build the report statement; `live=True` aggregates the base tables instead of the summary
+def portfolio_query(live=False, agent_id=None, sort='value', limit=None):
+    if sort not in PORTFOLIO_SORTS:
+        raise ValueError(f"Unknown sort order: {sort}")
+    statement = live_portfolio_query() if live else summary_portfolio_query()
+    if agent_id is not None:
+        statement = statement.where(Agent.id == agent_id)
+
+    columns = statement.selected_columns
+    if sort == 'agent':
+        statement = statement.order_by(columns.agent_id)
+    else:
+        statement = statement.order_by(columns[sort].desc(), columns.agent_id)
+    if limit is not None:
+        statement = statement.limit(limit)
+    return statement
+
+
+# Run the report and return one tuple per agent in PORTFOLIO_HEADERS order
+def agent_portfolio(connection, live=False, agent_id=None, sort='value', limit=None):
+    rows = connection.execute(portfolio_query(live, agent_id, sort, limit)).all()
+    return [
+        (row.agent_id, row.agent, row.listings, row.value,
+         round(row.average_price) if row.average_price is not None else None,
+         row.min_price, row.max_price, row.buyers)
+        for row in rows
+    ]
+
+
+# Recompute the summary table from the base tables in one transaction
+def rebuild_summary(connection):
+    live = (
+        select(
+            Property.agent_id,
+            func.count(),
+            func.sum(Property.price),
+            func.min(Property.price),
+            func.max(Property.price),
+            _interested_buyers(Property.agent_id),
+        )
+        .where(Property.agent_id.isnot(None))
+        .group_by(Property.agent_id)
+    )
+    summary = agent_portfolio_summary
+    connection.execute(delete(summary))
+    result = connection.execute(
+        insert(summary).from_select(
+            ['agent_id', 'listing_count', 'total_price', 'min_price', 'max_price', 'interested_buyers'], live
+        )
+    )
+    return result.rowcount
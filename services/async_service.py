@@ -0,0 +1,317 @@
+# Asyncio service layer over the Agent/Property/Buyer models, used by the JSON API
+# (api/server.py).
+#
+# Reads run concurrently: each one takes its own connection from the async engine
+# (aiosqlite, one thread per connection, WAL so readers never wait for the writer).
+#
+# Writes never run concurrently. Every write is queued to a single writer task,
+# which drains whatever is waiting (up to `max_batch` operations) and applies it in
+# one transaction, so there is only ever one SQLite writer and a burst of writes
+# costs one commit and a few set-based queries instead of several statements per
+# request. Validation errors fail only their own operation; an unexpected error rolls
+# the batch back and replays its operations one transaction each, so one bad request
+# cannot fail its neighbours.
+import asyncio
+
+from sqlalchemy import select, insert, func, tuple_
+
+from db import make_async_engine
+from models import Agent, Property, Buyer, buyer_property_association
+from services.analytics import portfolio_query
+from services.listing import DEFAULT_PAGE_SIZE, LISTINGS
+from services.records import RecordError, clean_agent, clean_property, clean_buyer
+from services.search import DEFAULT_LIMIT, search_query
+
+# Largest number of queued writes committed in one transaction
+DEFAULT_MAX_BATCH = 256
+
+# Largest page a client can ask for
+MAX_PAGE_SIZE = 1000
+
+
+# Rows as dicts keyed by column name, ready for JSON
+def _records(result):
+    return [dict(row) for row in result.mappings()]
+
+
+class AsyncRealEstateService:
+    def __init__(self, engine, max_batch=DEFAULT_MAX_BATCH):
+        self.engine = engine
+        self.max_batch = max_batch
+        self._queue = None
+        self._writer = None
+        # Writer statistics, reported by the /stats endpoint
+        self.batches = 0
+        self.writes = 0
+        self.replayed_batches = 0
+
+    @classmethod
+    def from_url(cls, url=None, profile=None, **options):
+        return cls(make_async_engine(url, profile), **options)
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        self._writer = asyncio.create_task(self._write_loop())
+
+    # Finish the queued writes, stop the writer task and close the engine
+    async def close(self):
+        if self._writer is not None:
+            await self._queue.join()
+            self._writer.cancel()
+            try:
+                await self._writer
+            except asyncio.CancelledError:
+                pass
+            self._writer = None
+        await self.engine.dispose()
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    # -- reads ---------------------------------------------------------------
+
+    async def _read(self, statement):
+        async with self.engine.connect() as connection:
+            return _records(await connection.execute(statement))
+
+    def _columns(self, entity):
+        if entity not in LISTINGS:
+            raise ValueError(f"Unknown entity: {entity}")
+        model, column_names, _ = LISTINGS[entity]
+        return model, [getattr(model, name) for name in column_names]
+
+    # One keyset page of `entity` (see services/listing.py)
+    async def list_entity(self, entity, after_id=None, limit=DEFAULT_PAGE_SIZE):
+        model, columns = self._columns(entity)
+        statement = select(*columns)
+        if after_id is not None:
+            statement = statement.where(model.id > after_id)
+        statement = statement.order_by(model.id).limit(min(limit, MAX_PAGE_SIZE))
+        return await self._read(statement)
+
+    # A single agent, property or buyer by id, or None
+    async def get_entity(self, entity, entity_id):
+        model, columns = self._columns(entity)
+        rows = await self._read(select(*columns).where(model.id == entity_id))
+        return rows[0] if rows else None
+
+    async def search(self, text=None, min_price=None, max_price=None, agent_id=None, sort=None, limit=DEFAULT_LIMIT):
+        statement = search_query(text, min_price, max_price, agent_id, sort, min(limit, MAX_PAGE_SIZE))
+        return await self._read(statement)
+
+    # Properties a buyer is interested in; None if there is no such buyer
+    async def buyer_interests(self, buyer_id):
+        async with self.engine.connect() as connection:
+            if await connection.scalar(select(Buyer.id).where(Buyer.id == buyer_id)) is None:
+                return None
+            statement = (
+                select(Property.id, Property.name, Property.price)
+                .join(buyer_property_association, buyer_property_association.c.property_id == Property.id)
+                .where(buyer_property_association.c.buyer_id == buyer_id)
+                .order_by(Property.id)
+            )
+            return _records(await connection.execute(statement))
+
+    async def portfolio(self, live=False, agent_id=None, sort='value', limit=None):
+        rows = await self._read(portfolio_query(live, agent_id, sort, limit))
+        for row in rows:
+            if row['average_price'] is not None:
+                row['average_price'] = round(row['average_price'])
+        return rows
+
+    # Highest id per table, so clients (the load test) can pick existing rows
+    async def table_sizes(self):
+        async with self.engine.connect() as connection:
+            return {
+                entity: await connection.scalar(select(func.coalesce(func.max(model.id), 0)))
+                for entity, (model, _, _) in LISTINGS.items()
+            }
+
+    def writer_stats(self):
+        return {
+            'batches': self.batches,
+            'writes': self.writes,
+            'mean_batch_size': self.writes / self.batches if self.batches else 0.0,
+            'replayed_batches': self.replayed_batches,
+            'queued': self._queue.qsize() if self._queue is not None else 0,
+        }
+
+    # -- writes --------------------------------------------------------------
+
+    # Queue a write of `kind` (a key of WRITERS) for the writer task and wait for its result
+    async def _submit(self, kind, *args):
+        if self._writer is None:
+            raise RuntimeError("The service has not been started")
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((kind, args, future))
+        return await future
+
+    async def create_agent(self, name, phone):
+        return await self._submit('agent', *clean_agent(name, phone))
+
+    async def create_property(self, name, price, agent_id):
+        name, price = clean_property(name, price)
+        return await self._submit('property', name, price, agent_id)
+
+    async def create_buyer(self, name, email):
+        return await self._submit('buyer', *clean_buyer(name, email))
+
+    async def record_interest(self, buyer_id, property_id):
+        return await self._submit('interest', buyer_id, property_id)
+
+    async def _write_loop(self):
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                await self._apply_batch(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _apply_batch(self, batch):
+        try:
+            async with self.engine.begin() as connection:
+                outcomes = await _write_batch(connection, batch)
+        except Exception:
+            # Something other than a validation error: replay one by one
+            self.replayed_batches += 1
+            for item in batch:
+                await self._apply_one(item)
+            return
+        self._settle(batch, outcomes)
+
+    async def _apply_one(self, item):
+        try:
+            async with self.engine.begin() as connection:
+                outcomes = await _write_batch(connection, [item])
+        except Exception as error:
+            outcomes = [(False, error)]
+        self._settle([item], outcomes)
+
+    def _settle(self, batch, outcomes):
+        self.batches += 1
+        self.writes += len(batch)
+        for (_, _, future), (ok, value) in zip(batch, outcomes):
+            if future.done():
+                continue
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+
+# Apply a batch of queued writes on `connection` and return one (ok, result or
+# RecordError) outcome per write. Writes of the same kind are checked with one query
+# per kind and inserted with one multi-row INSERT. Clients only learn an id once the
+# batch that created it has committed, so no write can depend on another write of
+# the same batch and the kinds can be applied in any order.
+async def _write_batch(connection, batch):
+    outcomes = [None] * len(batch)
+    by_kind = {}
+    for index, (kind, args, _) in enumerate(batch):
+        by_kind.setdefault(kind, []).append((index, args))
+    for kind, items in by_kind.items():
+        results = await WRITERS[kind](connection, [args for _, args in items])
+        for (index, _), outcome in zip(items, results):
+            outcomes[index] = outcome
+    return outcomes
+
+
+# Insert `rows` into `model` with one statement and return their new ids in order.
+# Within one INSERT SQLite hands out rowids in increasing VALUES order, so sorting
+# the returned ids matches them to the rows.
+async def _insert_rows(connection, model, rows):
+    if not rows:
+        return []
+    result = await connection.execute(insert(model).returning(model.id), rows)
+    return sorted(result.scalars().all())
+
+
+async def _write_agents(connection, items):
+    rows = [{'name': name, 'phone': phone} for name, phone in items]
+    ids = await _insert_rows(connection, Agent, rows)
+    return [(True, {'id': agent_id, **row}) for agent_id, row in zip(ids, rows)]
+
+
+async def _write_properties(connection, items):
+    agent_ids = {agent_id for _, _, agent_id in items}
+    known = set((await connection.execute(select(Agent.id).where(Agent.id.in_(agent_ids)))).scalars())
+
+    outcomes, rows = [], []
+    for name, price, agent_id in items:
+        if agent_id not in known:
+            outcomes.append((False, RecordError("No agent found with the given ID.")))
+            continue
+        row = {'name': name, 'price': price, 'agent_id': agent_id}
+        rows.append(row)
+        outcomes.append((True, row))
+    ids = iter(await _insert_rows(connection, Property, rows))
+    return [(True, {'id': next(ids), **value}) if ok else (ok, value) for ok, value in outcomes]
+
+
+async def _write_buyers(connection, items):
+    # Emails are unique per buyer (case-insensitive), checked through the normalized email index
+    normalized = func.lower(func.trim(Buyer.email))
+    taken = set((await connection.execute(
+        select(normalized).where(normalized.in_({email.lower() for _, email in items}))
+    )).scalars())
+
+    outcomes, rows = [], []
+    for name, email in items:
+        if email.lower() in taken:
+            outcomes.append((False, RecordError("A buyer with this email already exists.")))
+            continue
+        taken.add(email.lower())
+        row = {'name': name, 'email': email}
+        rows.append(row)
+        outcomes.append((True, row))
+    ids = iter(await _insert_rows(connection, Buyer, rows))
+    return [(True, {'id': next(ids), **value}) if ok else (ok, value) for ok, value in outcomes]
+
+
+async def _write_interests(connection, items):
+    association = buyer_property_association
+    buyer_ids = {buyer_id for buyer_id, _ in items}
+    property_ids = {property_id for _, property_id in items}
+    buyers = dict((await connection.execute(select(Buyer.id, Buyer.name).where(Buyer.id.in_(buyer_ids)))).all())
+    properties = dict((await connection.execute(
+        select(Property.id, Property.name).where(Property.id.in_(property_ids))
+    )).all())
+    existing = set((await connection.execute(
+        select(association.c.buyer_id, association.c.property_id)
+        .where(tuple_(association.c.buyer_id, association.c.property_id).in_(set(items)))
+    )).all())
+
+    outcomes, rows = [], []
+    for buyer_id, property_id in items:
+        if buyer_id not in buyers:
+            outcomes.append((False, RecordError("No buyer found with the given ID.")))
+        elif property_id not in properties:
+            outcomes.append((False, RecordError("No property found with the given ID.")))
+        elif (buyer_id, property_id) in existing:
+            outcomes.append((False, RecordError(
+                f"Buyer {buyers[buyer_id]} is already interested in property {properties[property_id]}."
+            )))
+        else:
+            existing.add((buyer_id, property_id))
+            row = {'buyer_id': buyer_id, 'property_id': property_id}
+            rows.append(row)
+            outcomes.append((True, row))
+    if rows:
+        await connection.execute(insert(association), rows)
+    return outcomes
+
+
+# Batch writer of each kind of queued write
+WRITERS = {
+    'agent': _write_agents,
+    'property': _write_properties,
+    'buyer': _write_buyers,
+    'interest': _write_interests,
+}
@@ -0,0 +1,258 @@
+# Bulk import of agents, properties, buyers and buyer interests from CSV or JSON Lines.
+#
+# The interactive prompts in cli/main.py commit one row at a time, which is far too
+# slow for a nightly feed. This importer streams the input file, validates each row
+# in Python (foreign keys are checked against ID sets preloaded once, not one query
+# per row) and writes accepted rows with batched inserts, one transaction per chunk.
+# Rows that fail validation are written to a side file together with the reason.
+#
+# Usage:
+#   python -m services.bulk_import properties listings.csv
+#   python -m services.bulk_import interests interests.jsonl --chunk-size 20000
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+
+from sqlalchemy import insert, select
+
+from db import make_engine
+
+from models import Agent, Property, Buyer, buyer_property_association
+from services.validation import is_valid_email
+
+# Number of rows written per INSERT batch / transaction
+DEFAULT_CHUNK_SIZE = 5000
+
+# The table each importable entity is written to
+TABLES = {
+    'agents': Agent.__table__,
+    'properties': Property.__table__,
+    'buyers': Buyer.__table__,
+    'interests': buyer_property_association,
+}
+
+
+# Raised by the row validators; the message ends up in the rejects file
+class RejectedRow(ValueError):
+    pass
+
+
+# Summary of a finished import, printed by the command line entry point
+class ImportReport:
+    def __init__(self, entity):
+        self.entity = entity
+        self.read = 0
+        self.inserted = 0
+        self.rejected = 0
+        self.duplicates = 0
+        self.elapsed = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.read / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self):
+        return (
+            f"Imported {self.inserted} {self.entity} "
+            f"({self.read} read, {self.rejected} rejected, {self.duplicates} duplicates skipped) "
+            f"in {self.elapsed:.2f}s ({self.rows_per_second:,.0f} rows/s)"
+        )
+
+
+# Read an input file lazily, one dict per row.
+# The format is taken from the file extension unless given explicitly.
+def read_rows(path, file_format=None):
+    file_format = file_format or ('jsonl' if path.endswith(('.jsonl', '.ndjson', '.json')) else 'csv')
+    with open(path, newline='', encoding='utf-8') as handle:
+        if file_format == 'csv':
+            for row in csv.DictReader(handle):
+                yield row
+        elif file_format == 'jsonl':
+            for line_number, line in enumerate(handle, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # Keep going; the broken line is reported as a rejected row
+                    yield {'_raw': line, '_error': f"invalid JSON on line {line_number}"}
+        else:
+            raise ValueError(f"Unsupported format: {file_format}")
+
+
+# Parse a required non-empty text field
+def _text(row, field):
+    value = row.get(field)
+    value = str(value).strip() if value is not None else ''
+    if not value:
+        raise RejectedRow(f"{field} cannot be empty")
+    return value
+
+
+# Parse a required integer field
+def _integer(row, field):
+    value = row.get(field)
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise RejectedRow(f"invalid integer for {field}: {value!r}")
+
+
+# Parse an optional explicit primary key so feeds can keep their own IDs. Every row
+# gets an 'id' (None lets SQLite assign one): executemany() takes the INSERT's columns
+# from the first row of a chunk, so all rows must have the same keys.
+def _optional_id(row):
+    if row.get('id') in (None, ''):
+        return {'id': None}
+    return {'id': _integer(row, 'id')}
+
+
+# Builds the validated insert parameters for each entity.
+# Foreign keys are checked against the ID sets loaded up front by `BulkImporter`.
+class BulkImporter:
+    def __init__(self, engine, entity, chunk_size=DEFAULT_CHUNK_SIZE):
+        if entity not in TABLES:
+            raise ValueError(f"Unknown entity: {entity}")
+        self.engine = engine
+        self.entity = entity
+        self.table = TABLES[entity]
+        self.chunk_size = chunk_size
+        self.agent_ids = set()
+        self.buyer_ids = set()
+        self.property_ids = set()
+        self._seen_ids = set()
+
+    # Load every ID a row of this entity may reference, in one query per table
+    def preload_keys(self, connection):
+        if self.entity == 'properties':
+            self.agent_ids = set(connection.execute(select(Agent.id)).scalars())
+        elif self.entity == 'interests':
+            self.buyer_ids = set(connection.execute(select(Buyer.id)).scalars())
+            self.property_ids = set(connection.execute(select(Property.id)).scalars())
+
+    def validate(self, row):
+        if '_error' in row:
+            raise RejectedRow(row['_error'])
+
+        if self.entity == 'agents':
+            params = dict(_optional_id(row), name=_text(row, 'name'), phone=_text(row, 'phone'))
+        elif self.entity == 'properties':
+            price = _integer(row, 'price')
+            if price <= 0:
+                raise RejectedRow("price must be a positive integer")
+            agent_id = _integer(row, 'agent_id')
+            if agent_id not in self.agent_ids:
+                raise RejectedRow(f"no agent found with id {agent_id}")
+            params = dict(_optional_id(row), name=_text(row, 'name'), price=price, agent_id=agent_id)
+        elif self.entity == 'buyers':
+            email = _text(row, 'email')
+            if not is_valid_email(email):
+                raise RejectedRow(f"invalid email format: {email!r}")
+            params = dict(_optional_id(row), name=_text(row, 'name'), email=email)
+        else:
+            buyer_id = _integer(row, 'buyer_id')
+            property_id = _integer(row, 'property_id')
+            if buyer_id not in self.buyer_ids:
+                raise RejectedRow(f"no buyer found with id {buyer_id}")
+            if property_id not in self.property_ids:
+                raise RejectedRow(f"no property found with id {property_id}")
+            params = {'buyer_id': buyer_id, 'property_id': property_id}
+
+        # Report explicit IDs repeated within the same feed instead of silently dropping them
+        if params.get('id') is not None:
+            if params['id'] in self._seen_ids:
+                raise RejectedRow(f"duplicate id {params['id']} in input")
+            self._seen_ids.add(params['id'])
+        return params
+
+    # Insert one chunk of validated rows in its own transaction.
+    # Returns the number of rows actually written.
+    def write_chunk(self, batch):
+        # Rows whose key is already on file (an existing ID or interest) are skipped
+        # and counted as duplicates instead of failing the whole batch
+        statement = insert(self.table).prefix_with('OR IGNORE', dialect='sqlite')
+        # Rows with an explicit ID go first, so an ID SQLite assigns to a row without
+        # one cannot take an ID given further down the same chunk
+        batch = sorted(batch, key=lambda params: params.get('id') is None)
+        with self.engine.begin() as connection:
+            result = connection.execute(statement, batch)
+        return result.rowcount if result.rowcount >= 0 else len(batch)
+
+    # Stream `rows` into the database. Rejected rows go to `rejects` (a file object)
+    # as JSON Lines with the original row and the reason it was refused.
+    def run(self, rows, rejects=None):
+        report = ImportReport(self.entity)
+        started = time.perf_counter()
+
+        with self.engine.connect() as connection:
+            self.preload_keys(connection)
+
+        batch = []
+        for row in rows:
+            report.read += 1
+            try:
+                batch.append(self.validate(row))
+            except RejectedRow as error:
+                report.rejected += 1
+                if rejects is not None:
+                    rejects.write(json.dumps({'row': row, 'error': str(error)}) + "\n")
+                continue
+
+            if len(batch) >= self.chunk_size:
+                written = self.write_chunk(batch)
+                report.inserted += written
+                report.duplicates += len(batch) - written
+                batch = []
+
+        if batch:
+            written = self.write_chunk(batch)
+            report.inserted += written
+            report.duplicates += len(batch) - written
+
+        report.elapsed = time.perf_counter() - started
+        return report
+
+
+# Import `path` into `entity` and return the report.
+# Rejected rows are written next to the input unless `rejects_path` is given.
+def import_file(engine, entity, path, file_format=None, chunk_size=DEFAULT_CHUNK_SIZE, rejects_path=None):
+    rejects_path = rejects_path or f"{path}.rejects.jsonl"
+    # Fail on a missing or unreadable input before the rejects file is created
+    with open(path, 'rb'):
+        pass
+    importer = BulkImporter(engine, entity, chunk_size)
+    with open(rejects_path, 'w', encoding='utf-8') as rejects:
+        report = importer.run(read_rows(path, file_format), rejects)
+    if not report.rejected:
+        os.remove(rejects_path)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import agents, properties, buyers or interests.")
+    parser.add_argument('entity', choices=sorted(TABLES))
+    parser.add_argument('path', help="CSV or JSON Lines file to import")
+    parser.add_argument('--format', choices=['csv', 'jsonl'], dest='file_format')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--rejects', help="where to write rejected rows (default: <path>.rejects.jsonl)")
+    parser.add_argument('--db', help="database URL (default: from realestate.ini / REALESTATE_DB_URL)")
+    args = parser.parse_args(argv)
+
+    engine = make_engine(args.db, profile='bulk-load')
+    try:
+        report = import_file(engine, args.entity, args.path, args.file_format, args.chunk_size, args.rejects)
+    except OSError as error:
+        print(f"Error: {error}", file=sys.stderr)
+        return 1
+    print(report)
+    if report.rejected:
+        print(f"Rejected rows written to {args.rejects or args.path + '.rejects.jsonl'}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,175 @@
+# On-disk format of the listing snapshots written by services/snapshot.py.
+#
+# A snapshot is one file holding a few integer columns that analytics jobs map with
+# np.memmap: opening it reads a small header, and a column is only paged in from disk
+# when it is used, so a job starts in milliseconds and reads no more than it touches.
+#
+# Layout (little-endian):
+#   prefix   8-byte magic b'RESNAP\0\0', uint32 format version, uint32 header length
+#   header   JSON: creation time, the change counters and the change log sequence
+#            number the data was read at, row counts, and the dtype, offset and
+#            length of every column
+#   columns  raw arrays, each starting on a 64-byte boundary after the header
+#
+# Only NumPy is imported here (SciPy for Snapshot.interest_matrix()), not SQLAlchemy
+# or the models: reading a snapshot does not touch the database.
+import json
+import os
+import struct
+
+import numpy as np
+
+MAGIC = b'RESNAP\x00\x00'
+
+# Bumped whenever the layout or the meaning of a column changes; readers refuse other versions
+FORMAT_VERSION = 2
+
+# Columns start on multiples of this many bytes (a cache line, and a multiple of any itemsize)
+ALIGNMENT = 64
+
+_PREFIX = struct.Struct('<8sII')
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def _align(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+# The narrowest integer dtype holding every value from `low` to `high`
+def integer_dtype(low, high):
+    info = np.iinfo(np.int32)
+    return np.dtype('<i4') if info.min <= low and high <= info.max else np.dtype('<i8')
+
+
+# Create a snapshot file from column declarations [(name, dtype, length)] and extra
+# header fields. The layout is fixed up front, so the file is allocated at its final
+# size and every column is filled in place, chunk by chunk, through a writable map
+# (`column()`). It is written next to `path` and only renamed over it by `commit()`:
+# readers never map a half-written snapshot.
+class SnapshotWriter:
+    def __init__(self, path, columns, metadata):
+        self.path = path
+        self.temporary = f"{path}.tmp"
+        self.header = dict(metadata, format_version=FORMAT_VERSION, columns={})
+        size = 0
+        for name, dtype, length in columns:
+            dtype = np.dtype(dtype)
+            self.header['columns'][name] = {'dtype': dtype.str, 'offset': size, 'length': int(length)}
+            size = _align(size + dtype.itemsize * int(length))
+        encoded = json.dumps(self.header).encode('utf-8')
+        self.data_start = _align(_PREFIX.size + len(encoded))
+        with open(self.temporary, 'wb') as handle:
+            handle.write(_PREFIX.pack(MAGIC, FORMAT_VERSION, len(encoded)))
+            handle.write(encoded)
+            handle.truncate(self.data_start + size)
+        self._maps = []
+
+    # Writable array over column `name`
+    def column(self, name):
+        spec = self.header['columns'][name]
+        if spec['length'] == 0:
+            return np.empty(0, dtype=spec['dtype'])
+        array = np.memmap(
+            self.temporary, dtype=spec['dtype'], mode='r+', offset=self.data_start + spec['offset'], shape=(spec['length'],),
+        )
+        self._maps.append(array)
+        return array
+
+    # Flush the columns to disk and move the file into place
+    def commit(self):
+        for array in self._maps:
+            array.flush()
+        self._maps = []
+        with open(self.temporary, 'rb+') as handle:
+            os.fsync(handle.fileno())
+        os.replace(self.temporary, self.path)
+
+    def abort(self):
+        self._maps = []
+        if os.path.exists(self.temporary):
+            os.remove(self.temporary)
+
+
+# A snapshot opened for reading. Only the header is read here; each column is mapped
+# read-only the first time it is asked for and shared by later calls.
+class Snapshot:
+    def __init__(self, path):
+        self.path = path
+        try:
+            with open(path, 'rb') as handle:
+                prefix = handle.read(_PREFIX.size)
+                if len(prefix) < _PREFIX.size or prefix[:len(MAGIC)] != MAGIC:
+                    raise SnapshotError(f"{path} is not a listing snapshot")
+                _, version, length = _PREFIX.unpack(prefix)
+                if version != FORMAT_VERSION:
+                    raise SnapshotError(
+                        f"{path} has snapshot format {version}, this version reads format {FORMAT_VERSION}; write a new snapshot"
+                    )
+                self.header = json.loads(handle.read(length))
+        except FileNotFoundError:
+            raise SnapshotError(f"Snapshot not found: {path}")
+        self.data_start = _align(_PREFIX.size + length)
+        self._columns = {}
+
+    def __repr__(self):
+        return f"<Snapshot(path={self.path}, properties={self.properties}, interests={self.interests})>"
+
+    @property
+    def created_at(self):
+        return self.header['created_at']
+
+    # {table name: change counter} the snapshot was read at
+    @property
+    def data_versions(self):
+        return self.header['data_versions']
+
+    @property
+    def properties(self):
+        return self.header['properties']
+
+    @property
+    def interests(self):
+        return self.header['interests']
+
+    # Change log sequence number of the last change included
+    @property
+    def interest_mark(self):
+        return self.header['interest_mark']
+
+    def column_names(self):
+        return list(self.header['columns'])
+
+    # Read-only array over column `name`
+    def column(self, name):
+        if name not in self._columns:
+            spec = self.header['columns'].get(name)
+            if spec is None:
+                raise SnapshotError(f"{self.path} has no column {name!r}")
+            if spec['length'] == 0:
+                array = np.empty(0, dtype=spec['dtype'])
+            else:
+                array = np.memmap(
+                    self.path, dtype=spec['dtype'], mode='r', offset=self.data_start + spec['offset'], shape=(spec['length'],),
+                )
+            self._columns[name] = array
+        return self._columns[name]
+
+    # The buyers x properties 0/1 interest matrix (rows indexed by buyer id, columns by
+    # property id) as a SciPy CSR matrix over the mapped columns, without copying them
+    def interest_matrix(self):
+        from scipy import sparse
+
+        indptr = self.column('interest_indptr')
+        indices = self.column('interest_property_id')
+        shape = (max(len(indptr) - 1, 0), self.header['interest_columns'])
+        return sparse.csr_matrix((np.ones(len(indices), dtype=np.int32), indices, indptr), shape=shape, copy=False)
+
+    # The interest pairs as two arrays (buyer_ids, property_ids), as
+    # services/co_interest.py load_interests() returns them
+    def interest_pairs(self):
+        indptr = self.column('interest_indptr')
+        buyer_ids = np.repeat(np.arange(max(len(indptr) - 1, 0), dtype=np.int64), np.diff(indptr))
+        return buyer_ids, self.column('interest_property_id')
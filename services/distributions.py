@@ -0,0 +1,192 @@
+# NumPy accumulators for distributions streamed in chunks (used by services/price_stats.py).
+#
+# Each accumulator takes a stream of value arrays chunk by chunk and keeps a state
+# whose size does not depend on the number of values: moments, a histogram over fixed
+# bands, exact quantiles of a sorted stream, and PriceSketch, a mergeable quantile
+# sketch with a bounded relative error. Moments, BandHistogram and PriceSketch merge,
+# so parts computed separately (e.g. on each shard) combine into the figures of the
+# whole. Only the statistics command imports this module, so NumPy is not loaded by
+# the rest of the CLI.
+import math
+
+import numpy as np
+
+
+# Yield the rows of `statement` as (rows x columns) int64 arrays of up to `chunk_size` rows.
+# The rows are fetched from the DBAPI cursor, skipping SQLAlchemy's per-row processing.
+def iter_chunks(connection, statement, chunk_size):
+    result = connection.execute(statement)
+    try:
+        width = len(result.keys())
+        while True:
+            rows = result.cursor.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield np.array(rows, dtype=np.int64).reshape(len(rows), width)
+    finally:
+        result.close()
+
+
+# Count, mean, variance, min and max, merged chunk by chunk (Chan et al.'s parallel update)
+class Moments:
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, values):
+        if len(values) == 0:
+            return
+        mean = float(values.mean())
+        self._combine(len(values), mean, float(((values - mean) ** 2).sum()), int(values.min()), int(values.max()))
+
+    # Add the values summarized by another Moments
+    def merge(self, other):
+        if other.count:
+            self._combine(other.count, other.mean, other.m2, other.min, other.max)
+
+    def _combine(self, count, mean, m2, low, high):
+        delta = mean - self.mean
+        total = self.count + count
+        self.mean += delta * count / total
+        self.m2 += m2 + delta * delta * self.count * count / total
+        self.count = total
+        self.min = low if self.min is None else min(self.min, low)
+        self.max = high if self.max is None else max(self.max, high)
+
+    @property
+    def std(self):
+        return math.sqrt(self.m2 / self.count) if self.count else None
+
+
+# Counts per band, the bands given by their strictly increasing lower edges; the last
+# band is open-ended and values below the first edge are counted separately
+class BandHistogram:
+    def __init__(self, edges):
+        self.edges = np.asarray(edges, dtype=np.int64)
+        if len(self.edges) == 0 or np.any(np.diff(self.edges) <= 0):
+            raise ValueError("Band edges must be strictly increasing")
+        self.counts = np.zeros(len(self.edges) + 1, dtype=np.int64)
+
+    def add(self, values):
+        self.counts += np.bincount(np.searchsorted(self.edges, values, side='right'), minlength=len(self.counts))
+
+    # Add the counts of another histogram over the same bands
+    def merge(self, other):
+        if not np.array_equal(other.edges, self.edges):
+            raise ValueError("Only histograms over the same bands can be merged")
+        self.counts += other.counts
+
+    # [{'low', 'high', 'count'}] per band (high is None for the last one)
+    def rows(self):
+        edges = self.edges.tolist()
+        rows = [{'low': None, 'high': edges[0], 'count': int(self.counts[0])}] if self.counts[0] else []
+        for index, low in enumerate(edges):
+            high = edges[index + 1] if index + 1 < len(edges) else None
+            rows.append({'low': low, 'high': high, 'count': int(self.counts[index + 1])})
+        return rows
+
+
+# Exact quantiles of consecutive groups of a sorted stream, e.g. every agent's prices
+# read in (agent_id, price) order, given the size of each group up front. The
+# q-quantile of a group of n values starting at position s lies between positions
+# floor/ceil(s + q * (n - 1)) (linear interpolation, numpy.quantile's default); only
+# the values at those positions are kept as the chunks go by.
+class SortedQuantiles:
+    def __init__(self, counts, quantiles):
+        counts = np.asarray(counts, dtype=np.int64)
+        starts = np.cumsum(counts) - counts
+        exact = starts[:, None] + np.asarray(quantiles, dtype=np.float64)[None, :] * (counts[:, None] - 1)
+        self.empty = counts == 0
+        self.low = np.floor(exact).astype(np.int64)
+        self.high = np.ceil(exact).astype(np.int64)
+        self.weight = exact - self.low
+        self.positions = np.unique(np.concatenate([self.low.ravel(), self.high.ravel()]))
+        self.values = np.zeros(len(self.positions), dtype=np.int64)
+        self.total = int(counts.sum())
+        self.seen = 0
+
+    # Take the next chunk of the sorted stream
+    def add(self, chunk):
+        start, end = np.searchsorted(self.positions, [self.seen, self.seen + len(chunk)])
+        self.values[start:end] = chunk[self.positions[start:end] - self.seen]
+        self.seen += len(chunk)
+
+    # (groups x quantiles) list of lists, None for empty groups
+    def result(self):
+        low = self.values[np.searchsorted(self.positions, self.low)]
+        high = self.values[np.searchsorted(self.positions, self.high)]
+        values = low + self.weight * (high - low)
+        return [None if empty else row for empty, row in zip(self.empty.tolist(), values.tolist())]
+
+
+# Log-bucketed histogram answering quantile queries within a relative error of
+# `accuracy` (the DDSketch idea): a value x > 0 falls in bucket ceil(log(x) / log(gamma)),
+# with gamma = (1 + accuracy) / (1 - accuracy), and every value of a bucket is within
+# `accuracy` of the bucket's representative value. Counts are kept per group (e.g.
+# agent) as sorted (key, count) arrays, key = group * _GROUP_SPAN + bucket, so the size
+# grows with the distinct (group, bucket) pairs seen, not with the values added.
+# Sketches with the same accuracy merge by adding their counts. The finer the accuracy,
+# the more buckets a value range spans: below MIN_ACCURACY the buckets of large values
+# would run into the next group's keys, so such accuracies are refused.
+class PriceSketch:
+    _BUCKET_OFFSET = 1 << 20  # bucket 0 holds values <= 0; the offset leaves room for negative exponents
+    _GROUP_SPAN = 1 << 21
+    # Values up to _MAX_VALUE (any int64 price) get a bucket below _GROUP_SPAN at MIN_ACCURACY
+    _MAX_VALUE = 2.0 ** 63
+    MIN_ACCURACY = math.tanh(math.log(_MAX_VALUE) / (_GROUP_SPAN - _BUCKET_OFFSET - 1) / 2) * (1 + 1e-9)
+
+    def __init__(self, accuracy):
+        if not self.MIN_ACCURACY <= accuracy < 1:
+            raise ValueError(f"The sketch accuracy must be at least {self.MIN_ACCURACY:.2g} and below 1")
+        self.accuracy = accuracy
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.keys = np.empty(0, dtype=np.int64)
+        self.counts = np.empty(0, dtype=np.int64)
+
+    def _buckets(self, values):
+        buckets = np.zeros(len(values), dtype=np.int64)
+        positive = values > 0
+        buckets[positive] = np.ceil(np.log(values[positive]) / self._log_gamma).astype(np.int64) + self._BUCKET_OFFSET
+        # Values beyond the range (far below 1 or above _MAX_VALUE) share the end buckets
+        # rather than landing in another group's keys
+        np.clip(buckets, 0, self._GROUP_SPAN - 1, out=buckets)
+        buckets[positive & (buckets == 0)] = 1
+        return buckets
+
+    # Add `values`, optionally each with its `groups` id
+    def add(self, values, groups=None):
+        keys = self._buckets(np.asarray(values, dtype=np.float64))
+        if groups is not None:
+            keys += np.asarray(groups, dtype=np.int64) * self._GROUP_SPAN
+        keys, counts = np.unique(keys, return_counts=True)
+        self._merge(keys, counts)
+
+    # Add the counts of another sketch with the same accuracy
+    def merge(self, other):
+        if other.accuracy != self.accuracy:
+            raise ValueError("Only sketches with the same accuracy can be merged")
+        self._merge(other.keys, other.counts)
+
+    def _merge(self, keys, counts):
+        keys, inverse = np.unique(np.concatenate([self.keys, keys]), return_inverse=True)
+        self.counts = np.bincount(
+            inverse, weights=np.concatenate([self.counts, counts]), minlength=len(keys),
+        ).astype(np.int64)
+        self.keys = keys
+
+    # Approximate `quantiles` of one group (group 0 when no groups were given), or
+    # None for each if the group is empty
+    def quantiles(self, quantiles, group=0):
+        start, end = np.searchsorted(self.keys, [group * self._GROUP_SPAN, (group + 1) * self._GROUP_SPAN])
+        counts = np.cumsum(self.counts[start:end])
+        if len(counts) == 0:
+            return [None] * len(quantiles)
+        ranks = np.asarray(quantiles, dtype=np.float64) * (counts[-1] - 1)
+        buckets = self.keys[start:end][np.searchsorted(counts, ranks, side='right')] % self._GROUP_SPAN
+        exponents = (buckets - self._BUCKET_OFFSET).astype(np.float64)
+        estimates = np.where(buckets == 0, 0.0, 2 * self.gamma ** exponents / (self.gamma + 1))
+        return estimates.tolist()
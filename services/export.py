@@ -0,0 +1,157 @@
+# Streaming export of agents, properties, buyers and interests to CSV or JSON Lines.
+#
+# Rows are read with SQLAlchemy Core `select()` statements executed with
+# `stream_results`/`yield_per`, so the database cursor is consumed in fixed-size
+# batches of plain tuples: no ORM objects are built and memory stays constant
+# however large the export is. Output can go to stdout or a file, optionally gzipped.
+import contextlib
+import csv
+import gzip
+import io
+import json
+import sys
+
+from sqlalchemy import select, func, tuple_
+
+from models import Agent, Property, Buyer, buyer_property_association
+
+# Rows fetched from the cursor per batch
+DEFAULT_BATCH_SIZE = 10000
+
+EXPORT_FORMATS = ('csv', 'jsonl')
+
+EXPORT_MODELS = {'agents': Agent, 'buyers': Buyer, 'properties': Property}
+
+
+# Number of buyers interested in each property, as a correlated subquery: it is
+# answered from ix_buyer_property_association_property_id row by row, so the export
+# keeps streaming instead of aggregating the whole interest table up front
+def _interest_count():
+    return (
+        select(func.count())
+        .where(buyer_property_association.c.property_id == Property.id)
+        .correlate(Property)
+        .scalar_subquery()
+        .label('interest_count')
+    )
+
+
+# The statement exported for `entity`. With `joined=True` properties carry their
+# agent's name and interest count, and interests carry buyer/property names.
+def export_query(entity, joined=False):
+    if entity == 'agents':
+        return select(Agent.id, Agent.name, Agent.phone).order_by(Agent.id)
+    if entity == 'buyers':
+        return select(Buyer.id, Buyer.name, Buyer.email).order_by(Buyer.id)
+    if entity == 'properties':
+        if not joined:
+            return select(Property.id, Property.name, Property.price, Property.agent_id).order_by(Property.id)
+        return (
+            select(
+                Property.id, Property.name, Property.price, Property.agent_id,
+                Agent.name.label('agent_name'), _interest_count(),
+            )
+            .outerjoin(Agent, Agent.id == Property.agent_id)
+            .order_by(Property.id)
+        )
+    if entity == 'interests':
+        association = buyer_property_association
+        if not joined:
+            return select(association.c.buyer_id, association.c.property_id).order_by(
+                association.c.buyer_id, association.c.property_id
+            )
+        return (
+            select(
+                association.c.buyer_id, association.c.property_id,
+                Buyer.name.label('buyer_name'), Property.name.label('property_name'),
+            )
+            .join(Buyer, Buyer.id == association.c.buyer_id)
+            .join(Property, Property.id == association.c.property_id)
+            .order_by(association.c.buyer_id, association.c.property_id)
+        )
+    raise ValueError(f"Unknown entity: {entity}")
+
+
+# The columns identifying an exported row, which lead each export statement and give
+# its order: the id, or (buyer_id, property_id) for interests
+def export_key(entity):
+    if entity == 'interests':
+        return buyer_property_association.c.buyer_id, buyer_property_association.c.property_id
+    if entity in EXPORT_MODELS:
+        return (EXPORT_MODELS[entity].id,)
+    raise ValueError(f"Unknown entity: {entity}")
+
+
+# One page of an export: up to `page_size` rows after the row whose key is `after`
+# (None for the first page). Used to export several databases at once (services/fanout.py).
+def export_page_query(entity, joined=False, page_size=DEFAULT_BATCH_SIZE, after=None):
+    statement = export_query(entity, joined)
+    if after is not None:
+        key = export_key(entity)
+        statement = statement.where(key[0] > after[0] if len(key) == 1 else tuple_(*key) > tuple_(*after))
+    return statement.limit(page_size)
+
+
+def export_page(connection, entity, joined, page_size, after):
+    return connection.execute(export_page_query(entity, joined, page_size, after)).all()
+
+
+# Open the export destination: stdout when `path` is None or "-", gzip-compressed
+# when `compress` is set (or the file name ends in .gz)
+def open_output(path=None, compress=False):
+    if path in (None, '-'):
+        if compress:
+            return io.TextIOWrapper(gzip.GzipFile(fileobj=sys.stdout.buffer, mode='wb'), encoding='utf-8', newline='')
+        return io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', newline='', write_through=True)
+    if compress or path.endswith('.gz'):
+        return gzip.open(path, 'wt', encoding='utf-8', newline='')
+    return open(path, 'w', encoding='utf-8', newline='')
+
+
+# Stream `entity` from `engine` to the text file `out`. Returns the number of rows written.
+def export_rows(engine, entity, out, export_format='csv', joined=False, batch_size=DEFAULT_BATCH_SIZE):
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {export_format}")
+    statement = export_query(entity, joined)
+
+    with engine.connect() as connection:
+        result = connection.execution_options(stream_results=True, yield_per=batch_size).execute(statement)
+        return write_rows(out, list(result.keys()), result.partitions(), export_format)
+
+
+# Write `pages` (lists of row tuples) with column names `keys` to `out`. Returns the number of rows written.
+def write_rows(out, keys, pages, export_format='csv'):
+    count = 0
+    if export_format == 'csv':
+        writer = csv.writer(out)
+        writer.writerow(keys)
+        for rows in pages:
+            writer.writerows(rows)
+            count += len(rows)
+    else:
+        dumps = json.dumps
+        for rows in pages:
+            out.writelines(dumps(dict(zip(keys, row))) + "\n" for row in rows)
+            count += len(rows)
+    return count
+
+
+# The export destination as a context manager (see open_output()); stdout itself is left open
+@contextlib.contextmanager
+def output(path=None, compress=False):
+    out = open_output(path, compress)
+    try:
+        yield out
+    finally:
+        if path in (None, '-') and not compress:
+            # Leave stdout itself open
+            out.flush()
+            out.detach()
+        else:
+            out.close()
+
+
+# Export `entity` to `path` (stdout if None). Returns the number of rows written.
+def export(engine, entity, path=None, export_format='csv', joined=False, compress=False, batch_size=DEFAULT_BATCH_SIZE):
+    with output(path, compress) as out:
+        return export_rows(engine, entity, out, export_format, joined, batch_size)
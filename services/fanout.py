@@ -0,0 +1,138 @@
+# Queries run on every regional shard (db/shards.py) at once, in a pool of processes.
+#
+# Work is sent to the pool as (shard, function, arguments) tasks. The function is a
+# plain module-level function taking a Connection first, e.g.
+# services.search.search_properties. Each worker process keeps one engine per shard
+# (read-replica profile by default), so a task costs a connection checkout, not a
+# new engine.
+#
+# Results come back in two ways:
+#   ShardPool.map()      one result per shard, e.g. top-N rows or the partial
+#                        aggregates of a report, which the caller combines
+#   ShardPool.stream()   a shard's rows page by page, by keyset pagination (each page
+#                        a task resuming after the key of the previous page's last
+#                        row). The next page is already requested while the current
+#                        one is consumed.
+# merge() combines sorted per-shard streams with a k-way merge (heapq.merge), so a
+# consolidated listing or export is written as it is read. Memory is bounded by two
+# pages per shard, whatever the size of the shards.
+import heapq
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+
+from db.shards import ShardError, check_shards
+
+# Shards queried at the same time at most (one worker process each)
+MAX_WORKERS = 16
+
+# Engines of the worker process, by (url, profile)
+_engines = {}
+
+
+def _engine(url, profile):
+    key = (url, profile)
+    if key not in _engines:
+        from db import make_engine
+
+        _engines[key] = make_engine(url, profile)
+    return _engines[key]
+
+
+# Run in a worker: `function(connection, *args)` on the shard at `url`. Lists of
+# result rows are sent back as plain tuples, which pickle smaller and faster.
+def _run(url, profile, function, args):
+    from sqlalchemy.engine import Row
+
+    with _engine(url, profile).connect() as connection:
+        result = function(connection, *args)
+    if isinstance(result, list) and result and isinstance(result[0], Row):
+        result = [tuple(row) for row in result]
+    return result
+
+
+# A process pool over the shards {region: url}. Use as a context manager.
+class ShardPool:
+    def __init__(self, shards, profile='read-replica', workers=None):
+        if not shards:
+            raise ShardError("No shards are configured")
+        check_shards(shards)
+        self.shards = dict(shards)
+        self.profile = profile
+        self.executor = ProcessPoolExecutor(max_workers=workers or min(len(self.shards), MAX_WORKERS))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def submit(self, region, function, *args):
+        return self.executor.submit(_run, self.shards[region], self.profile, function, args)
+
+    # `function(connection, *args)` on every shard in parallel: {region: result}
+    def map(self, function, *args):
+        futures = {region: self.submit(region, function, *args) for region in self.shards}
+        return {region: _result(region, future) for region, future in futures.items()}
+
+    # `function(connection, *args)` on every shard, each with its own arguments
+    # {region: args}: {region: result}
+    def map_each(self, function, arguments):
+        futures = {region: self.submit(region, function, *args) for region, args in arguments.items()}
+        return {region: _result(region, future) for region, future in futures.items()}
+
+    # Pages of rows of one shard. `fetch(connection, *args, page_size, after)` returns
+    # up to `page_size` rows following the row whose key is `after` (None to start
+    # from the first row); `key(row)` gives that key. The first page is requested
+    # right away, so the streams of all shards start together.
+    def stream(self, region, fetch, args, page_size, key, after=None):
+        first = self.submit(region, fetch, *args, page_size, after)
+        return self._pages(region, first, fetch, args, page_size, key)
+
+    def _pages(self, region, future, fetch, args, page_size, key):
+        while True:
+            rows = _result(region, future)
+            if len(rows) < page_size:
+                if rows:
+                    yield rows
+                return
+            future = self.submit(region, fetch, *args, page_size, key(rows[-1]))
+            yield rows
+
+    # stream() on every shard: {region: pages}
+    def streams(self, fetch, args, page_size, key, after=None):
+        return {region: self.stream(region, fetch, args, page_size, key, after) for region in self.shards}
+
+
+def _result(region, future):
+    try:
+        return future.result()
+    except ShardError:
+        raise
+    except Exception as error:
+        raise ShardError(f"{region}: {error}") from error
+
+
+# k-way merge of the sorted page streams {region: pages} into one stream of rows
+# (region, *row), ordered by `key(row)` and then by region
+def merge(streams, key):
+    def tagged(region, pages):
+        for rows in pages:
+            for row in rows:
+                yield (key(row), region), (region, *row)
+
+    merged = heapq.merge(*(tagged(region, pages) for region, pages in streams.items()), key=lambda item: item[0])
+    return (row for _, row in merged)
+
+
+# Group a stream of rows into pages of `size` rows, stopping after `limit` rows
+def paginate(rows, size, limit=None):
+    if limit is not None:
+        rows = itertools.islice(rows, limit)
+    while True:
+        page = list(itertools.islice(rows, size))
+        if not page:
+            return
+        yield page
@@ -0,0 +1,142 @@
+# Bounded LRU cache of Agent, Buyer and Property rows looked up by primary key.
+#
+# The record checks (does this agent exist? load this buyer, this property) hit the
+# same handful of IDs over and over in scripted and bulk workloads. The cache keeps
+# the column values of recently used rows, keyed by (model, id), and hands them back
+# to a session with `session.merge(..., load=False)`, so a hit costs no SQL.
+#
+# Entries are dropped by the mapper `after_insert`/`after_update`/`after_delete`
+# events whenever the ORM writes one of these rows. A session also remembers the rows
+# it flushed in its current transaction, and evicts them again if it rolls back (they
+# may have been cached, uncommitted, after the flush); a rollback that wrote none of
+# these rows, like the one after a duplicate interest, leaves the cache alone.
+# Only rows that exist are cached: a missing ID is always looked up again, so rows
+# inserted through Core (bulk import) are found. Writes made by other processes are
+# not seen; the cache is per process.
+from collections import OrderedDict
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+from models import Agent, Property, Buyer
+
+# Rows kept before the least recently used one is evicted
+DEFAULT_MAXSIZE = 1024
+
+CACHED_MODELS = (Agent, Property, Buyer)
+
+# Session.info key of the (model, id) pairs flushed in the current transaction
+_FLUSHED = 'identity_cache_flushed'
+
+
+class IdentityCache:
+    def __init__(self, maxsize=DEFAULT_MAXSIZE):
+        self.maxsize = maxsize
+        self._rows = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._rows)
+
+    # Return the cached instance of `model` with primary key `pk`, attached to
+    # `session`, or load it with one query. Returns None if there is no such row.
+    def get(self, session, model, pk):
+        key = (model, pk)
+        values = self._rows.get(key)
+        if values is not None:
+            self._rows.move_to_end(key)
+            self.hits += 1
+            instance = model(**values)
+            make_transient_to_detached(instance)
+            return session.merge(instance, load=False)
+
+        self.misses += 1
+        instance = load_query(session, model, pk).first()
+        if instance is not None:
+            self._store(key, instance)
+        return instance
+
+    # True if the row exists (answered from the cache when possible)
+    def exists(self, session, model, pk):
+        return self.get(session, model, pk) is not None
+
+    def _store(self, key, instance):
+        if self.maxsize <= 0:
+            return
+        mapper = inspect(instance).mapper
+        self._rows[key] = {attr.key: getattr(instance, attr.key) for attr in mapper.column_attrs}
+        self._rows.move_to_end(key)
+        while len(self._rows) > self.maxsize:
+            self._rows.popitem(last=False)
+            self.evictions += 1
+
+    # Forget one row (after it was written)
+    def invalidate(self, model, pk):
+        if self._rows.pop((model, pk), None) is not None:
+            self.invalidations += 1
+
+    def clear(self):
+        self.invalidations += len(self._rows)
+        self._rows.clear()
+
+    # Change the capacity, evicting least recently used rows if it shrinks
+    def resize(self, maxsize):
+        self.maxsize = maxsize
+        while len(self._rows) > max(maxsize, 0):
+            self._rows.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._rows),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+    def reset_stats(self):
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+
+
+# The query loading a row on a cache miss
+def load_query(session, model, pk):
+    return session.query(model).filter_by(id=pk)
+
+
+# The process-wide cache used by services/records.py
+identity_cache = IdentityCache()
+
+
+def _invalidate_row(mapper, connection, target):
+    identity_cache.invalidate(mapper.class_, target.id)
+
+
+# Remember the cached rows flushed in the session's transaction
+def _track_flushed(session, flush_context):
+    for instance in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(instance, CACHED_MODELS):
+            session.info.setdefault(_FLUSHED, set()).add((type(instance), instance.id))
+
+
+def _evict_on_rollback(session):
+    for model, pk in session.info.pop(_FLUSHED, ()):
+        identity_cache.invalidate(model, pk)
+
+
+def _forget_on_commit(session):
+    session.info.pop(_FLUSHED, None)
+
+
+for _model in CACHED_MODELS:
+    for _event in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(_model, _event, _invalidate_row)
+event.listen(Session, 'after_flush', _track_flushed)
+event.listen(Session, 'after_rollback', _evict_on_rollback)
+event.listen(Session, 'after_commit', _forget_on_commit)
@@ -0,0 +1,112 @@
+# Keyset-paginated listings for the "View All" menu options.
+#
+# Instead of `session.query(Model).all()` (which materializes every ORM object
+# and the whole rendered table before anything prints), each page is fetched with
+# `WHERE id > :last_id ORDER BY id LIMIT :page_size`. Only plain column tuples are
+# loaded, so memory stays proportional to one page whatever the table size, and the
+# first page only costs one primary-key range scan. Pages are Core selects, run on a
+# plain Connection: listing goes through no Session and no identity map.
+from sqlalchemy import select
+from tabulate import tabulate
+
+from models import Agent, Property, Buyer
+
+# Number of rows shown per page unless the caller asks for something else
+DEFAULT_PAGE_SIZE = 50
+
+# The columns and headers shown for every listable entity
+LISTINGS = {
+    'agents': (Agent, ('id', 'name', 'phone'), ["ID", "Name", "Phone"]),
+    'properties': (Property, ('id', 'name', 'price', 'agent_id'), ["ID", "Name", "Price", "Agent ID"]),
+    'buyers': (Buyer, ('id', 'name', 'email'), ["ID", "Name", "Email"]),
+}
+
+
+# Build the query for a single page of rows for `entity`.
+# `after_id` pages forward (rows with a greater id), `before_id` pages backward
+# (rows with a smaller id, newest first so the LIMIT keeps the rows closest to the page).
+def page_query(entity, page_size=DEFAULT_PAGE_SIZE, after_id=None, before_id=None):
+    model, column_names, _ = LISTINGS[entity]
+    statement = select(*[getattr(model, name) for name in column_names])
+
+    if before_id is not None:
+        statement = statement.where(model.id < before_id).order_by(model.id.desc())
+    else:
+        if after_id is not None:
+            statement = statement.where(model.id > after_id)
+        statement = statement.order_by(model.id)
+    return statement.limit(page_size)
+
+
+# Fetch a single page of rows for `entity`, always in ascending id order
+def fetch_page(connection, entity, page_size=DEFAULT_PAGE_SIZE, after_id=None, before_id=None):
+    rows = connection.execute(page_query(entity, page_size, after_id, before_id)).all()
+    if before_id is not None:
+        # Pages walked backwards come back newest first
+        rows.reverse()
+    return rows
+
+
+# Generator yielding consecutive pages of `entity`, starting after `after_id`.
+# Each page is fetched only when the previous one has been consumed.
+def iter_pages(connection, entity, page_size=DEFAULT_PAGE_SIZE, after_id=None):
+    while True:
+        rows = fetch_page(connection, entity, page_size, after_id=after_id)
+        if not rows:
+            return
+        yield rows
+        if len(rows) < page_size:
+            return
+        after_id = rows[-1][0]
+
+
+# Print every page of `entity` as soon as it arrives (non-interactive mode)
+def stream_listing(connection, entity, page_size=DEFAULT_PAGE_SIZE, out=print):
+    headers = LISTINGS[entity][2]
+    printed = False
+    for rows in iter_pages(connection, entity, page_size):
+        out(tabulate(rows, headers=headers))
+        printed = True
+    if not printed:
+        out(f"No {entity} found.")
+
+
+# Interactive pager: shows one page at a time and lets the operator move
+# forward (n), backward (p), print everything that is left (a) or quit (q).
+def page_through(connection, entity, page_size=DEFAULT_PAGE_SIZE, prompt=None, out=print):
+    prompt = prompt or input
+    headers = LISTINGS[entity][2]
+    rows = fetch_page(connection, entity, page_size)
+    if not rows:
+        out(f"No {entity} found.")
+        return
+
+    out(tabulate(rows, headers=headers))
+    if len(rows) < page_size:
+        # Everything fits on the first page, nothing to page through
+        return
+
+    while True:
+        choice = prompt("[n]ext, [p]revious, [a]ll remaining, [q]uit: ").strip().lower()
+        if choice in ('', 'n'):
+            next_rows = fetch_page(connection, entity, page_size, after_id=rows[-1][0])
+            if not next_rows:
+                out("Already on the last page.")
+                continue
+            rows = next_rows
+        elif choice == 'p':
+            previous_rows = fetch_page(connection, entity, page_size, before_id=rows[0][0])
+            if not previous_rows:
+                out("Already on the first page.")
+                continue
+            rows = previous_rows
+        elif choice == 'a':
+            for page in iter_pages(connection, entity, page_size, after_id=rows[-1][0]):
+                out(tabulate(page, headers=headers))
+            return
+        elif choice == 'q':
+            return
+        else:
+            out("Invalid choice, please try again.")
+            continue
+        out(tabulate(rows, headers=headers))
@@ -0,0 +1,386 @@
+# Market statistics over listing prices: quantiles, a histogram by price band,
+# per-agent price distributions and outliers.
+#
+# Prices are streamed from the DBAPI cursor in chunks of `chunk_size` rows into NumPy
+# arrays, and every statistic is accumulated chunk by chunk, so memory depends on the
+# chunk size and the number of agents, never on the number of listings.
+#
+# Exact mode reads the prices in index order (ix_properties_price, and
+# ix_properties_agent_id_price for the per-agent figures). With the row count known up
+# front, the q-quantile is the value at position q * (n - 1), picked out of whichever
+# chunk contains that position. Approximate mode makes one unordered pass into
+# PriceSketch, a log-bucketed histogram with a bounded relative error (the DDSketch
+# idea): it needs no sort order, and sketches of different chunks, agents or
+# databases merge by adding their counts.
+#
+# Reports are cached in `price_stats_cache`, keyed by their parameters and by the
+# `properties` change counter (models/price_statistics.py). A cached report is
+# returned as long as no listing has been added, removed or re-priced since.
+#
+# Across regional shards (db/shards.py), each shard computes the partial figures of its
+# own listings in one pass: moments, histogram and a PriceSketch, which merge exactly,
+# and the figures of its agents, who only list on that shard. The market quantiles of
+# a sharded report therefore always come from the merged sketch.
+#
+# The NumPy accumulators live in services/distributions.py and are imported when a
+# report is computed, so the query builders here can be imported without NumPy.
+import datetime
+import heapq
+import json
+
+from sqlalchemy import select, insert, delete, func
+
+from models import Agent, Property, price_stats_cache, table_versions
+
+DEFAULT_QUANTILES = (0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99)
+
+# Lower edges of the histogram's price bands; the last band is open-ended
+DEFAULT_BANDS = (0, 250000, 500000, 1000000, 2500000, 5000000, 10000000, 25000000, 50000000, 100000000)
+
+# Rows fetched from the cursor per chunk
+DEFAULT_CHUNK_SIZE = 100000
+
+# Relative error of the approximate quantiles
+DEFAULT_ACCURACY = 0.01
+
+# Outliers lie more than this many interquartile ranges below Q1 or above Q3
+DEFAULT_IQR_FACTOR = 1.5
+
+# Outlying listings shown on each side of the market fences
+OUTLIER_EXAMPLES = 5
+
+# Computing a report is retried this many times if listings change while it runs
+MAX_ATTEMPTS = 3
+
+
+class StatisticsError(Exception):
+    pass
+
+
+# Raised when the listings changed while a report was being computed
+class _Changed(Exception):
+    pass
+
+
+# Statements streamed by the report: all prices (in price order for exact quantiles),
+# (agent_id, price) pairs, and prices grouped by agent in (agent_id, price) order
+def price_stream_query(ordered=True):
+    statement = select(Property.price)
+    return statement.order_by(Property.price) if ordered else statement
+
+
+def agent_price_stream_query(ordered=True):
+    statement = select(func.coalesce(Property.agent_id, 0), Property.price)
+    if ordered:
+        statement = statement.where(Property.agent_id.isnot(None)).order_by(Property.agent_id, Property.price)
+    return statement
+
+
+# count/sum/min/max per agent, with the agent's name, ordered by agent id
+def agent_groups_query():
+    groups = (
+        select(
+            Property.agent_id, func.count().label('listings'), func.sum(Property.price).label('total'),
+            func.min(Property.price).label('low'), func.max(Property.price).label('high'),
+        )
+        .where(Property.agent_id.isnot(None))
+        .group_by(Property.agent_id)
+        .subquery('groups')
+    )
+    return (
+        select(groups.c.agent_id, Agent.name, groups.c.listings, groups.c.total, groups.c.low, groups.c.high)
+        .outerjoin(Agent, Agent.id == groups.c.agent_id)
+        .order_by(groups.c.agent_id)
+    )
+
+
+def data_version(connection):
+    version = connection.scalar(select(table_versions.c.version).where(table_versions.c.table_name == 'properties'))
+    return version or 0
+
+
+def _fences(q1, q3, factor):
+    spread = q3 - q1
+    return q1 - factor * spread, q3 + factor * spread
+
+
+# Market figures: moments, quantiles and histogram of all prices. Q1 and Q3 are always
+# computed, for the outlier fences.
+def _market(connection, quantiles, bands, approx, accuracy, chunk_size):
+    from services.distributions import BandHistogram, Moments, SortedQuantiles, iter_chunks
+
+    wanted = _wanted(quantiles)
+    if approx:
+        moments, histogram, sketch = _market_accumulators(connection, bands, accuracy, chunk_size)
+        return moments, histogram, dict(zip(wanted, sketch.quantiles(wanted)))
+
+    moments, histogram = Moments(), BandHistogram(bands)
+    count = connection.scalar(select(func.count()).select_from(Property))
+    exact = SortedQuantiles([count], wanted)
+    for chunk in iter_chunks(connection, price_stream_query(ordered=True), chunk_size):
+        prices = chunk[:, 0]
+        exact.add(prices)
+        moments.add(prices)
+        histogram.add(prices)
+    if exact.seen != count:
+        raise _Changed()
+    values = exact.result()[0] or [None] * len(wanted)
+    return moments, histogram, dict(zip(wanted, values))
+
+
+# Moments, histogram and quantile sketch of all prices, from one unordered pass
+def _market_accumulators(connection, bands, accuracy, chunk_size):
+    from services.distributions import BandHistogram, Moments, PriceSketch, iter_chunks
+
+    moments, histogram, sketch = Moments(), BandHistogram(bands), PriceSketch(accuracy)
+    for chunk in iter_chunks(connection, price_stream_query(ordered=False), chunk_size):
+        prices = chunk[:, 0]
+        sketch.add(prices)
+        moments.add(prices)
+        histogram.add(prices)
+    return moments, histogram, sketch
+
+
+def _wanted(quantiles):
+    return sorted(set(quantiles) | {0.25, 0.75})
+
+
+# Per-agent figures: count/mean/min/max from one grouped query over
+# ix_properties_agent_id_price, quantiles from the (agent_id, price) stream
+def _agents(connection, quantiles, approx, accuracy, chunk_size):
+    from services.distributions import PriceSketch, SortedQuantiles, iter_chunks
+
+    wanted = _wanted(quantiles)
+    groups = connection.execute(agent_groups_query()).all()
+    if approx:
+        sketch = PriceSketch(accuracy)
+        for chunk in iter_chunks(connection, agent_price_stream_query(ordered=False), chunk_size):
+            sketch.add(chunk[:, 1], chunk[:, 0])
+        per_agent = [sketch.quantiles(wanted, group.agent_id) for group in groups]
+    else:
+        exact = SortedQuantiles([group.listings for group in groups], wanted)
+        for chunk in iter_chunks(connection, agent_price_stream_query(ordered=True), chunk_size):
+            exact.add(chunk[:, 1])
+        if exact.seen != exact.total:
+            raise _Changed()
+        per_agent = exact.result()
+    return [
+        {
+            'agent_id': agent_id, 'name': name, 'count': listings, 'mean': total / listings, 'min': low, 'max': high,
+            'quantiles': dict(zip(wanted, values)),
+        }
+        for (agent_id, name, listings, total, low, high), values in zip(groups, per_agent)
+    ]
+
+
+# Number of listings of each agent outside its fences, given as JSON text
+# [[agent_id, low, high], ...]: two index range counts per agent in one statement
+def agent_outliers_query(fences):
+    rows = func.json_each(fences).table_valued('value').alias('fences')
+    agent_id = func.json_extract(rows.c.value, '$[0]')
+
+    def outside(condition):
+        return select(func.count()).select_from(Property).where(Property.agent_id == agent_id, condition).scalar_subquery()
+
+    below = outside(Property.price < func.json_extract(rows.c.value, '$[1]'))
+    above = outside(Property.price > func.json_extract(rows.c.value, '$[2]'))
+    return select(agent_id, below + above)
+
+
+def _count_agent_outliers(connection, agents, factor):
+    fences = [[agent['agent_id'], *_fences(agent['quantiles'][0.25], agent['quantiles'][0.75], factor)] for agent in agents]
+    counts = dict(connection.execute(agent_outliers_query(json.dumps(fences))).all())
+    for agent, (_, low, high) in zip(agents, fences):
+        agent['outliers'] = counts.get(agent['agent_id'], 0)
+        agent['fences'] = [low, high]
+
+
+# Listings outside the market fences: counts and the most extreme few on each side
+def _market_outliers(connection, low, high):
+    listing = (Property.id, Property.name, Property.price, Property.agent_id)
+
+    def examples(condition, order):
+        return [dict(row._mapping) for row in connection.execute(select(*listing).where(condition).order_by(order).limit(OUTLIER_EXAMPLES))]
+
+    return {
+        'low_fence': low,
+        'high_fence': high,
+        'below': connection.scalar(select(func.count()).select_from(Property).where(Property.price < low)),
+        'above': connection.scalar(select(func.count()).select_from(Property).where(Property.price > high)),
+        'lowest': examples(Property.price < low, Property.price),
+        'highest': examples(Property.price > high, Property.price.desc()),
+    }
+
+
+def _market_report(moments, histogram, market_quantiles, quantiles, approx, accuracy):
+    return {
+        'mode': 'approx' if approx else 'exact',
+        'accuracy': accuracy,
+        'count': moments.count,
+        'min': moments.min,
+        'max': moments.max,
+        'mean': moments.mean if moments.count else None,
+        'std': moments.std,
+        'quantiles': [{'quantile': q, 'price': market_quantiles[q]} for q in quantiles],
+        'histogram': histogram.rows(),
+    }
+
+
+# Per-agent figures with their quantiles listed in the requested order
+def _agent_rows(agents, quantiles):
+    for agent in agents:
+        agent['quantiles'] = [{'quantile': q, 'price': agent['quantiles'][q]} for q in quantiles]
+    return agents
+
+
+def _compute(connection, options):
+    quantiles = options['quantiles']
+    approx = options['approx']
+    accuracy = options['accuracy']
+    moments, histogram, market_quantiles = _market(
+        connection, quantiles, options['bands'], approx, accuracy, options['chunk_size'],
+    )
+    report = _market_report(moments, histogram, market_quantiles, quantiles, approx, accuracy)
+    factor = options['iqr_factor']
+    if options['outliers'] and moments.count:
+        low, high = _fences(market_quantiles[0.25], market_quantiles[0.75], factor)
+        report['outliers'] = dict(_market_outliers(connection, low, high), iqr_factor=factor)
+    if options['by_agent']:
+        agents = _agents(connection, quantiles, approx, accuracy, options['chunk_size'])
+        if options['outliers']:
+            _count_agent_outliers(connection, agents, factor)
+        report['agents'] = _agent_rows(agents, quantiles)
+    return report
+
+
+def _cached(connection, key, version):
+    row = connection.execute(
+        select(price_stats_cache.c.data_version, price_stats_cache.c.result).where(price_stats_cache.c.cache_key == key)
+    ).first()
+    if row is not None and row.data_version == version:
+        return json.loads(row.result)
+    return None
+
+
+def _store(connection, key, version, report):
+    connection.execute(delete(price_stats_cache).where(price_stats_cache.c.cache_key == key))
+    connection.execute(insert(price_stats_cache).values(
+        cache_key=key, data_version=version, computed_at=datetime.datetime.now(), result=json.dumps(report),
+    ))
+
+
+def _check_options(quantiles, bands, approx, accuracy):
+    quantiles = [float(q) for q in quantiles]
+    bands = [int(edge) for edge in bands]
+    if not quantiles or any(not 0 <= q <= 1 for q in quantiles):
+        raise StatisticsError("Quantiles must be between 0 and 1")
+    if not bands or any(high <= low for low, high in zip(bands, bands[1:])):
+        raise StatisticsError("Price bands must be given as increasing lower edges")
+    if approx:
+        from services.distributions import PriceSketch
+
+        if not PriceSketch.MIN_ACCURACY <= accuracy < 1:
+            raise StatisticsError(f"The accuracy must be at least {PriceSketch.MIN_ACCURACY:.2g} and below 1")
+    return quantiles, bands
+
+
+# Compute the price statistics report (a JSON-able dict), or return the cached one if
+# no listing changed since it was computed. Returns (report, from_cache).
+def price_statistics(engine, quantiles=DEFAULT_QUANTILES, bands=DEFAULT_BANDS, by_agent=False, outliers=False,
+                     approx=False, accuracy=DEFAULT_ACCURACY, iqr_factor=DEFAULT_IQR_FACTOR,
+                     chunk_size=DEFAULT_CHUNK_SIZE, use_cache=True):
+    quantiles, bands = _check_options(quantiles, bands, approx, accuracy)
+    options = {
+        'quantiles': quantiles, 'bands': bands, 'by_agent': by_agent, 'outliers': outliers,
+        'approx': approx, 'accuracy': accuracy if approx else None, 'iqr_factor': iqr_factor,
+    }
+    # The chunk size changes how, not what, is computed, so it is not part of the key
+    key = json.dumps(options, sort_keys=True)
+    options['chunk_size'] = chunk_size
+
+    with engine.connect() as connection:
+        version = data_version(connection)
+        if use_cache:
+            report = _cached(connection, key, version)
+            if report is not None:
+                return report, True
+        for _ in range(MAX_ATTEMPTS):
+            try:
+                report = _compute(connection, options)
+            except _Changed:
+                report = None
+            # The statements above do not share one snapshot: the report is only
+            # consistent if the change counter did not move while they ran
+            latest = data_version(connection)
+            if report is not None and latest == version:
+                break
+            version = latest
+        else:
+            raise StatisticsError("Listings kept changing while the statistics were computed; try again")
+        connection.rollback()
+        report['data_version'] = version
+        if use_cache:
+            with connection.begin():
+                _store(connection, key, version, report)
+    return report, False
+
+
+# The part of a sharded report computed on one shard, in one read transaction: the
+# market accumulators and the (approximate) figures of the shard's agents
+def shard_statistics(connection, quantiles, bands, by_agent, outliers, accuracy, iqr_factor, chunk_size):
+    # pysqlite only opens a transaction before writes: begin one explicitly so every
+    # statement below reads the same version of the shard
+    connection.exec_driver_sql('BEGIN')
+    try:
+        part = {'data_version': data_version(connection)}
+        part['moments'], part['histogram'], part['sketch'] = _market_accumulators(connection, bands, accuracy, chunk_size)
+        if by_agent:
+            part['agents'] = _agents(connection, quantiles, True, accuracy, chunk_size)
+            if outliers:
+                _count_agent_outliers(connection, part['agents'], iqr_factor)
+    finally:
+        connection.rollback()
+    return part
+
+
+# Compute the price statistics report over all the shards of `pool` (a
+# services.fanout.ShardPool). Quantiles are approximate, from the merged sketches;
+# agents carry their region. Sharded reports are not cached.
+def sharded_price_statistics(pool, quantiles=DEFAULT_QUANTILES, bands=DEFAULT_BANDS, by_agent=False, outliers=False,
+                             accuracy=DEFAULT_ACCURACY, iqr_factor=DEFAULT_IQR_FACTOR, chunk_size=DEFAULT_CHUNK_SIZE):
+    quantiles, bands = _check_options(quantiles, bands, True, accuracy)
+    parts = pool.map(shard_statistics, quantiles, bands, by_agent, outliers, accuracy, iqr_factor, chunk_size)
+
+    moments, histogram, sketch = None, None, None
+    for part in parts.values():
+        if moments is None:
+            moments, histogram, sketch = part['moments'], part['histogram'], part['sketch']
+        else:
+            moments.merge(part['moments'])
+            histogram.merge(part['histogram'])
+            sketch.merge(part['sketch'])
+    wanted = _wanted(quantiles)
+    market_quantiles = dict(zip(wanted, sketch.quantiles(wanted)))
+    report = _market_report(moments, histogram, market_quantiles, quantiles, True, accuracy)
+
+    if outliers and moments.count:
+        low, high = _fences(market_quantiles[0.25], market_quantiles[0.75], iqr_factor)
+        found = pool.map(_market_outliers, low, high)
+        examples = {
+            side: [dict(example, region=region) for region, part in found.items() for example in part[side]]
+            for side in ('lowest', 'highest')
+        }
+        report['outliers'] = {
+            'low_fence': low,
+            'high_fence': high,
+            'below': sum(part['below'] for part in found.values()),
+            'above': sum(part['above'] for part in found.values()),
+            'lowest': heapq.nsmallest(OUTLIER_EXAMPLES, examples['lowest'], key=lambda e: e['price']),
+            'highest': heapq.nlargest(OUTLIER_EXAMPLES, examples['highest'], key=lambda e: e['price']),
+            'iqr_factor': iqr_factor,
+        }
+    if by_agent:
+        agents = [dict(agent, region=region) for region, part in parts.items() for agent in part['agents']]
+        report['agents'] = _agent_rows(agents, quantiles)
+    report['data_version'] = {region: part['data_version'] for region, part in parts.items()}
+    return report
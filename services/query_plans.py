@@ -0,0 +1,278 @@
+# Query-plan regression check for the queries issued by the CLI.
+#
+# Every query the CLI runs is registered in CLI_QUERIES, built by calling the same
+# query builders the services execute. The check runs `EXPLAIN QUERY PLAN` on each one
+# and fails if SQLite would read a whole table instead of searching an index. Queries
+# that deliberately walk a table in primary-key order under a LIMIT (the first page of
+# a listing) are marked as bounded scans and allowed. SQLite leaves trigger programs
+# out of the plan of a write, so the statements of the triggers an INSERT, UPDATE or
+# DELETE fires are explained as well.
+#
+# Usage:
+#   python -m services.query_plans                      # fresh schema built from the models
+#   python -m services.query_plans --db sqlite:///real_estate.db   # a migrated database
+import argparse
+import re
+import sys
+
+from sqlalchemy.orm import sessionmaker
+
+from db import make_engine
+from models import Base, Agent, Property, Buyer
+from services.identity_cache import load_query
+from services.records import (
+    buyer_email_query, buyer_row_query, interests_insert, existing_ids_query, buyer_interests_query,
+)
+from services.listing import LISTINGS, page_query
+from services.search import search_query
+from services.export import export_query, export_page_query
+from services.analytics import portfolio_query
+from services.recommendations import (
+    recommendation_query, seeds_query, neighbors_state_query, pending_interests_query,
+    neighbor_list_query, neighbor_list_delete, shared_buyers_query, neighbor_score_update, excess_neighbors_delete,
+)
+from services.price_stats import price_stream_query, agent_price_stream_query, agent_groups_query, agent_outliers_query
+from services.snapshot import listing_columns_query, interest_pairs_query
+from services.replication import (
+    REPLICATED_TABLES, INTERESTS, changes_query, rows_query, listing_agents_query, summary_rows_query,
+)
+
+# Sample parameter values; SQLite's plan does not depend on the actual values
+SAMPLE_ID = 1
+SAMPLE_EMAIL = 'buyer@example.com'
+
+
+# One query the CLI issues, the function building it and whether a bounded scan is expected
+class PlannedQuery:
+    def __init__(self, name, build, bounded_scan=False):
+        self.name = name
+        self.build = build
+        self.bounded_scan = bounded_scan
+
+
+# Registry of every query the CLI issues. Features adding new queries register them
+# here so they are covered by the check.
+CLI_QUERIES = [
+    PlannedQuery("agent by id", lambda session: load_query(session, Agent, SAMPLE_ID)),
+    PlannedQuery("buyer by id", lambda session: load_query(session, Buyer, SAMPLE_ID)),
+    PlannedQuery("property by id", lambda session: load_query(session, Property, SAMPLE_ID)),
+    PlannedQuery("buyer row", lambda session: buyer_row_query(SAMPLE_ID)),
+    PlannedQuery("buyer by normalized email", lambda session: buyer_email_query(SAMPLE_EMAIL)),
+    PlannedQuery("buyer's interested properties", lambda session: buyer_interests_query(SAMPLE_ID)),
+    PlannedQuery("existing buyer ids", lambda session: existing_ids_query(Buyer, [SAMPLE_ID, SAMPLE_ID + 1])),
+    PlannedQuery("existing property ids", lambda session: existing_ids_query(Property, [SAMPLE_ID, SAMPLE_ID + 1])),
+    PlannedQuery(
+        "record interest", lambda session: interests_insert().values(buyer_id=SAMPLE_ID, property_id=SAMPLE_ID),
+    ),
+    PlannedQuery("search by price range", lambda session: search_query(min_price=100000, max_price=200000)),
+    PlannedQuery("search by agent", lambda session: search_query(agent_id=SAMPLE_ID, sort='price-desc')),
+    PlannedQuery("search by name", lambda session: search_query(text='sea view')),
+    PlannedQuery(
+        "search by name and price",
+        lambda session: search_query(text='villa', min_price=100000, max_price=200000, sort='price'),
+    ),
+    # Newest/cheapest listings with no filter walk an index under a LIMIT
+    PlannedQuery("search cheapest", lambda session: search_query(), bounded_scan=True),
+]
+
+# Listing pages: the first page walks the primary key under a LIMIT, the others seek
+for _entity in LISTINGS:
+    CLI_QUERIES.extend([
+        PlannedQuery(f"{_entity} first page", lambda session, e=_entity: page_query(e), bounded_scan=True),
+        PlannedQuery(f"{_entity} next page", lambda session, e=_entity: page_query(e, after_id=SAMPLE_ID)),
+        PlannedQuery(f"{_entity} previous page", lambda session, e=_entity: page_query(e, before_id=SAMPLE_ID)),
+    ])
+
+
+# Exports read every row by design (one pass over the driving table)
+for _entity in ('agents', 'buyers', 'properties', 'interests'):
+    for _joined in (False, True):
+        CLI_QUERIES.append(PlannedQuery(
+            f"export {_entity}{' joined' if _joined else ''}",
+            lambda session, e=_entity, j=_joined: export_query(e, j),
+            bounded_scan=True,
+        ))
+    # Later pages of an export of several shards resume after the last row's key
+    _after = (SAMPLE_ID, SAMPLE_ID) if _entity == 'interests' else (SAMPLE_ID,)
+    CLI_QUERIES.append(PlannedQuery(
+        f"export {_entity} next page", lambda session, e=_entity, a=_after: export_page_query(e, after=a),
+    ))
+
+
+# Portfolio reports walk the agents table once (one row per agent); their per-agent
+# lookups must still be answered from indexes
+for _live in (False, True):
+    _report = 'live' if _live else 'summary'
+    CLI_QUERIES.append(PlannedQuery(
+        f"portfolio {_report}", lambda session, l=_live: portfolio_query(l), bounded_scan=True,
+    ))
+    CLI_QUERIES.append(PlannedQuery(
+        f"portfolio {_report} of one agent", lambda session, l=_live: portfolio_query(l, agent_id=SAMPLE_ID),
+    ))
+
+
+# Recommendations: neighbour rows of the buyer's seed properties, from the precomputed
+# table and counted live
+CLI_QUERIES.append(PlannedQuery("recommendation seeds", lambda session: seeds_query(SAMPLE_ID)))
+for _live in (False, True):
+    CLI_QUERIES.append(PlannedQuery(
+        f"recommendations{' live' if _live else ''}",
+        lambda session, l=_live: recommendation_query(SAMPLE_ID, [1, 2, 3], 100000, 5000000, live=l),
+    ))
+
+# Keeping the neighbour table current after new interests (update_neighbors)
+CLI_QUERIES.extend([
+    PlannedQuery("neighbours state", lambda session: neighbors_state_query()),
+    PlannedQuery("neighbours pending interests", lambda session: pending_interests_query(SAMPLE_ID, SAMPLE_ID + 1000, 50)),
+    PlannedQuery("neighbours recount", lambda session: neighbor_list_query(SAMPLE_ID, 20)),
+    PlannedQuery("neighbours replace list", lambda session: neighbor_list_delete(SAMPLE_ID)),
+    PlannedQuery("neighbours shared buyers", lambda session: shared_buyers_query(SAMPLE_ID, [SAMPLE_ID, SAMPLE_ID + 1])),
+    PlannedQuery("neighbours merge score", lambda session: neighbor_score_update(SAMPLE_ID, SAMPLE_ID, 3)),
+    PlannedQuery("neighbours trim lists", lambda session: excess_neighbors_delete([SAMPLE_ID, SAMPLE_ID + 1], 20)),
+])
+
+
+# Price statistics stream every price once, in index order for exact quantiles; the
+# per-agent figures and outlier counts must come from ix_properties_agent_id_price
+for _ordered in (True, False):
+    _order = 'ordered' if _ordered else 'unordered'
+    CLI_QUERIES.extend([
+        PlannedQuery(f"price stats {_order} prices", lambda session, o=_ordered: price_stream_query(o), bounded_scan=True),
+        PlannedQuery(
+            f"price stats {_order} agent prices", lambda session, o=_ordered: agent_price_stream_query(o), bounded_scan=True,
+        ),
+    ])
+CLI_QUERIES.extend([
+    PlannedQuery("price stats per agent", lambda session: agent_groups_query()),
+    PlannedQuery("price stats agent outliers", lambda session: agent_outliers_query('[[1, 100000.0, 5000000.0]]')),
+])
+
+
+# Listing snapshots copy the property columns and the interest pairs once, walking the
+# primary keys
+CLI_QUERIES.extend([
+    PlannedQuery("snapshot listings", lambda session: listing_columns_query(), bounded_scan=True),
+    PlannedQuery("snapshot interests", lambda session: interest_pairs_query(), bounded_scan=True),
+])
+
+
+# Replica syncs read a range of the change log, then look the rows it names up by key,
+# and the portfolio summary rows of the agents of the listings among them
+CLI_QUERIES.append(PlannedQuery("change log after seq", lambda session: changes_query(SAMPLE_ID, 1000, SAMPLE_ID + 1000)))
+for _name in REPLICATED_TABLES:
+    _keys = [(SAMPLE_ID, SAMPLE_ID), (SAMPLE_ID + 1, SAMPLE_ID)] if _name == INTERESTS else [SAMPLE_ID, SAMPLE_ID + 1]
+    CLI_QUERIES.append(PlannedQuery(f"replica sync {_name} rows", lambda session, n=_name, k=_keys: rows_query(n, k)))
+CLI_QUERIES.extend([
+    PlannedQuery("replica sync listing agents", lambda session: listing_agents_query([SAMPLE_ID, SAMPLE_ID + 1])),
+    PlannedQuery("replica sync summary rows", lambda session: summary_rows_query([SAMPLE_ID, SAMPLE_ID + 1])),
+])
+
+
+# Register an additional query to be covered by the check
+def register_query(name, build, bounded_scan=False):
+    CLI_QUERIES.append(PlannedQuery(name, build, bounded_scan))
+
+
+# Render a Query/select with its parameters inlined so it can be prefixed with EXPLAIN
+def compile_sql(statement, dialect):
+    statement = getattr(statement, 'statement', statement)
+    return str(statement.compile(dialect=dialect, compile_kwargs={"literal_binds": True}))
+
+
+# Return the `detail` column of EXPLAIN QUERY PLAN for `sql`
+def explain(connection, sql):
+    return [row[-1] for row in connection.exec_driver_sql("EXPLAIN QUERY PLAN " + sql)]
+
+
+_TRIGGER_EVENT = re.compile(r"\b(?:BEFORE|AFTER|INSTEAD\s+OF)\s+(INSERT|UPDATE|DELETE)\b.*?\bON\s+(\w+)", re.I | re.S)
+_TRIGGER_BODY = re.compile(r"\bBEGIN\b(.*)\bEND\s*$", re.I | re.S)
+_ROW_REFERENCE = re.compile(r"\b(?:new|old)\.\w+", re.I)
+
+
+# (trigger name, SQL) of the statements run by the triggers on `operation` of `table`,
+# with references to the new/old row replaced by a sample value
+def trigger_statements(connection, table, operation):
+    triggers = connection.exec_driver_sql(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND tbl_name = ? ORDER BY name", (table,)
+    ).all()
+    for name, sql in triggers:
+        event = _TRIGGER_EVENT.search(sql)
+        if event is None or event.group(1).upper() != operation:
+            continue
+        body = _ROW_REFERENCE.sub(str(SAMPLE_ID), _TRIGGER_BODY.search(sql).group(1))
+        for statement in body.split(';'):
+            if statement.strip():
+                yield name, statement.strip()
+
+
+# The plans of the trigger statements fired by `statement`, if it is a write
+def trigger_plans(connection, statement):
+    statement = getattr(statement, 'statement', statement)
+    if not getattr(statement, 'is_dml', False):
+        return
+    operation = 'INSERT' if statement.is_insert else 'UPDATE' if statement.is_update else 'DELETE'
+    for name, sql in trigger_statements(connection, statement.table.name, operation):
+        yield name, explain(connection, sql)
+
+
+# True when a plan line reads an entire table (no index involved). Scans of
+# `materialized` subqueries read the subquery's already filtered result, not a table.
+def is_table_scan(detail, materialized=()):
+    if not detail.startswith('SCAN '):
+        return False
+    if detail.split()[1] in materialized:
+        return False
+    # "VIRTUAL TABLE INDEX" is a lookup in the FTS5 full-text index
+    exempt = ('USING INDEX', 'USING COVERING INDEX', 'CONSTANT ROW', 'VIRTUAL TABLE INDEX')
+    return not any(marker in detail for marker in exempt)
+
+
+def _uses_indexes(plan):
+    materialized = {detail.split()[1] for detail in plan if detail.startswith(('MATERIALIZE ', 'CO-ROUTINE '))}
+    return not any(is_table_scan(detail, materialized) for detail in plan)
+
+
+# Explain every registered query, and the statements of the triggers each write
+# fires. Returns a list of (name, plan lines, ok) tuples.
+def check_query_plans(engine, queries=None):
+    queries = CLI_QUERIES if queries is None else queries
+    results = []
+    session = sessionmaker(bind=engine)()
+    try:
+        with engine.connect() as connection:
+            for query in queries:
+                statement = query.build(session)
+                plan = explain(connection, compile_sql(statement, engine.dialect))
+                results.append((query.name, plan, query.bounded_scan or _uses_indexes(plan)))
+                for trigger, trigger_plan in trigger_plans(connection, statement):
+                    results.append((f"{query.name} / trigger {trigger}", trigger_plan, _uses_indexes(trigger_plan)))
+    finally:
+        session.close()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fail if any CLI query regresses to a table scan.")
+    parser.add_argument('--db', help="database URL to check (default: in-memory schema from the models)")
+    args = parser.parse_args(argv)
+
+    if args.db:
+        engine = make_engine(args.db, profile='read-replica')
+    else:
+        engine = make_engine('sqlite://')
+        Base.metadata.create_all(engine)
+
+    failures = 0
+    for name, plan, ok in check_query_plans(engine):
+        print(f"{'ok  ' if ok else 'SCAN'}  {name}: {'; '.join(plan)}")
+        failures += not ok
+
+    if failures:
+        print(f"{failures} quer{'y' if failures == 1 else 'ies'} regressed to a table scan.")
+        return 1
+    print("All query plans use indexes.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
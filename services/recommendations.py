@@ -0,0 +1,344 @@
+# "Buyers who wanted X also wanted Y" property recommendations.
+#
+# Recommendations are read from `property_neighbors`, the top-K co-interest
+# neighbours of every property (models/property_neighbors.py). For a buyer, the
+# neighbours of the properties they already want are summed, properties they already
+# want are dropped, and the rest is filtered to a price band around the prices of
+# their interests. That is one indexed query over at most `max_seeds` x K rows,
+# whatever the size of the interest table.
+#
+# The neighbour table is built offline by `rebuild_neighbors()` (sparse matrix
+# product, see services/co_interest.py) into a staging table that is swapped in when
+# complete, and kept current by `update_neighbors()` (`recommendations update`, run
+# periodically), which folds in the interests added since the last build or update:
+# they are read from the change log (models/change_log.py), whose sequence numbers
+# only grow, the sequence number reached is kept in `property_neighbors_state`, and
+# only properties touched by newer interests are recounted. `changes compact` keeps
+# the entries past it. Recording an interest never touches the neighbour table (a
+# recount reads every buyer of the property), so recommendations lag new interests
+# until the next update. Until the table has been built, recommendations fall back to counting
+# co-interest live from the association table.
+import time
+
+from sqlalchemy import MetaData, select, insert, delete, update, func, tuple_, bindparam
+
+from models import Property, buyer_property_association, change_log, property_neighbors, property_neighbors_state
+from services.records import buyer_row
+from services.replication import last_seq
+
+# Neighbours kept per property
+DEFAULT_K = 20
+
+# Number of recommendations returned
+DEFAULT_LIMIT = 10
+
+# The price band reaches this fraction below the 10th and above the 90th percentile
+# of the prices of the buyer's interests
+DEFAULT_PRICE_BAND = 0.25
+
+# At most this many of the buyer's interests (the most recently listed) seed the
+# recommendations, which bounds the work for buyers with thousands of interests
+DEFAULT_MAX_SEEDS = 200
+
+# Pending interests folded in per transaction by `recommendations update`
+UPDATE_BATCH_SIZE = 200
+
+# Rows inserted per statement (and per transaction) when writing the neighbour table
+WRITE_CHUNK_SIZE = 50000
+
+# The neighbour table being written by a rebuild, until it replaces property_neighbors
+STAGING_TABLE = '_rebuild_property_neighbors'
+
+RECOMMENDATION_HEADERS = ["ID", "Name", "Price", "Score", "Because Of"]
+
+def neighbors_state_query():
+    return select(property_neighbors_state.c.k, property_neighbors_state.c.interest_mark).where(property_neighbors_state.c.id == 1)
+
+
+# The neighbour table's (k, interest_mark), or None if it has never been built
+def neighbors_state(connection):
+    row = connection.execute(neighbors_state_query()).first()
+    return tuple(row) if row else None
+
+
+def _set_state(connection, k, mark):
+    connection.execute(delete(property_neighbors_state))
+    connection.execute(insert(property_neighbors_state).values(id=1, k=k, interest_mark=mark))
+
+
+# A table shaped like property_neighbors, named STAGING_TABLE
+def _staging_table():
+    metadata = MetaData()
+    Property.__table__.to_metadata(metadata)
+    return property_neighbors.to_metadata(metadata, name=STAGING_TABLE)
+
+
+# Recompute the whole neighbour table from the interest table. The rows are written
+# to a staging table, WRITE_CHUNK_SIZE rows per transaction, and a final short
+# transaction drops the old table and renames the staging table in its place, so
+# other writers only ever wait for one chunk and recommendations read the previous
+# table until the swap. With a listing `snapshot` (services/columnar.py), the
+# interests are mapped from it instead of being read from the database. Interests
+# recorded after the snapshot or the read are left for update_neighbors(). Returns
+# the number of neighbour rows written.
+def rebuild_neighbors(engine, k=DEFAULT_K, block_size=None, log=None, snapshot=None):
+    from services.co_interest import DEFAULT_BLOCK_SIZE, load_interests, interest_matrix, co_interest_top_k
+
+    log = log or (lambda message: None)
+    written = 0
+    staging = _staging_table()
+    with engine.connect() as connection:
+        started = time.perf_counter()
+        if snapshot is not None:
+            mark = snapshot.interest_mark
+            matrix = snapshot.interest_matrix()
+            log(f"Mapped {snapshot.interests} interests from {snapshot.path} in {time.perf_counter() - started:.1f}s")
+        else:
+            # pysqlite only opens a transaction before writes: begin one explicitly so
+            # the interests loaded are exactly those up to the mark
+            connection.exec_driver_sql('BEGIN')
+            try:
+                mark = last_seq(connection)
+                buyer_ids, property_ids = load_interests(connection)
+            finally:
+                connection.rollback()
+            matrix = interest_matrix(buyer_ids, property_ids)
+            log(f"Loaded {len(buyer_ids)} interests in {time.perf_counter() - started:.1f}s")
+
+        # A staging table left by an interrupted rebuild is started over
+        staging.drop(connection, checkfirst=True)
+        staging.create(connection)
+        connection.commit()
+        try:
+            # Plain tuples through the DBAPI executemany: millions of rows are written here
+            statement = str(insert(staging).compile(dialect=connection.dialect))
+            for owners, neighbors, scores in co_interest_top_k(matrix, k, block_size or DEFAULT_BLOCK_SIZE):
+                for start in range(0, len(owners), WRITE_CHUNK_SIZE):
+                    end = start + WRITE_CHUNK_SIZE
+                    connection.exec_driver_sql(statement, list(zip(
+                        owners[start:end].tolist(), neighbors[start:end].tolist(), scores[start:end].tolist()
+                    )))
+                    connection.commit()
+                written += len(owners)
+            log(f"Wrote {written} neighbour rows (k={k}) in {time.perf_counter() - started:.1f}s")
+
+            swap_started = time.perf_counter()
+            connection.exec_driver_sql('BEGIN IMMEDIATE')
+            connection.exec_driver_sql(f"DROP TABLE {property_neighbors.name}")
+            connection.exec_driver_sql(f"ALTER TABLE {STAGING_TABLE} RENAME TO {property_neighbors.name}")
+            # Updates applied to the old table after the mark are applied again to the
+            # new one; recounting a property is idempotent
+            _set_state(connection, k, mark)
+            connection.commit()
+            log(f"Swapped in the new neighbour table in {time.perf_counter() - swap_started:.1f}s")
+        except BaseException:
+            connection.rollback()
+            staging.drop(connection, checkfirst=True)
+            connection.commit()
+            raise
+    return written
+
+
+# Number of buyers interested in both `property_id` and each other property, as a
+# statement yielding (other_property_id, count) rows
+def _co_interest_counts(property_id):
+    mine = buyer_property_association.alias('mine')
+    theirs = buyer_property_association.alias('theirs')
+    count = func.count().label('score')
+    return (
+        select(theirs.c.property_id, count)
+        .join(mine, mine.c.buyer_id == theirs.c.buyer_id)
+        .where(mine.c.property_id == property_id, theirs.c.property_id != property_id)
+        .group_by(theirs.c.property_id)
+    ), count
+
+
+# Interests logged after the `mark` sequence number and up to `through`, oldest first:
+# (seq, row_key) change log entries, the key being "buyer_id:property_id"
+def pending_interests_query(mark, through, limit=None):
+    return (
+        select(change_log.c.seq, change_log.c.row_key)
+        .where(
+            change_log.c.seq > mark, change_log.c.seq <= through,
+            change_log.c.table_name == buyer_property_association.name, change_log.c.operation == 'insert',
+        )
+        .order_by(change_log.c.seq).limit(limit)
+    )
+
+
+# The top `k` co-interest neighbours of a property, counted live
+def neighbor_list_query(property_id, k):
+    counts, count = _co_interest_counts(property_id)
+    return counts.order_by(count.desc(), counts.selected_columns[0]).limit(k)
+
+
+# Co-interest counts of `property_id` with the other properties wanted by `buyer_ids`
+def shared_buyers_query(property_id, buyer_ids):
+    association = buyer_property_association
+    counts, _ = _co_interest_counts(property_id)
+    others = select(association.c.property_id).where(
+        association.c.buyer_id.in_(buyer_ids), association.c.property_id != property_id
+    ).distinct()
+    return counts.where(counts.selected_columns[0].in_(others))
+
+
+def neighbor_list_delete(property_id):
+    return delete(property_neighbors).where(property_neighbors.c.property_id == property_id)
+
+
+# Fold the interests recorded since the last build/update into the neighbour table,
+# on `connection` and inside the caller's transaction. Every property that gained a
+# buyer gets its neighbour list recounted; every property already wanted by that
+# buyer gets the new pair's exact count merged into its list. `max_interests` caps the
+# work done in one call; the rest stays pending for the next one. Returns the number
+# of interests applied (0 if the table has not been built).
+def update_neighbors(connection, max_interests=None):
+    state = neighbors_state(connection)
+    if state is None:
+        return 0
+    k, mark = state
+    through = last_seq(connection)
+    new = connection.execute(pending_interests_query(mark, through, max_interests)).all()
+    # Once caught up, the mark moves past the other changes logged too, so it does not
+    # hold back the compaction of the log
+    new_mark = new[-1].seq if max_interests is not None and len(new) == max_interests else through
+    if new_mark == mark:
+        return 0
+
+    buyers_by_property = {}
+    for entry in new:
+        buyer_id, property_id = (int(part) for part in entry.row_key.split(':'))
+        buyers_by_property.setdefault(property_id, set()).add(buyer_id)
+
+    for property_id, buyer_ids in buyers_by_property.items():
+        # The property's own list: its top K, recounted
+        top = connection.execute(neighbor_list_query(property_id, k)).all()
+        connection.execute(neighbor_list_delete(property_id))
+        if top:
+            connection.execute(insert(property_neighbors), [
+                {'property_id': property_id, 'neighbor_id': neighbor_id, 'score': score} for neighbor_id, score in top
+            ])
+
+        # The properties the new buyers already wanted now share one more buyer with it
+        changed = connection.execute(shared_buyers_query(property_id, buyer_ids)).all()
+        if changed:
+            _merge_neighbor(connection, property_id, changed, k)
+
+    connection.execute(update(property_neighbors_state).values(interest_mark=new_mark))
+    return len(new)
+
+
+# Set the score of `neighbor_id` in the list of `owner` to `score`; both are bound
+# parameters, so the statement can be executed with many `owner`/`new_score` rows
+def neighbor_score_update(neighbor_id, owner=None, score=None):
+    return (
+        update(property_neighbors)
+        .where(property_neighbors.c.property_id == bindparam('owner', owner), property_neighbors.c.neighbor_id == neighbor_id)
+        .values(score=bindparam('new_score', score))
+    )
+
+
+# Remove the neighbours ranked below the top `k` from the lists of the `owners`
+def excess_neighbors_delete(owners, k):
+    ranked = (
+        select(
+            property_neighbors.c.property_id, property_neighbors.c.neighbor_id,
+            func.row_number().over(
+                partition_by=property_neighbors.c.property_id,
+                order_by=(property_neighbors.c.score.desc(), property_neighbors.c.neighbor_id),
+            ).label('rank'),
+        )
+        .where(property_neighbors.c.property_id.in_(owners))
+        .subquery()
+    )
+    excess = select(ranked.c.property_id, ranked.c.neighbor_id).where(ranked.c.rank > k)
+    return delete(property_neighbors).where(
+        tuple_(property_neighbors.c.property_id, property_neighbors.c.neighbor_id).in_(excess)
+    )
+
+
+# Set the score of `neighbor_id` in the lists of the properties in `scores`
+# ((property_id, score) pairs) and trim those lists back to their top K
+def _merge_neighbor(connection, neighbor_id, scores, k):
+    rows = [{'property_id': owner, 'neighbor_id': neighbor_id, 'score': score} for owner, score in scores]
+    connection.execute(
+        neighbor_score_update(neighbor_id),
+        [{'owner': row['property_id'], 'new_score': row['score']} for row in rows],
+    )
+    connection.execute(insert(property_neighbors).prefix_with('OR IGNORE', dialect='sqlite'), rows)
+    connection.execute(excess_neighbors_delete([owner for owner, _ in scores], k))
+
+
+# The buyer's most recently listed interests with their prices: the recommendation seeds
+def seeds_query(buyer_id, max_seeds=DEFAULT_MAX_SEEDS):
+    association = buyer_property_association
+    return (
+        select(Property.id, Property.price)
+        .join(association, association.c.property_id == Property.id)
+        .where(association.c.buyer_id == buyer_id)
+        .order_by(association.c.property_id.desc())
+        .limit(max_seeds)
+    )
+
+
+# Price range around the seeds: from the 10th to the 90th percentile, widened by `band`
+def price_band(prices, band=DEFAULT_PRICE_BAND):
+    prices = sorted(prices)
+    low = prices[int(0.1 * (len(prices) - 1))]
+    high = prices[int(round(0.9 * (len(prices) - 1)))]
+    return int(low * (1 - band)), int(high * (1 + band))
+
+
+# Neighbour (property, score) rows of the seed properties: from the precomputed
+# table, or counted from the interest table when `live`
+def _neighbor_rows(seed_ids, buyer_id, live):
+    if not live:
+        return select(
+            property_neighbors.c.neighbor_id.label('property_id'),
+            property_neighbors.c.score.label('score'),
+        ).where(property_neighbors.c.property_id.in_(seed_ids))
+    mine = buyer_property_association.alias('mine')
+    theirs = buyer_property_association.alias('theirs')
+    return (
+        select(theirs.c.property_id, func.count().label('score'))
+        .join(mine, mine.c.buyer_id == theirs.c.buyer_id)
+        .where(mine.c.property_id.in_(seed_ids), mine.c.buyer_id != buyer_id, theirs.c.property_id.notin_(seed_ids))
+        .group_by(mine.c.property_id, theirs.c.property_id)
+    )
+
+
+# Build the recommendation statement for a buyer whose seeds are `seed_ids`
+def recommendation_query(buyer_id, seed_ids, low, high, limit=DEFAULT_LIMIT, live=False):
+    neighbors = _neighbor_rows(seed_ids, buyer_id, live).subquery('neighbors')
+    association = buyer_property_association
+    already_wanted = (
+        select(association.c.property_id)
+        .where(association.c.buyer_id == buyer_id, association.c.property_id == neighbors.c.property_id)
+        .exists()
+    )
+    score = func.sum(neighbors.c.score).label('score')
+    return (
+        select(Property.id, Property.name, Property.price, score, func.count().label('because_of'))
+        .join(neighbors, neighbors.c.property_id == Property.id)
+        .where(Property.price.between(low, high), ~already_wanted)
+        .group_by(Property.id)
+        .order_by(score.desc(), Property.id)
+        .limit(limit)
+    )
+
+
+# Recommend properties for a buyer: (id, name, price, score, because_of) rows, where
+# `score` is the number of shared buyers summed over the seeds and `because_of` the
+# number of the buyer's interests that led to it. Returns the buyer's (id, name) row
+# with them; raises RecordError for unknown buyers. Read-only: runs on a Connection.
+def recommend_properties(connection, buyer_id, limit=DEFAULT_LIMIT, band=DEFAULT_PRICE_BAND,
+                         max_seeds=DEFAULT_MAX_SEEDS, live=None):
+    buyer = buyer_row(connection, buyer_id)
+    seeds = connection.execute(seeds_query(buyer.id, max_seeds)).all()
+    if not seeds:
+        return buyer, []
+    if live is None:
+        live = neighbors_state(connection) is None
+    low, high = price_band([price for _, price in seeds], band)
+    statement = recommendation_query(buyer.id, [seed_id for seed_id, _ in seeds], low, high, limit, live)
+    return buyer, connection.execute(statement).all()
@@ -0,0 +1,211 @@
+# Creating agents, properties, buyers and interests.
+#
+# These are the checks and writes behind the "Add ..." and "Express Interest" menu
+# options, shared by the interactive menu and the non-interactive subcommands.
+# Invalid input raises RecordError with a message meant for the user; the caller
+# decides how to show it. Lookups by ID go through the identity cache
+# (services/identity_cache.py), so repeated checks of the same rows cost no query.
+# The read-only lookups (buyer_row, buyer_interests) take a plain Connection and
+# load no ORM objects.
+from sqlalchemy import func, insert, select
+
+from models import Agent, Property, Buyer, buyer_property_association
+from services.identity_cache import identity_cache
+from services.validation import is_valid_email
+
+
+# Raised when a record cannot be created; the message is shown to the user
+class RecordError(ValueError):
+    pass
+
+
+# Field checks shared with the asyncio service (services/async_service.py).
+# Each returns the cleaned values or raises RecordError.
+def clean_agent(name, phone):
+    name = name.strip()
+    phone = phone.strip()
+    if not name:
+        raise RecordError("Agent name cannot be empty.")
+    if not phone:
+        raise RecordError("Agent phone cannot be empty.")
+    return name, phone
+
+
+def clean_property(name, price):
+    name = name.strip()
+    if not name:
+        raise RecordError("Property name cannot be empty.")
+    if price <= 0:
+        raise RecordError("Price must be a positive integer.")
+    return name, price
+
+
+def clean_buyer(name, email):
+    name = name.strip()
+    email = email.strip()
+    if not name:
+        raise RecordError("Buyer name cannot be empty.")
+    if not is_valid_email(email):
+        raise RecordError("Invalid email format.")
+    return name, email
+
+
+def create_agent(session, name, phone):
+    name, phone = clean_agent(name, phone)
+    agent = Agent(name=name, phone=phone)
+    session.add(agent)
+    session.commit()
+    return agent
+
+
+def create_property(session, name, price, agent_id):
+    name, price = clean_property(name, price)
+    # Check if the agent ID exists in the database
+    if not identity_cache.exists(session, Agent, agent_id):
+        raise RecordError("No agent found with the given ID.")
+
+    new_property = Property(name=name, price=price, agent_id=agent_id)
+    session.add(new_property)
+    session.commit()
+    return new_property
+
+
+# IDs of the buyers whose normalized email is `email`
+def buyer_email_query(email):
+    return select(Buyer.id).where(func.lower(func.trim(Buyer.email)) == email.lower())
+
+
+def create_buyer(session, name, email):
+    name, email = clean_buyer(name, email)
+    # Emails are unique per buyer (case-insensitive), checked through the normalized email index
+    if session.execute(buyer_email_query(email)).first():
+        raise RecordError("A buyer with this email already exists.")
+
+    buyer = Buyer(name=name, email=email)
+    session.add(buyer)
+    session.commit()
+    return buyer
+
+
+def get_buyer(session, buyer_id):
+    buyer = identity_cache.get(session, Buyer, buyer_id)
+    if not buyer:
+        raise RecordError("No buyer found with the given ID.")
+    return buyer
+
+
+# The buyer's (id, name) row, as a statement
+def buyer_row_query(buyer_id):
+    return select(Buyer.id, Buyer.name).where(Buyer.id == buyer_id)
+
+
+# The buyer's (id, name) row, read through Core: for read-only commands, which
+# have no Session
+def buyer_row(connection, buyer_id):
+    row = connection.execute(buyer_row_query(buyer_id)).first()
+    if row is None:
+        raise RecordError("No buyer found with the given ID.")
+    return row
+
+
+def get_property(session, property_id):
+    found = identity_cache.get(session, Property, property_id)
+    if not found:
+        raise RecordError("No property found with the given ID.")
+    return found
+
+
+# INSERT OR IGNORE of (buyer_id, property_id) rows into the interest table
+def interests_insert():
+    return insert(buyer_property_association).prefix_with('OR IGNORE', dialect='sqlite')
+
+
+# Insert (buyer_id, property_id) rows, skipping pairs that are already recorded.
+# Nothing is loaded from the interest collections, so the cost does not depend on
+# how many interests the buyer or property already has.
+def _insert_interests(session, pairs):
+    result = session.execute(interests_insert(), [{'buyer_id': buyer_id, 'property_id': property_id} for buyer_id, property_id in pairs])
+    return result.rowcount
+
+
+# Record that a buyer is interested in a property. Returns (buyer, property).
+def record_interest(session, buyer_id, property_id):
+    buyer = get_buyer(session, buyer_id)
+    interesting_property = get_property(session, property_id)
+
+    if not _insert_interests(session, [(buyer.id, interesting_property.id)]):
+        session.rollback()
+        raise RecordError(f"Buyer {buyer.name} is already interested in property {interesting_property.name}.")
+    session.commit()
+    return buyer, interesting_property
+
+
+# Outcome of record_interests()
+class InterestReport:
+    def __init__(self):
+        self.requested = 0
+        self.inserted = 0
+        self.duplicates = 0
+        self.rejected = []  # (buyer_id, property_id, reason)
+
+    def __str__(self):
+        return (
+            f"Recorded {self.inserted} interests "
+            f"({self.requested} requested, {self.duplicates} duplicates skipped, {len(self.rejected)} rejected)"
+        )
+
+
+# The IDs from `ids` present in `model`'s table, as a statement
+def existing_ids_query(model, ids):
+    return select(model.id).where(model.id.in_(ids))
+
+
+# IDs from `ids` that exist in `model`'s table, looked up in chunks of IN (...)
+def _existing_ids(session, model, ids, chunk_size=500):
+    ids = list(ids)
+    found = set()
+    for start in range(0, len(ids), chunk_size):
+        found.update(session.scalars(existing_ids_query(model, ids[start:start + chunk_size])))
+    return found
+
+
+# Record many (buyer_id, property_id) pairs in one transaction. Repeated pairs are
+# collapsed, pairs naming an unknown buyer or property are rejected (reported, not
+# raised), and pairs that already exist are skipped by INSERT OR IGNORE.
+def record_interests(session, pairs):
+    report = InterestReport()
+    unique = list(dict.fromkeys((int(buyer_id), int(property_id)) for buyer_id, property_id in pairs))
+    report.requested = len(unique)
+
+    buyers = _existing_ids(session, Buyer, {buyer_id for buyer_id, _ in unique})
+    properties = _existing_ids(session, Property, {property_id for _, property_id in unique})
+    valid = []
+    for buyer_id, property_id in unique:
+        if buyer_id not in buyers:
+            report.rejected.append((buyer_id, property_id, "No buyer found with the given ID."))
+        elif property_id not in properties:
+            report.rejected.append((buyer_id, property_id, "No property found with the given ID."))
+        else:
+            valid.append((buyer_id, property_id))
+
+    if valid:
+        report.inserted = _insert_interests(session, valid)
+    report.duplicates = len(valid) - report.inserted
+    session.commit()
+    return report
+
+
+# The properties a buyer is interested in, as (id, name, price) rows
+def buyer_interests_query(buyer_id):
+    return (
+        select(Property.id, Property.name, Property.price)
+        .join(buyer_property_association, buyer_property_association.c.property_id == Property.id)
+        .where(buyer_property_association.c.buyer_id == buyer_id)
+        .order_by(Property.id)
+    )
+
+
+# The buyer's (id, name) row and the properties they are interested in, as (id, name, price) rows
+def buyer_interests(connection, buyer_id):
+    buyer = buyer_row(connection, buyer_id)
+    return buyer, connection.execute(buyer_interests_query(buyer.id)).all()
@@ -0,0 +1,458 @@
+# Incremental refresh of read replicas from the change log (models/change_log.py).
+#
+# A replica is a copy of the database for reporting. It is seeded once with a full
+# copy made with SQLite's backup API; from then on `sync_replica()` only applies the
+# change log entries past the replica's position (replica_state.position). For every
+# row an entry names, the row's current values are read from the source and written to
+# the replica, or the row is deleted there if the source no longer has it. Entries are
+# applied in batches: each is read in one read transaction of the source and written,
+# with the new position, in one transaction of the replica, so an interrupted sync
+# resumes after the last batch applied. A refresh costs time in proportion to the rows
+# changed since the previous one, not to the size of the database.
+#
+# Since an entry only names a row, the latest entry of each row is enough to bring any
+# replica up to date. `compact_log()` drops the older ones, which is safe whatever the
+# replicas' positions, and the entries up to a sequence number every replica has
+# applied; a replica behind that point has to be seeded again. The recommendation
+# neighbour table reads new interests from the log too (services/recommendations.py),
+# so entries it has not folded in yet are kept.
+#
+# A replica is only written by the sync. Seeding drops its change log triggers, and
+# its portfolio summary triggers: they recount an agent's interested buyers on every
+# listing change, so each batch copies instead the source's summary rows of the agents
+# whose listings it names, as the replica had them and as the source has them now (a
+# row the source no longer has is deleted). The search index and change counter
+# triggers stay, keeping the replica's search and price statistics cache current as
+# changes are applied.
+import datetime
+import os
+import sqlite3
+import time
+
+from sqlalchemy import and_, bindparam, delete, func, or_, select, text, update
+from sqlalchemy.dialects.sqlite import insert
+
+from models import (
+    Agent, Property, Buyer, buyer_property_association, agent_portfolio_summary, change_log, change_log_state, replica_state,
+    property_neighbors_state,
+)
+from models.agent_portfolio_summary import PORTFOLIO_SUMMARY_TRIGGERS
+from models.change_log import CHANGE_LOG_TRIGGER_NAMES
+
+DEFAULT_BATCH_SIZE = 5000
+
+# Keys looked up per IN (...), and interest pairs per OR of key lookups (SQLite parses
+# an OR chain into an expression as deep as the chain is long)
+_CHUNK_SIZE = 500
+_PAIR_CHUNK_SIZE = 250
+
+INTERESTS = 'buyer_property_association'
+
+# Triggers dropped from a replica when it is seeded
+REPLICA_DROPPED_TRIGGERS = [*CHANGE_LOG_TRIGGER_NAMES, *PORTFOLIO_SUMMARY_TRIGGERS]
+
+# The replicated tables, in the order changes are applied: referenced tables first
+REPLICATED_TABLES = {
+    'agents': Agent.__table__,
+    'buyers': Buyer.__table__,
+    'properties': Property.__table__,
+    INTERESTS: buyer_property_association,
+}
+
+# Buyer emails are unique (normalized). A replica row may still hold an email the
+# source has since given to another buyer: it is removed before the new holder is
+# written. It has changed after the replica's position, so a later entry restores it.
+_DISPLACE = {
+    'buyers': "DELETE FROM buyers WHERE lower(trim(email)) = lower(trim(:email)) AND id != :id",
+}
+
+
+class ReplicationError(Exception):
+    pass
+
+
+# Outcome of sync_replica()
+class SyncResult:
+    def __init__(self, path):
+        self.path = path
+        self.seeded = False
+        self.batches = 0
+        self.entries = 0
+        self.written = 0
+        self.deleted = 0
+        self.position = 0
+        self.seconds = 0.0
+
+    def __str__(self):
+        seeded = "seeded, then " if self.seeded else ""
+        return (
+            f"{self.path}: {seeded}applied {self.entries} changes in {self.batches} batches "
+            f"({self.written} rows written, {self.deleted} deleted) in {self.seconds:.2f}s, now at change {self.position}"
+        )
+
+
+# UTC, in the format of SQLite's datetime('now') used by the change log triggers
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+# Sequence number of the last change logged, 0 before the first
+def last_seq(connection):
+    return connection.exec_driver_sql("SELECT seq FROM sqlite_sequence WHERE name = 'change_log'").scalar() or 0
+
+
+# The last sequence number removed by a truncating compaction, 0 if none
+def compacted_through(connection):
+    return connection.scalar(select(change_log_state.c.compacted_through)) or 0
+
+
+# Figures of the source's change log, for `cli/main.py changes status`
+def log_status(connection):
+    return {
+        'last_seq': last_seq(connection),
+        'entries': connection.scalar(select(func.count()).select_from(change_log)),
+        'oldest_seq': connection.scalar(select(func.min(change_log.c.seq))),
+        'compacted_through': compacted_through(connection),
+    }
+
+
+# Entries logged after `after` (and up to `through`), oldest first: a range of the primary key
+def changes_query(after, limit, through=None):
+    query = select(change_log).where(change_log.c.seq > after)
+    if through is not None:
+        query = query.where(change_log.c.seq <= through)
+    return query.order_by(change_log.c.seq).limit(limit)
+
+
+# Pages of change log entries after `after`, stopping after `limit` entries
+def iter_changes(connection, after=0, page_size=1000, limit=None):
+    remaining = limit
+    while remaining is None or remaining > 0:
+        size = page_size if remaining is None else min(page_size, remaining)
+        rows = connection.execute(changes_query(after, size)).all()
+        if not rows:
+            return
+        yield rows
+        after = rows[-1].seq
+        if remaining is not None:
+            remaining -= len(rows)
+
+
+# Number of entries after `position`, i.e. how far behind a replica at `position` is
+def pending_changes(connection, position):
+    return connection.scalar(select(func.count()).select_from(change_log).where(change_log.c.seq > position))
+
+
+# The replica's bookkeeping row as a dict, or None if the database is not a replica
+def replica_status(connection):
+    row = connection.execute(select(replica_state)).first()
+    return dict(row._mapping) if row else None
+
+
+# The bookkeeping row of the replica file at `path`, which must exist
+def read_replica_state(path):
+    from db import make_engine
+    from db.shards import SQLITE_PREFIX
+
+    if not os.path.exists(path):
+        raise ReplicationError(f"No replica at {path}; create it with `changes sync {path}`")
+    engine = make_engine(SQLITE_PREFIX + path, 'read-replica')
+    try:
+        with engine.connect() as connection:
+            state = replica_status(connection)
+    finally:
+        engine.dispose()
+    if state is None:
+        raise ReplicationError(f"{path} is not a replica")
+    return state
+
+
+# Refuse databases without the change log (created by the Alembic revision 9a3e5c7d1b42)
+def check_change_log(connection):
+    present = set(connection.exec_driver_sql("SELECT name FROM sqlite_master WHERE type = 'trigger'").scalars())
+    if not set(CHANGE_LOG_TRIGGER_NAMES) <= present:
+        raise ReplicationError("The database has no change log; run `alembic upgrade head` first")
+
+
+def _revision(connection):
+    if connection.exec_driver_sql("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'alembic_version'").first():
+        return connection.exec_driver_sql("SELECT version_num FROM alembic_version").scalar()
+    return None
+
+
+# Replace the replica at `path` with a copy of the SQLite database at `source_path`.
+# The backup API reads the source in one transaction, so the copy is consistent even
+# while the source is written, and its AUTOINCREMENT counter gives the sequence number
+# the copy is at. The new file only replaces the old one once complete. Returns the position.
+def seed_replica(source_path, path, source_name):
+    partial = path + '.seeding'
+    for leftover in (partial, partial + '-wal', partial + '-shm'):
+        if os.path.exists(leftover):
+            os.remove(leftover)
+    source = sqlite3.connect(source_path)
+    replica = sqlite3.connect(partial)
+    try:
+        source.backup(replica)
+        row = replica.execute("SELECT seq FROM sqlite_sequence WHERE name = 'change_log'").fetchone()
+        position = row[0] if row else 0
+        with replica:
+            for trigger in REPLICA_DROPPED_TRIGGERS:
+                replica.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+            replica.execute("DELETE FROM change_log")
+            replica.execute("DELETE FROM change_log_state")
+            replica.execute(
+                "INSERT OR REPLACE INTO replica_state (id, source, position, synced_at) VALUES (1, ?, ?, ?)",
+                (source_name, position, _now()),
+            )
+    finally:
+        replica.close()
+        source.close()
+    # A write-ahead log left behind by the old replica would be replayed into the new file
+    for leftover in (path + '-wal', path + '-shm'):
+        if os.path.exists(leftover):
+            os.remove(leftover)
+    os.replace(partial, path)
+    return position
+
+
+def _parse_key(name, row_key):
+    if name == INTERESTS:
+        buyer_id, property_id = row_key.split(':')
+        return int(buyer_id), int(property_id)
+    return int(row_key)
+
+
+def _key(name, row):
+    return (row['buyer_id'], row['property_id']) if name == INTERESTS else row['id']
+
+
+# The current rows of table `name` with the given keys, each lookup a primary key search
+def rows_query(name, keys):
+    table = REPLICATED_TABLES[name]
+    if name == INTERESTS:
+        # A row-value IN (VALUES ...) would scan the table
+        return select(table).where(or_(*(and_(table.c.buyer_id == b, table.c.property_id == p) for b, p in keys)))
+    return select(table).where(table.c.id.in_(keys))
+
+
+def _current_rows(connection, name, keys):
+    size = _PAIR_CHUNK_SIZE if name == INTERESTS else _CHUNK_SIZE
+    rows = {}
+    for start in range(0, len(keys), size):
+        for row in connection.execute(rows_query(name, keys[start:start + size])).mappings():
+            rows[_key(name, row)] = dict(row)
+    return rows
+
+
+# Agents of the listings with the given ids
+def listing_agents_query(property_ids):
+    return select(Property.agent_id).where(Property.id.in_(property_ids), Property.agent_id.is_not(None)).distinct()
+
+
+# The portfolio summary rows of the given agents
+def summary_rows_query(agent_ids):
+    return select(agent_portfolio_summary).where(agent_portfolio_summary.c.agent_id.in_(agent_ids))
+
+
+def _listing_agents(connection, property_ids):
+    agents = set()
+    for start in range(0, len(property_ids), _CHUNK_SIZE):
+        agents.update(connection.scalars(listing_agents_query(property_ids[start:start + _CHUNK_SIZE])))
+    return agents
+
+
+# The entries of one batch after `position` and the current rows they name, read in
+# one read transaction of the source, with the portfolio summary rows of the agents
+# of the listings named by the batch's listing and interest changes. The replica,
+# still at `position`, gives the agents those listings had before. Returns (entries,
+# {table: keys}, {table: {key: row}}, {agent_id: summary row, None when gone}); keys
+# are listed in the order of their first change.
+def _read_batch(source, target, position, through, batch_size):
+    # pysqlite only opens a transaction before writes: begin one explicitly so the
+    # entries and the rows are read from the same version of the database
+    source.exec_driver_sql('BEGIN')
+    try:
+        entries = source.execute(changes_query(position, batch_size, through)).all()
+        keys = {name: {} for name in REPLICATED_TABLES}
+        for entry in entries:
+            keys[entry.table_name].setdefault(_parse_key(entry.table_name, entry.row_key))
+        keys = {name: list(found) for name, found in keys.items()}
+        rows = {name: _current_rows(source, name, found) if found else {} for name, found in keys.items()}
+        listings = list(dict.fromkeys([*keys['properties'], *(property_id for _, property_id in keys[INTERESTS])]))
+        agents = sorted(_listing_agents(source, listings) | _listing_agents(target, listings))
+        summary = dict.fromkeys(agents)
+        for start in range(0, len(agents), _CHUNK_SIZE):
+            for row in source.execute(summary_rows_query(agents[start:start + _CHUNK_SIZE])).mappings():
+                summary[row['agent_id']] = dict(row)
+    finally:
+        source.rollback()
+    return entries, keys, rows, summary
+
+
+def _insert_statement(name):
+    statement = insert(REPLICATED_TABLES[name])
+    return statement.prefix_with('OR IGNORE', dialect='sqlite') if name == INTERESTS else statement
+
+
+def _delete_statement(name):
+    table = REPLICATED_TABLES[name]
+    if name == INTERESTS:
+        return delete(table).where(
+            table.c.buyer_id == bindparam('key_buyer_id'), table.c.property_id == bindparam('key_property_id'),
+        )
+    return delete(table).where(table.c.id == bindparam('key_id'))
+
+
+def _delete_params(name, key):
+    return {'key_buyer_id': key[0], 'key_property_id': key[1]} if name == INTERESTS else {'key_id': key}
+
+
+# Write the source rows `present` of table `name` to the replica. Rows it lacks are
+# inserted; rows that differ are updated in the changed columns only, as the source
+# was, so the replica's triggers only see the changes made. Returns the number of
+# rows written.
+def _write_rows(target, name, present):
+    if name == INTERESTS:
+        return target.execute(_insert_statement(name), present).rowcount
+    table = REPLICATED_TABLES[name]
+    if name in _DISPLACE:
+        target.execute(text(_DISPLACE[name]), present)
+    current = _current_rows(target, name, [row['id'] for row in present])
+    inserts = [row for row in present if row['id'] not in current]
+    updates = {}
+    for row in present:
+        old = current.get(row['id'])
+        if old is not None and old != row:
+            changed = tuple(column for column in row if row[column] != old[column])
+            updates.setdefault(changed, []).append(dict({column: row[column] for column in changed}, key_id=row['id']))
+    for params in updates.values():
+        # The SET clause is made of the keys of the parameters
+        target.execute(update(table).where(table.c.id == bindparam('key_id')), params)
+    if inserts:
+        target.execute(_insert_statement(name), inserts)
+    return len(inserts) + sum(len(params) for params in updates.values())
+
+
+# Write one batch to the replica and move its position to `position`, in one
+# transaction. Rows missing from the source are deleted (referencing tables first),
+# the others written (referenced tables first), then the summary rows of the batch's
+# agents replaced.
+def _apply_batch(target, keys, rows, summary, expected, position, result):
+    target.exec_driver_sql('BEGIN IMMEDIATE')
+    try:
+        if target.scalar(select(replica_state.c.position)) != expected:
+            raise ReplicationError("Another sync of this replica ran at the same time")
+        for name in reversed(REPLICATED_TABLES):
+            gone = [_delete_params(name, key) for key in keys[name] if key not in rows[name]]
+            if gone:
+                result.deleted += target.execute(_delete_statement(name), gone).rowcount
+        for name in REPLICATED_TABLES:
+            present = [rows[name][key] for key in keys[name] if key in rows[name]]
+            if present:
+                result.written += _write_rows(target, name, present)
+        if summary:
+            target.execute(
+                delete(agent_portfolio_summary).where(agent_portfolio_summary.c.agent_id == bindparam('key_agent_id')),
+                [{'key_agent_id': agent_id} for agent_id in summary],
+            )
+            present = [row for row in summary.values() if row is not None]
+            if present:
+                target.execute(insert(agent_portfolio_summary), present)
+        target.execute(replica_state.update().values(position=position, synced_at=_now()))
+    except BaseException:
+        target.rollback()
+        raise
+    target.commit()
+
+
+# The replica's position, once checked against the source
+def _check_replica(source, target, path):
+    state = replica_status(target)
+    if state is None:
+        raise ReplicationError(f"{path} is not a replica; seed it with `changes sync --reseed`")
+    source_revision, revision = _revision(source), _revision(target)
+    if source_revision != revision:
+        raise ReplicationError(
+            f"{path} is at schema revision {revision}, the source at {source_revision}; "
+            f"seed it again with `changes sync --reseed`"
+        )
+    position = state['position']
+    if position > last_seq(source):
+        raise ReplicationError(f"{path} is ahead of the source (change {position}); it was seeded from another database")
+    compacted = compacted_through(source)
+    if position < compacted:
+        raise ReplicationError(
+            f"The change log was compacted through change {compacted}, past {path}'s position ({position}); "
+            f"seed it again with `changes sync --reseed`"
+        )
+    return position
+
+
+# Bring the replica at `path` up to date with the source database behind `engine`,
+# seeding it first if the file does not exist yet (or `reseed`). Changes logged while
+# the sync runs are left for the next one. Returns a SyncResult.
+def sync_replica(engine, path, batch_size=DEFAULT_BATCH_SIZE, reseed=False, log=None):
+    from db import make_engine
+    from db.shards import SQLITE_PREFIX
+
+    log = log or (lambda message: None)
+    started = time.perf_counter()
+    result = SyncResult(path)
+    source_path = engine.url.database
+    if engine.url.get_backend_name() != 'sqlite' or source_path in (None, '', ':memory:'):
+        raise ReplicationError("Replicas can only be made of a SQLite database file")
+    if os.path.exists(path) and os.path.samefile(source_path, path):
+        raise ReplicationError(f"{path} is the source database itself")
+
+    with engine.connect() as connection:
+        check_change_log(connection)
+    if reseed or not os.path.exists(path):
+        position = seed_replica(source_path, path, engine.url.render_as_string(hide_password=True))
+        log(f"Seeded {path} with a copy of {source_path} at change {position}")
+        result.seeded = True
+
+    replica = make_engine(SQLITE_PREFIX + path, 'bulk-load')
+    try:
+        with engine.connect() as source, replica.connect() as target:
+            position = _check_replica(source, target, path)
+            through = last_seq(source)
+            while position < through:
+                entries, keys, rows, summary = _read_batch(source, target, position, through, batch_size)
+                # Past the last entry read, or past the end when compaction left a gap
+                new_position = entries[-1].seq if len(entries) == batch_size else through
+                _apply_batch(target, keys, rows, summary, position, new_position, result)
+                position = new_position
+                result.batches += 1
+                result.entries += len(entries)
+                log(f"Applied changes through {position} of {through}")
+    finally:
+        replica.dispose()
+    result.position = position
+    result.seconds = time.perf_counter() - started
+    return result
+
+
+# Remove the entries superseded by a later entry for the same row and, with `through`,
+# every entry up to that sequence number (clamped to the last one logged and to the
+# last one folded into the neighbour table). Replicas behind it can then only be
+# seeded again. Returns (superseded, truncated, the sequence number truncated through).
+def compact_log(connection, through=None):
+    connection.exec_driver_sql('BEGIN IMMEDIATE')
+    try:
+        latest = select(func.max(change_log.c.seq)).group_by(change_log.c.table_name, change_log.c.row_key)
+        superseded = connection.execute(delete(change_log).where(change_log.c.seq.not_in(latest))).rowcount
+        truncated = 0
+        if through is not None:
+            mark = connection.scalar(select(property_neighbors_state.c.interest_mark))
+            through = min(through, last_seq(connection), through if mark is None else mark)
+            if through > compacted_through(connection):
+                truncated = connection.execute(delete(change_log).where(change_log.c.seq <= through)).rowcount
+                connection.execute(
+                    insert(change_log_state).values(id=1, compacted_through=through)
+                    .on_conflict_do_update(index_elements=[change_log_state.c.id], set_={'compacted_through': through})
+                )
+    except BaseException:
+        connection.rollback()
+        raise
+    connection.commit()
+    return superseded, truncated, through
@@ -0,0 +1,88 @@
+# Property search: price ranges, agent filter, sorting and full-text search on the name.
+#
+# Every filter maps onto an index (ix_properties_price, ix_properties_agent_id, the
+# properties_fts full-text index) and results are always cut with LIMIT, so a search
+# returns its top-N rows without reading the rest of the table.
+import re
+
+from sqlalchemy import select, literal_column
+
+from models import Property, properties_fts
+
+# Default number of results returned by a search
+DEFAULT_LIMIT = 20
+
+# Sort orders offered to the user, each one served by an index so LIMIT can stop early;
+# "relevance" (bm25 rank) is only meaningful with a text query
+SORTS = {
+    'price': (Property.price, Property.id),
+    'price-desc': (Property.price.desc(), Property.id.desc()),
+    'newest': (Property.id.desc(),),
+    'relevance': (properties_fts.c.rank, Property.id),
+}
+
+
+# Turn free text typed by the user into a safe FTS5 query.
+# Each word becomes a quoted prefix term, so "sea vi" matches "Sea View Villa" and
+# characters with a meaning in the FTS5 query syntax cannot cause errors.
+def build_match_query(text):
+    words = re.findall(r"\w+", text or '')
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+# The sort order a search actually uses: relevance by default for text queries,
+# price otherwise (relevance needs a text query)
+def resolve_sort(text=None, sort=None):
+    match = build_match_query(text)
+    if sort is None:
+        sort = 'relevance' if match else 'price'
+    if sort not in SORTS:
+        raise ValueError(f"Unknown sort order: {sort}")
+    return 'price' if sort == 'relevance' and not match else sort
+
+
+# Build the search statement. All arguments are optional filters.
+def search_query(text=None, min_price=None, max_price=None, agent_id=None, sort=None, limit=DEFAULT_LIMIT):
+    match = build_match_query(text)
+    sort = resolve_sort(text, sort)
+
+    statement = select(Property.id, Property.name, Property.price, Property.agent_id)
+    if match:
+        statement = statement.join(properties_fts, properties_fts.c.rowid == Property.id).where(
+            literal_column('properties_fts').op('MATCH')(match)
+        )
+
+    if min_price is not None:
+        statement = statement.where(Property.price >= min_price)
+    if max_price is not None:
+        statement = statement.where(Property.price <= max_price)
+    if agent_id is not None:
+        statement = statement.where(Property.agent_id == agent_id)
+
+    return statement.order_by(*SORTS[sort]).limit(limit)
+
+
+# Run a search and return the matching rows as (id, name, price, agent_id) tuples
+def search_properties(connection, text=None, min_price=None, max_price=None, agent_id=None, sort=None, limit=DEFAULT_LIMIT):
+    statement = search_query(text, min_price, max_price, agent_id, sort, limit)
+    return connection.execute(statement).all()
+
+
+# Sort key of a search result row (id, name, price, agent_id[, rank]) in the order of
+# each sort, so results of several databases can be merged (services/fanout.py)
+MERGE_KEYS = {
+    'price': lambda row: (row[2], row[0]),
+    'price-desc': lambda row: (-row[2], -row[0]),
+    'newest': lambda row: (-row[0],),
+    'relevance': lambda row: (row[4], row[0]),
+}
+
+
+# search_properties() for merging with the results of other databases: with the
+# relevance sort, each row carries its bm25 rank as a fifth column
+def search_properties_ranked(connection, text=None, min_price=None, max_price=None, agent_id=None, sort=None,
+                             limit=DEFAULT_LIMIT):
+    statement = search_query(text, min_price, max_price, agent_id, sort, limit)
+    if resolve_sort(text, sort) == 'relevance':
+        statement = statement.add_columns(properties_fts.c.rank)
+    return connection.execute(statement).all()
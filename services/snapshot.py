@@ -0,0 +1,180 @@
+# Columnar snapshots of the listings for read-only analytics.
+#
+# Reports and recommendation jobs only ever read each property's id, price and agent,
+# and the (buyer, property) interest pairs. `write_snapshot()` copies those out of
+# SQLite into one memory-mappable file (format in services/columnar.py) so that such
+# jobs can run on `Snapshot(path)` without going through the ORM or holding a read
+# transaction open on the live database.
+#
+# Columns:
+#   property_id, price, agent_id    one row per property, in id order (agent_id 0 when missing)
+#   interest_indptr                 CSR row pointers indexed by buyer id: buyer b wants
+#   interest_property_id            interest_property_id[interest_indptr[b]:interest_indptr[b + 1]]
+# Each column is int32 when all of its values fit, int64 otherwise.
+#
+# Everything is read in one SQLite read transaction, together with the `properties` and
+# `buyer_property_association` change counters (models/price_statistics.py). The
+# snapshot is stale once either counter has moved past the value in its header.
+import datetime
+import time
+
+from sqlalchemy import select, func
+
+from models import Property, buyer_property_association, table_versions
+from models.price_statistics import TABLE_VERSION_TRIGGERS, INTEREST_VERSION_TRIGGERS
+from services.replication import last_seq
+
+DEFAULT_PATH = 'listings.snapshot'
+
+# Rows fetched from the cursor per chunk
+DEFAULT_CHUNK_SIZE = 100000
+
+# Tables whose change counters decide whether a snapshot is stale
+SNAPSHOT_TABLES = ('properties', 'buyer_property_association')
+
+# Names of the triggers maintaining those counters
+_TRIGGERS = [*TABLE_VERSION_TRIGGERS, *INTEREST_VERSION_TRIGGERS]
+
+# The property columns, in id order (a walk of the primary key)
+def listing_columns_query():
+    return select(Property.id, Property.price, func.coalesce(Property.agent_id, 0)).order_by(Property.id)
+
+
+# The interest pairs in (buyer_id, property_id) order, read from the primary key index alone
+def interest_pairs_query():
+    association = buyer_property_association
+    return select(association.c.buyer_id, association.c.property_id).order_by(association.c.buyer_id, association.c.property_id)
+
+
+# {table name: change counter} for SNAPSHOT_TABLES
+def data_versions(connection):
+    versions = dict.fromkeys(SNAPSHOT_TABLES, 0)
+    versions.update(connection.execute(
+        select(table_versions.c.table_name, table_versions.c.version).where(table_versions.c.table_name.in_(SNAPSHOT_TABLES))
+    ).all())
+    return versions
+
+
+# Staleness is only detectable if the triggers maintaining the counters exist
+def _check_counters(connection):
+    present = set(connection.exec_driver_sql("SELECT name FROM sqlite_master WHERE type = 'trigger'").scalars())
+    missing = [name for name in _TRIGGERS if name not in present]
+    if missing:
+        from services.columnar import SnapshotError
+
+        raise SnapshotError(f"The database has no change counters ({', '.join(missing)}); run `alembic upgrade head` first")
+
+
+def _scalar(connection, statement):
+    return connection.scalar(statement) or 0
+
+
+# Write a snapshot of the database behind `engine` to `path`, replacing any previous
+# one only once the new file is complete. Returns the Snapshot.
+def write_snapshot(engine, path=DEFAULT_PATH, chunk_size=DEFAULT_CHUNK_SIZE, log=None):
+    from services.columnar import Snapshot, SnapshotWriter, integer_dtype
+
+    log = log or (lambda message: None)
+    started = time.perf_counter()
+    association = buyer_property_association
+    with engine.connect() as connection:
+        _check_counters(connection)
+        # pysqlite only opens a transaction before writes: begin one explicitly so every
+        # statement below reads the same version of the database
+        connection.exec_driver_sql('BEGIN')
+        try:
+            versions = data_versions(connection)
+            # Sizes and value ranges, each a single index lookup
+            properties = _scalar(connection, select(func.count()).select_from(Property))
+            interests = _scalar(connection, select(func.count()).select_from(association))
+            buyers = _scalar(connection, select(func.max(association.c.buyer_id))) + 1 if interests else 0
+            property_dtype = integer_dtype(0, _scalar(connection, select(func.max(Property.id))))
+            price_dtype = integer_dtype(
+                _scalar(connection, select(func.min(Property.price))), _scalar(connection, select(func.max(Property.price))),
+            )
+            agent_dtype = integer_dtype(0, _scalar(connection, select(func.max(Property.agent_id))))
+            interest_columns = _scalar(connection, select(func.max(association.c.property_id))) + 1 if interests else 0
+            # Pointers and indices share a dtype, so SciPy can use both without converting
+            csr_dtype = integer_dtype(0, max(interests, interest_columns))
+            metadata = {
+                'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+                'source': engine.url.render_as_string(hide_password=True),
+                'data_versions': versions,
+                'properties': properties,
+                'interests': interests,
+                'interest_columns': interest_columns,
+                'interest_mark': last_seq(connection),
+            }
+            writer = SnapshotWriter(path, [
+                ('property_id', property_dtype, properties),
+                ('price', price_dtype, properties),
+                ('agent_id', agent_dtype, properties),
+                ('interest_indptr', csr_dtype, buyers + 1 if interests else 0),
+                ('interest_property_id', csr_dtype, interests),
+            ], metadata)
+            try:
+                _write_listings(connection, writer, properties, chunk_size)
+                _write_interests(connection, writer, buyers, interests, chunk_size)
+            except BaseException:
+                writer.abort()
+                raise
+        finally:
+            connection.rollback()
+    writer.commit()
+    log(f"Wrote {properties} properties and {interests} interests to {path} in {time.perf_counter() - started:.1f}s")
+    return Snapshot(path)
+
+
+def _write_listings(connection, writer, count, chunk_size):
+    from services.distributions import iter_chunks
+
+    ids, prices, agents = writer.column('property_id'), writer.column('price'), writer.column('agent_id')
+    position = 0
+    for chunk in iter_chunks(connection, listing_columns_query(), chunk_size):
+        end = position + len(chunk)
+        ids[position:end], prices[position:end], agents[position:end] = chunk[:, 0], chunk[:, 1], chunk[:, 2]
+        position = end
+    _check_count('properties', position, count)
+
+
+# The pairs arrive in buyer order: property ids are copied as they come and the
+# per-buyer counts summed into the row pointers at the end
+def _write_interests(connection, writer, buyers, count, chunk_size):
+    import numpy as np
+
+    from services.distributions import iter_chunks
+
+    if not count:
+        return
+    properties = writer.column('interest_property_id')
+    per_buyer = np.zeros(buyers, dtype=np.int64)
+    position = 0
+    for chunk in iter_chunks(connection, interest_pairs_query(), chunk_size):
+        end = position + len(chunk)
+        properties[position:end] = chunk[:, 1]
+        per_buyer += np.bincount(chunk[:, 0], minlength=buyers)
+        position = end
+    _check_count('interests', position, count)
+    indptr = writer.column('interest_indptr')
+    indptr[0] = 0
+    np.cumsum(per_buyer, out=indptr[1:])
+
+
+def _check_count(name, read, expected):
+    if read != expected:
+        from services.columnar import SnapshotError
+
+        raise SnapshotError(f"Read {read} {name} instead of {expected}; the database changed during the snapshot")
+
+
+# Compare a snapshot with the database: {'stale', 'changed' (tables whose counter
+# moved), 'snapshot' and 'database' (their change counters)}
+def snapshot_status(connection, snapshot):
+    current = data_versions(connection)
+    recorded = snapshot.data_versions
+    changed = [table for table in SNAPSHOT_TABLES if current[table] != recorded.get(table)]
+    return {'stale': bool(changed), 'changed': changed, 'snapshot': recorded, 'database': current}
+
+
+def is_stale(connection, snapshot):
+    return snapshot_status(connection, snapshot)['stale']
@@ -0,0 +1,9 @@
+import re
+
+# Shared input checks used by the interactive prompts and the bulk importer.
+
+
+# Basic shape check for an email address (something@domain.tld)
+def is_valid_email(email):
+    regex = r'^\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b'
+    return re.match(regex, email)